@@ -0,0 +1,214 @@
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+def normalize_code(code: str) -> str:
+    """Normalize line endings, trailing whitespace and surrounding blank lines"""
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+def code_cache_key(code: str, fingerprint: str) -> str:
+    """Content-addressed key: hash of the normalized code plus the model-bundle fingerprint"""
+    digest = hashlib.sha256()
+    digest.update(fingerprint.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(normalize_code(code).encode('utf-8'))
+    return digest.hexdigest()
+
+def git_blob_sha(content: Union[str, bytes]) -> str:
+    """The SHA-1 git, and the GitHub API, give a file with these contents"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha1(b'blob %d\0' % len(content) + content).hexdigest()
+
+def file_cache_key(blob_sha: str, fingerprint: str) -> str:
+    """Key for a whole-file analysis: the file's blob SHA under a model-bundle fingerprint"""
+    return f"file:{fingerprint}:{blob_sha}"
+
+def fingerprint_files(paths: Iterable[str]) -> str:
+    """Hash the bytes of the given model files so retrained models never share cache entries"""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(Path(path).name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(Path(path).read_bytes())
+    return digest.hexdigest()[:16]
+
+class AnalysisCache:
+    """Two-tier result cache: a bounded in-memory LRU in front of an optional sqlite file
+
+    The sqlite tier is shared by every process that points at the same db_path,
+    so several API workers reuse each other's results. Every PRUNE_INTERVAL
+    writes it drops the oldest rows beyond max_rows.
+    """
+
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, max_entries: int = 1024, db_path: Optional[str] = None, max_rows: int = 100_000):
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            with closing(self._connect()) as conn, conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS results ("
+                    "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+
+        if self.db_path:
+            with closing(self._connect()) as conn:
+                row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row:
+                value = json.loads(row[0])
+                with self._lock:
+                    self.disk_hits += 1
+                self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Dict):
+        """Store a JSON-serializable value in both tiers"""
+        self._remember(key, value)
+
+        if self.db_path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, created) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), time.time())
+                )
+                with self._lock:
+                    self._writes += 1
+                    prune = self._writes % self.PRUNE_INTERVAL == 0
+                if prune:
+                    self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection):
+        """Delete all but the max_rows most recently written rows"""
+        conn.execute(
+            "DELETE FROM results WHERE key IN "
+            "(SELECT key FROM results ORDER BY created DESC, rowid DESC LIMIT -1 OFFSET ?)",
+            (self.max_rows,)
+        )
+
+    def _remember(self, key: str, value: Dict):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_enabled": bool(self.db_path),
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0
+            }
+
+class LineMemo:
+    """LRU memo of per-line predictions shared across documents
+
+    Entries are keyed by (model name, model version, normalized line text) and
+    hold the line's label, confidence and detected-pattern bitmask. Eviction
+    keeps the estimated memory use under max_bytes.
+    """
+
+    # Rough per-entry overhead of the key tuple, value tuple and OrderedDict slot
+    ENTRY_OVERHEAD = 250
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize_line(line: str, lowercase: bool = True) -> str:
+        """Normalize a line the same way the vectorizer and pattern checks see it
+
+        Only case is folded, and only for lowercasing vectorizers, so two lines
+        that share a key always get the same prediction.
+        """
+        return line.lower() if lowercase else line
+
+    def get(self, model_name: str, version: str, text: str) -> Optional[Tuple[str, float, int]]:
+        key = (model_name, version, text)
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, model_name: str, version: str, text: str, value: Tuple[str, float, int]):
+        key = (model_name, version, text)
+        size = self._entry_size(text)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = value
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes and self._entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self.current_bytes -= self._entry_size(old_key[2])
+
+    def _entry_size(self, text: str) -> int:
+        return self.ENTRY_OVERHEAD + sys.getsizeof(text)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
@@ -3,7 +3,9 @@ import joblib
 import numpy as np
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from app import AIDetectionReasoningEngine, CodeAnalyzer, ModelResult, LineAnalysis 
+from app import AIDetectionReasoningEngine, CodeAnalyzer, ModelResult, LineAnalysis, LANGUAGE_MODEL_DIRS, detect_language
+from parsed_document import ParsedDocument
+from analysis_cache import AnalysisCache, LineMemo
 
 app = Flask(__name__)
 CORS(app)
@@ -11,19 +13,107 @@ CORS(app)
 # Initialize analyzer
 analyzer = None
 
+# Result cache shared by all requests. Point ANALYSIS_CACHE_DB at one sqlite file
+# to share results between API worker processes.
+result_cache = AnalysisCache(
+    max_entries=int(os.environ.get('ANALYSIS_CACHE_SIZE', 1024)),
+    db_path=os.environ.get('ANALYSIS_CACHE_DB') or None,
+    max_rows=int(os.environ.get('ANALYSIS_CACHE_ROWS', 100_000))
+)
+
+# Per-line prediction memo shared across documents, capped in megabytes
+line_memo = LineMemo(max_bytes=int(os.environ.get('LINE_MEMO_MB', 32)) * 1024 * 1024)
+
+# Analysis depths, cheapest first. Each depth includes the work of the ones before it.
+ANALYSIS_DEPTHS = ('verdict', 'characteristics', 'lines')
+DEFAULT_DEPTH = 'characteristics'
+
+# Upper bound on documents per /analyze/batch request
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 256))
+
 def get_analyzer():
     global analyzer
     if analyzer is None:
         try:
-            analyzer = CodeAnalyzer()
+            analyzer = CodeAnalyzer(cache=result_cache, line_memo=line_memo)
             print("✅ Models loaded successfully")
+            if os.environ.get('LINE_MEMO_WARM'):
+                entries = analyzer.warm_line_memo()
+                print(f"🔥 Line memo warmed with {entries} lines")
         except Exception as e:
             print(f"❌ Error loading models: {str(e)}")
     return analyzer
 
+def format_line_columns(line_analyses):
+    """Pack line analyses into parallel arrays (one key per field) instead of one object per line"""
+    return line_analyses.to_columns()
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "models_loaded": analyzer is not None})
+    return jsonify({
+        "status": "healthy",
+        "models_loaded": analyzer is not None,
+        "bundles_loaded": list(analyzer.bundles.keys()) if analyzer else [],
+        "cache": result_cache.stats(),
+        "line_memo": line_memo.stats()
+    })
+
+def build_response(analyzer_instance, code, results, final_pred, final_conf, depth,
+                   line_model='gradient_boost', language=None):
+    """Format one analysis result at the requested depth"""
+    response = {
+        "prediction": final_pred,
+        "confidence": float(final_conf),
+        "is_ai": final_pred == "ai",
+        "depth": depth,
+        "language": language,
+        "summary": {
+            "ai_probability": float(final_conf) if final_pred == "ai" else 1 - float(final_conf),
+            "human_probability": float(final_conf) if final_pred == "human" else 1 - float(final_conf)
+        },
+        "detailed_results": [
+            {
+                "model": r.name,
+                "prediction": r.prediction,
+                "confidence": float(r.confidence)
+            } for r in results
+        ]
+    }
+
+    if depth == 'verdict':
+        return response
+
+    # Both remaining stages work from one parse of the submission
+    doc = ParsedDocument.parse(code)
+
+    if depth in ('characteristics', 'lines'):
+        # Characteristics are derived from the code text alone, so no line inference is needed here
+        characteristics = AIDetectionReasoningEngine.analyze_code_characteristics(doc, [])
+        response["analysis"] = {
+            "ai_characteristics": characteristics.get('ai_characteristics', []),
+            "human_characteristics": characteristics.get('human_characteristics', []),
+            "metrics": characteristics.get('metrics', {})
+        }
+
+    if depth == 'lines':
+        line_analyses = analyzer_instance.analyze_lines(doc, line_model, final_pred, language=language)
+        response["lines"] = format_line_columns(line_analyses)
+
+    return response
+
+def get_depth(data):
+    """Read the requested analysis depth from the JSON body or query string"""
+    return data.get('depth', request.args.get('depth', DEFAULT_DEPTH))
+
+def invalid_depth_response(depth):
+    return jsonify({"error": f"Invalid depth '{depth}'. Use one of: {', '.join(ANALYSIS_DEPTHS)}"}), 400
+
+def get_language(data):
+    """Read an explicit language from the request; None means detect it per document"""
+    return data.get('language') or None
+
+def invalid_language_response(language):
+    return jsonify({"error": f"Unsupported language '{language}'. Use one of: {', '.join(LANGUAGE_MODEL_DIRS)}"}), 400
 
 @app.route('/analyze', methods=['POST'])
 def analyze_code():
@@ -38,37 +128,21 @@ def analyze_code():
         if not analyzer_instance:
              return jsonify({"error": "Models not initialized"}), 500
 
+        depth = get_depth(data)
+        if depth not in ANALYSIS_DEPTHS:
+            return invalid_depth_response(depth)
+
+        language = get_language(data)
+        if language and language not in LANGUAGE_MODEL_DIRS:
+            return invalid_language_response(language)
+        # Extension of an optional filename wins over the content sniffer
+        language = language or detect_language(code, data.get('filename'))
+
         # Run analysis
-        results, final_pred, final_conf = analyzer_instance.analyze_code(code)
+        results, final_pred, final_conf = analyzer_instance.analyze_code(code, language)
         
-        # Get line-by-line analysis (using gradient_boost as default)
-        line_analyses = analyzer_instance.analyze_lines(code, 'gradient_boost', final_pred)
-        
-        # Get characteristics
-        characteristics = AIDetectionReasoningEngine.analyze_code_characteristics(code, line_analyses)
-        
-        # Format response
-        response = {
-            "prediction": final_pred,
-            "confidence": float(final_conf),
-            "is_ai": final_pred == "ai",
-            "summary": {
-                "ai_probability": float(final_conf) if final_pred == "ai" else 1 - float(final_conf),
-                "human_probability": float(final_conf) if final_pred == "human" else 1 - float(final_conf)
-            },
-            "detailed_results": [
-                {
-                    "model": r.name,
-                    "prediction": r.prediction,
-                    "confidence": float(r.confidence)
-                } for r in results
-            ],
-            "analysis": {
-                "ai_characteristics": characteristics.get('ai_characteristics', []),
-                "human_characteristics": characteristics.get('human_characteristics', []),
-                "metrics": characteristics.get('metrics', {})
-            }
-        }
+        response = build_response(analyzer_instance, code, results, final_pred, final_conf,
+                                  depth, data.get('line_model', 'gradient_boost'), language)
         
         return jsonify(response)
 
@@ -76,6 +150,52 @@ def analyze_code():
         print(f"Error processing request: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    try:
+        data = request.json
+        codes = data.get('codes', [])
+
+        if not isinstance(codes, list) or not codes:
+            return jsonify({"error": "No codes provided"}), 400
+        if len(codes) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Too many documents ({len(codes)}). Maximum batch size is {MAX_BATCH_SIZE}"}), 400
+        for idx, code in enumerate(codes):
+            if not isinstance(code, str) or not code:
+                return jsonify({"error": f"No code provided at index {idx}"}), 400
+
+        analyzer_instance = get_analyzer()
+        if not analyzer_instance:
+             return jsonify({"error": "Models not initialized"}), 500
+
+        depth = get_depth(data)
+        if depth not in ANALYSIS_DEPTHS:
+            return invalid_depth_response(depth)
+
+        language = get_language(data)
+        if language and language not in LANGUAGE_MODEL_DIRS:
+            return invalid_language_response(language)
+        filenames = data.get('filenames') or [None] * len(codes)
+        if len(filenames) != len(codes):
+            return jsonify({"error": "filenames must have one entry per code"}), 400
+        languages = [language or detect_language(code, filename) for code, filename in zip(codes, filenames)]
+
+        # One vectorizer pass and one call per model for each language in the batch
+        batch_results = analyzer_instance.analyze_many(codes, language, filenames)
+        line_model = data.get('line_model', 'gradient_boost')
+
+        return jsonify({
+            "count": len(codes),
+            "results": [
+                build_response(analyzer_instance, code, results, final_pred, final_conf, depth, line_model, code_language)
+                for code, code_language, (results, final_pred, final_conf) in zip(codes, languages, batch_results)
+            ]
+        })
+
+    except Exception as e:
+        print(f"Error processing batch request: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     # Initialize models on startup
     get_analyzer()
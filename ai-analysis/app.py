@@ -1,12 +1,29 @@
+import os
 import streamlit as st
 import joblib
 import numpy as np
 import re
 import requests
 import base64
-from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+import subprocess
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import quote
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from dataclasses import asdict, dataclass
 from pathlib import Path
+from analysis_cache import (AnalysisCache, LineMemo, code_cache_key, file_cache_key,
+                            fingerprint_files, git_blob_sha)
+from pattern_scanner import PatternScanner
+from file_filter import content_skip_reason, partition_files
+from github_client import GitHubClient
+from local_repo import LocalRepoAnalyzer
+from parsed_document import ParsedDocument
+from sampling_planner import SamplingPlanner, ShareEstimate
+from scan_engine import ScanEngine
 
 @dataclass
 class ModelResult:
@@ -24,6 +41,117 @@ class LineAnalysis:
     confidence: float
     patterns: List[str]
 
+class LineAnalysisTable:
+    """Line-by-line analysis results stored as parallel NumPy columns
+    
+    Holds one row per analyzed line: line number, confidence, an is-AI flag and
+    a bitmask of detected patterns. Line text stays in the ParsedDocument, and
+    LineAnalysis objects are only built for the rows a caller asks for.
+    """
+    
+    def __init__(self, doc: ParsedDocument, line_numbers: np.ndarray, is_ai: np.ndarray,
+                 confidences: np.ndarray, pattern_masks: np.ndarray, pattern_labels: List[str]):
+        self.doc = doc
+        self.line_numbers = np.asarray(line_numbers, dtype=np.int32)
+        self.is_ai = np.asarray(is_ai, dtype=bool)
+        self.confidences = np.asarray(confidences, dtype=np.float64)
+        self.pattern_masks = np.asarray(pattern_masks, dtype=np.int64)
+        self.pattern_labels = pattern_labels
+    
+    @classmethod
+    def empty(cls, doc: ParsedDocument, pattern_labels: List[str]) -> 'LineAnalysisTable':
+        return cls(doc, np.empty(0), np.empty(0), np.empty(0), np.empty(0), pattern_labels)
+    
+    @classmethod
+    def from_analyses(cls, doc: ParsedDocument, line_analyses: List[LineAnalysis],
+                      pattern_labels: List[str]) -> 'LineAnalysisTable':
+        """Build a table from LineAnalysis objects"""
+        bits = {label: 1 << column for column, label in enumerate(pattern_labels)}
+        return cls(
+            doc,
+            [a.line_number for a in line_analyses],
+            [a.prediction == "ai" for a in line_analyses],
+            [a.confidence for a in line_analyses],
+            [sum(bits[p] for p in a.patterns) for a in line_analyses],
+            pattern_labels
+        )
+    
+    def __len__(self) -> int:
+        return len(self.line_numbers)
+    
+    def __iter__(self):
+        return (self.row(i) for i in range(len(self)))
+    
+    @property
+    def predictions(self) -> np.ndarray:
+        return np.where(self.is_ai, "ai", "human")
+    
+    @property
+    def ai_count(self) -> int:
+        return int(np.count_nonzero(self.is_ai))
+    
+    @property
+    def human_count(self) -> int:
+        return len(self) - self.ai_count
+    
+    def count_confident(self, prediction: str, threshold: float) -> int:
+        """Number of lines predicted as prediction with confidence above threshold"""
+        matches_prediction = self.is_ai if prediction == "ai" else ~self.is_ai
+        return int(np.count_nonzero(matches_prediction & (self.confidences > threshold)))
+    
+    def patterns(self, i: int) -> List[str]:
+        return PatternScanner.mask_labels(int(self.pattern_masks[i]), self.pattern_labels)
+    
+    def row(self, i: int) -> LineAnalysis:
+        """Materialize row i as a LineAnalysis"""
+        line_number = int(self.line_numbers[i])
+        return LineAnalysis(
+            line_number=line_number,
+            content=self.doc.lines[line_number - 1],
+            prediction="ai" if self.is_ai[i] else "human",
+            confidence=float(self.confidences[i]),
+            patterns=self.patterns(i)
+        )
+    
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> List[LineAnalysis]:
+        """Materialize a slice of rows, e.g. the page the UI is showing"""
+        return [self.row(i) for i in range(*slice(start, stop).indices(len(self)))]
+    
+    def flip_least_confident(self, target_prediction: str, count: int, confidence: float):
+        """Flip the count lowest-confidence lines of the opposite prediction to target_prediction
+        
+        Uses a partial sort (argpartition) instead of a full sort. Ties at the
+        cutoff go to the earliest lines, as a stable sort would.
+        """
+        target_is_ai = target_prediction == "ai"
+        candidates = np.flatnonzero(self.is_ai != target_is_ai)
+        count = min(count, len(candidates))
+        if count <= 0:
+            return
+        
+        candidate_conf = self.confidences[candidates]
+        if count < len(candidates):
+            cutoff = np.partition(candidate_conf, count - 1)[count - 1]
+            below = candidates[candidate_conf < cutoff]
+            at_cutoff = candidates[candidate_conf == cutoff][:count - len(below)]
+            chosen = np.concatenate([below, at_cutoff])
+        else:
+            chosen = candidates
+        
+        self.is_ai[chosen] = target_is_ai
+        self.confidences[chosen] = confidence
+    
+    def to_columns(self) -> Dict[str, list]:
+        """Parallel per-field lists, e.g. for a compact JSON response"""
+        masks = self.pattern_masks.tolist()
+        labels_by_mask = {mask: PatternScanner.mask_labels(mask, self.pattern_labels) for mask in set(masks)}
+        return {
+            "line_number": self.line_numbers.tolist(),
+            "prediction": self.predictions.tolist(),
+            "confidence": np.round(self.confidences, 4).tolist(),
+            "patterns": [labels_by_mask[mask] for mask in masks]
+        }
+
 @dataclass
 class FileAnalysisResult:
     """Data class for storing file analysis results"""
@@ -63,33 +191,25 @@ class AIDetectionReasoningEngine:
         'experimental_code': r'#.*test|#.*experiment',
     }
     
+    AI_SCANNER = PatternScanner(AI_INDICATORS)
+    HUMAN_SCANNER = PatternScanner(HUMAN_INDICATORS)
+    
     @staticmethod
-    def analyze_code_characteristics(code: str, line_analyses: List[LineAnalysis]) -> Dict:
+    def analyze_code_characteristics(code: Union[str, ParsedDocument], line_analyses: LineAnalysisTable) -> Dict:
         """Analyze code for AI/Human characteristics"""
-        lines = code.split('\n')
+        doc = ParsedDocument.of(code)
         
         ai_characteristics = []
         human_characteristics = []
         
-        # Count pattern occurrences
-        ai_pattern_counts = {name: 0 for name in AIDetectionReasoningEngine.AI_INDICATORS.keys()}
-        human_pattern_counts = {name: 0 for name in AIDetectionReasoningEngine.HUMAN_INDICATORS.keys()}
-        
-        for line in lines:
-            # Check AI patterns
-            for pattern_name, pattern in AIDetectionReasoningEngine.AI_INDICATORS.items():
-                if re.search(pattern, line):
-                    ai_pattern_counts[pattern_name] += 1
-            
-            # Check Human patterns
-            for pattern_name, pattern in AIDetectionReasoningEngine.HUMAN_INDICATORS.items():
-                if re.search(pattern, line):
-                    human_pattern_counts[pattern_name] += 1
+        # Count pattern occurrences (lines matching each pattern) in one scan of the text
+        ai_pattern_counts = AIDetectionReasoningEngine.AI_SCANNER.count_lines(doc.text, doc.newline_offsets)
+        human_pattern_counts = AIDetectionReasoningEngine.HUMAN_SCANNER.count_lines(doc.text, doc.newline_offsets)
         
         # Structural analysis
-        avg_line_length = np.mean([len(line) for line in lines if line.strip()])
-        empty_line_ratio = sum(1 for line in lines if not line.strip()) / max(len(lines), 1)
-        comment_ratio = sum(1 for line in lines if line.strip().startswith('#')) / max(len(lines), 1)
+        avg_line_length = doc.avg_line_length
+        empty_line_ratio = doc.empty_line_ratio
+        comment_ratio = doc.comment_ratio
         
         # AI indicators
         if ai_pattern_counts['verbose_comments'] > 2:
@@ -135,7 +255,7 @@ class AIDetectionReasoningEngine:
     def generate_detailed_reasoning(final_pred: str, confidence: float, 
                                    results: List[ModelResult],
                                    characteristics: Dict,
-                                   line_analyses: List[LineAnalysis]) -> str:
+                                   line_analyses: LineAnalysisTable) -> str:
         """Generate detailed reasoning for the detection"""
         reasoning_parts = []
         
@@ -184,20 +304,20 @@ class AIDetectionReasoningEngine:
         
         # Line-by-line analysis
         if line_analyses:
-            ai_lines = sum(1 for a in line_analyses if a.prediction == "ai")
+            ai_lines = line_analyses.ai_count
             total_lines = len(line_analyses)
             reasoning_parts.append(f"\n**3. Line-by-Line Analysis:**")
             reasoning_parts.append(f"   - {ai_lines}/{total_lines} lines ({ai_lines/total_lines*100:.1f}%) flagged as AI-generated")
             reasoning_parts.append(f"   - {total_lines - ai_lines}/{total_lines} lines ({(total_lines-ai_lines)/total_lines*100:.1f}%) flagged as human-written")
             
             # High confidence lines
-            high_conf_ai = [a for a in line_analyses if a.prediction == "ai" and a.confidence > 0.8]
-            high_conf_human = [a for a in line_analyses if a.prediction == "human" and a.confidence > 0.8]
+            high_conf_ai = line_analyses.count_confident("ai", 0.8)
+            high_conf_human = line_analyses.count_confident("human", 0.8)
             
             if high_conf_ai:
-                reasoning_parts.append(f"   - {len(high_conf_ai)} lines with high AI confidence (>80%)")
+                reasoning_parts.append(f"   - {high_conf_ai} lines with high AI confidence (>80%)")
             if high_conf_human:
-                reasoning_parts.append(f"   - {len(high_conf_human)} lines with high human confidence (>80%)")
+                reasoning_parts.append(f"   - {high_conf_human} lines with high human confidence (>80%)")
         
         # Code metrics
         metrics = characteristics['metrics']
@@ -225,55 +345,207 @@ class AIDetectionReasoningEngine:
         
         return "\n".join(reasoning_parts)
 
+# Model bundle directories per language, in lookup order. train.py writes
+# JavaScript models to model/js, which wins over the older model/javascript.
+LANGUAGE_MODEL_DIRS = {
+    'python': ['model/python'],
+    'java': ['model/java'],
+    'javascript': ['model/js', 'model/javascript'],
+}
+
+def find_bundle_dir(language: str) -> Optional[Path]:
+    """First of the language's model directories that holds a trained bundle"""
+    return next((Path(d) for d in LANGUAGE_MODEL_DIRS[language]
+                 if (Path(d) / 'vectorizer.pkl').exists()), None)
+
+LANGUAGE_EXTENSIONS = {
+    '.py': 'python',
+    '.pyw': 'python',
+    '.java': 'java',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.mjs': 'javascript',
+    '.cjs': 'javascript',
+}
+
+DEFAULT_LANGUAGE = 'python'
+
+# Cheap content markers used when there is no file extension to go on
+LANGUAGE_MARKERS = {
+    'python': re.compile(r'^\s*(def \w+\(.*\):|class \w+.*:|elif |from \w[\w.]* import |import \w[\w.]*\s*$)|self\.|__name__', re.MULTILINE),
+    'java': re.compile(r'\b(public|private|protected)\s+(static\s+)?(class|void|int|String)\b|System\.out\.|import java\.|@Override', re.MULTILINE),
+    'javascript': re.compile(r'\b(const|let|var)\s+\w+\s*=|\bfunction\s*\w*\s*\(|=>|console\.log|require\(|module\.exports|export\s+(default|const|function)', re.MULTILINE),
+}
+
+def detect_language(code: str, file_path: Optional[str] = None) -> str:
+    """Detect the language of a submission from its file extension, falling back to a content sniff"""
+    if file_path:
+        language = LANGUAGE_EXTENSIONS.get(Path(file_path).suffix.lower())
+        if language:
+            return language
+    
+    # Only the head of the file is needed to tell the languages apart
+    sample = code[:4000]
+    scores = {language: len(pattern.findall(sample)) for language, pattern in LANGUAGE_MARKERS.items()}
+    best = max(scores, key=scores.get)
+    return best if scores[best] > 0 else DEFAULT_LANGUAGE
+
+@dataclass
+class ModelBundle:
+    """Vectorizer, models and label encoder trained for one language"""
+    language: str
+    vectorizer: object
+    models: Dict[str, object]
+    label_encoder: object
+    fingerprint: str
+    size_bytes: int
+
 class CodeAnalyzer:
-    """Main class for analyzing code with multiple ML models"""
+    """Main class for analyzing code with multiple ML models
     
-    def __init__(self):
-        self.models = {}
-        self.vectorizer = None
-        self.label_encoder = None
+    Each language is routed to its own bundle under model/<language>/. Bundles
+    are loaded on first use and evicted least-recently-used once their combined
+    on-disk size exceeds max_bundle_bytes.
+    """
+    
+    # Model file names inside a per-language bundle directory
+    BUNDLE_FILES = {
+        'logistic': 'logistic.pkl',
+        'random_forest': 'random_forest.pkl',
+        'gradient_boost': 'gradient_boost.pkl',
+        'xgboost': 'xgboost.pkl'
+    }
+    
+    # Legacy single bundle at the root of model/, used when a language has no bundle
+    LEGACY_FILES = {
+        'logistic': 'model/logistic.pkl',
+        'random_forest': 'model/randomforest.pkl',
+        'gradient_boost': 'model/gradientboost.pkl',
+        'xgboost': 'model/xgboost.pkl'
+    }
+    
+    def __init__(self, cache: Optional[AnalysisCache] = None, line_memo: Optional[LineMemo] = None,
+                 default_language: str = DEFAULT_LANGUAGE, max_bundle_bytes: int = 256 * 1024 * 1024):
+        self.default_language = default_language
+        self.max_bundle_bytes = max_bundle_bytes
+        self.bundles = OrderedDict()
+        self._bundle_lock = threading.RLock()
+        self.cache = cache
+        self.line_memo = line_memo if line_memo is not None else LineMemo()
         self.load_models()
     
+    # The default bundle backs the attributes older callers use directly
+    @property
+    def models(self) -> Dict[str, object]:
+        bundle = self.get_bundle()
+        return bundle.models if bundle else {}
+    
+    @property
+    def vectorizer(self):
+        bundle = self.get_bundle()
+        return bundle.vectorizer if bundle else None
+    
+    @property
+    def label_encoder(self):
+        bundle = self.get_bundle()
+        return bundle.label_encoder if bundle else None
+    
+    @property
+    def model_fingerprint(self) -> str:
+        bundle = self.get_bundle()
+        return bundle.fingerprint if bundle else ""
+    
     def load_models(self):
-        """Load all required models and encoders"""
+        """Load the default language's bundle so missing models are reported at startup"""
+        self.get_bundle(self.default_language)
+    
+    def get_bundle(self, language: Optional[str] = None) -> Optional[ModelBundle]:
+        """Return the bundle for a language, loading it on first use"""
+        language = language if language in LANGUAGE_MODEL_DIRS else self.default_language
+        
+        with self._bundle_lock:
+            if language in self.bundles:
+                self.bundles.move_to_end(language)
+                return self.bundles[language]
+            
+            bundle = self._load_bundle(language)
+            if bundle is None:
+                return None
+            
+            self.bundles[language] = bundle
+            while len(self.bundles) > 1 and sum(b.size_bytes for b in self.bundles.values()) > self.max_bundle_bytes:
+                self.bundles.popitem(last=False)
+            return bundle
+    
+    def _load_bundle(self, language: str) -> Optional[ModelBundle]:
+        """Load all required models and encoders for one language"""
+        bundle_dir = find_bundle_dir(language)
+        
+        if bundle_dir is not None:
+            model_files = {name: str(bundle_dir / filename) for name, filename in self.BUNDLE_FILES.items()}
+            vectorizer_path = str(bundle_dir / 'vectorizer.pkl')
+            encoder_path = str(bundle_dir / 'label_encoder.pkl')
+        else:
+            model_files = self.LEGACY_FILES
+            vectorizer_path = 'model/vectorizer.pkl'
+            encoder_path = 'model/labelencoder.pkl'
+        
         try:
-            model_files = {
-                'logistic': 'model/logistic.pkl',
-                'random_forest': 'model/randomforest.pkl',
-                'gradient_boost': 'model/gradientboost.pkl',
-                'xgboost': 'model/xgboost.pkl'
-            }
+            models = {}
+            loaded_files = []
             
             for name, path in model_files.items():
                 if Path(path).exists():
-                    self.models[name] = joblib.load(path)
+                    models[name] = joblib.load(path)
+                    loaded_files.append(path)
                 else:
                     st.warning(f"Model {name} not found at {path}")
             
-            if Path('model/vectorizer.pkl').exists():
-                self.vectorizer = joblib.load('model/vectorizer.pkl')
+            if Path(vectorizer_path).exists():
+                vectorizer = joblib.load(vectorizer_path)
+                loaded_files.append(vectorizer_path)
             else:
-                st.error("Vectorizer not found!")
-                return
+                st.error(f"Vectorizer not found for {language}!")
+                return None
+            
+            label_encoder = None
+            if Path(encoder_path).exists():
+                label_encoder = joblib.load(encoder_path)
+                loaded_files.append(encoder_path)
             
-            if Path('model/labelencoder.pkl').exists():
-                self.label_encoder = joblib.load('model/labelencoder.pkl')
+            return ModelBundle(
+                language=language,
+                vectorizer=vectorizer,
+                models=models,
+                label_encoder=label_encoder,
+                # Identifies this exact model bundle in cache keys
+                fingerprint=fingerprint_files(loaded_files),
+                size_bytes=sum(Path(p).stat().st_size for p in loaded_files)
+            )
                 
         except Exception as e:
-            st.error(f"Error loading models: {str(e)}")
+            st.error(f"Error loading models for {language}: {str(e)}")
+            return None
+    
+    def resolve_bundle(self, code: Union[str, ParsedDocument], language: Optional[str] = None,
+                       file_path: Optional[str] = None) -> Optional[ModelBundle]:
+        """Pick the bundle for a submission: explicit language, then extension, then content"""
+        return self.get_bundle(language or detect_language(ParsedDocument.text_of(code), file_path))
     
-    def predict_with_model(self, X: np.ndarray, model_name: str) -> Optional[ModelResult]:
+    def predict_with_model(self, X: np.ndarray, model_name: str,
+                           bundle: Optional[ModelBundle] = None) -> Optional[ModelResult]:
         """Make prediction with a specific model"""
-        if model_name not in self.models:
+        bundle = bundle or self.get_bundle()
+        if bundle is None or model_name not in bundle.models:
             return None
             
         try:
-            model = self.models[model_name]
+            model = bundle.models[model_name]
             
             if model_name == 'xgboost':
                 y_pred = model.predict(X)
-                if self.label_encoder:
-                    prediction = self.label_encoder.inverse_transform(y_pred)[0]
+                if bundle.label_encoder:
+                    prediction = bundle.label_encoder.inverse_transform(y_pred)[0]
                 else:
                     prediction = "ai" if y_pred[0] == 0 else "human"
             else:
@@ -291,22 +563,120 @@ class CodeAnalyzer:
             st.warning(f"Error with {model_name}: {str(e)}")
             return None
     
-    def analyze_code(self, code: str) -> Tuple[List[ModelResult], str, float]:
+    def analyze_code(self, code: Union[str, ParsedDocument], language: Optional[str] = None,
+                     file_path: Optional[str] = None) -> Tuple[List[ModelResult], str, float]:
         """Analyze code with all available models"""
-        if not self.vectorizer:
+        code = ParsedDocument.text_of(code)
+        if self.resolve_bundle(code, language, file_path) is None:
             return [], "Error", 0.0
         
-        X = self.vectorizer.transform([code])
-        results = []
+        return self.analyze_many([code], language, [file_path])[0]
+    
+    def analyze_many(self, codes: List[str], language: Optional[str] = None,
+                     file_paths: Optional[List[Optional[str]]] = None) -> List[Tuple[List[ModelResult], str, float]]:
+        """Analyze many documents with one vectorizer pass and one predict_proba call per model
+        
+        Returns one (results, prediction, confidence) tuple per document, in input order.
+        Documents are grouped by language and each group is scored by its own bundle.
+        Documents already in the result cache are not re-scored.
+        """
+        if not codes:
+            return []
         
-        for model_name in self.models.keys():
-            result = self.predict_with_model(X, model_name)
-            if result:
-                results.append(result)
+        file_paths = file_paths or [None] * len(codes)
+        groups = {}
+        for idx, (code, file_path) in enumerate(zip(codes, file_paths)):
+            groups.setdefault(language or detect_language(code, file_path), []).append(idx)
         
-        final_prediction, final_confidence = self.ensemble_vote(results)
+        outputs = [None] * len(codes)
+        for group_language, indices in groups.items():
+            bundle = self.get_bundle(group_language)
+            group_outputs = self._analyze_group([codes[idx] for idx in indices], bundle)
+            for idx, output in zip(indices, group_outputs):
+                outputs[idx] = output
         
-        return results, final_prediction, final_confidence
+        return outputs
+    
+    def _analyze_group(self, codes: List[str], bundle: Optional[ModelBundle]) -> List[Tuple[List[ModelResult], str, float]]:
+        """Analyze documents that share one bundle, consulting the result cache first"""
+        if bundle is None:
+            return [([], "Error", 0.0) for _ in codes]
+        
+        outputs = [None] * len(codes)
+        keys = [None] * len(codes)
+        
+        if self.cache is not None:
+            for idx, code in enumerate(codes):
+                keys[idx] = code_cache_key(code, bundle.fingerprint)
+                cached = self.cache.get(keys[idx])
+                if cached is not None:
+                    outputs[idx] = self._result_from_dict(cached)
+        
+        pending = [idx for idx, output in enumerate(outputs) if output is None]
+        if pending:
+            scored = self._score_documents([codes[idx] for idx in pending], bundle)
+            for idx, output in zip(pending, scored):
+                outputs[idx] = output
+                if self.cache is not None and output[0]:
+                    self.cache.put(keys[idx], self._result_to_dict(output))
+        
+        return outputs
+    
+    def _score_documents(self, codes: List[str], bundle: ModelBundle) -> List[Tuple[List[ModelResult], str, float]]:
+        """Run every model once over the whole batch and vote per document"""
+        X = bundle.vectorizer.transform(codes).tocsr()
+        
+        names, labels, confidences = [], [], []
+        for model_name in bundle.models.keys():
+            scored = self.predict_proba_batch(X, model_name, bundle)
+            if scored is not None:
+                names.append(model_name.replace('_', ' ').title())
+                labels.append(scored[0])
+                confidences.append(scored[1])
+        
+        if not names:
+            return [([], "unknown", 0.0) for _ in codes]
+        
+        # (n_models, n_docs) matrices
+        labels = np.vstack(labels)
+        confidences = np.vstack(confidences).astype(float)
+        final_predictions, final_confidences = self.ensemble_vote_matrix(labels, confidences)
+        
+        return [
+            (
+                [ModelResult(name=name, prediction=str(labels[m, d]), confidence=float(confidences[m, d]))
+                 for m, name in enumerate(names)],
+                str(final_predictions[d]),
+                float(final_confidences[d])
+            )
+            for d in range(len(codes))
+        ]
+    
+    @staticmethod
+    def _result_to_dict(output: Tuple[List[ModelResult], str, float]) -> Dict:
+        results, final_pred, final_conf = output
+        return {
+            "results": [[r.name, r.prediction, r.confidence] for r in results],
+            "prediction": final_pred,
+            "confidence": final_conf
+        }
+    
+    @staticmethod
+    def _result_from_dict(value: Dict) -> Tuple[List[ModelResult], str, float]:
+        results = [ModelResult(name=name, prediction=prediction, confidence=confidence)
+                   for name, prediction, confidence in value["results"]]
+        return results, value["prediction"], value["confidence"]
+    
+    @staticmethod
+    def ensemble_vote_matrix(labels: np.ndarray, confidences: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized ensemble_vote over (n_models, n_docs) label and confidence matrices"""
+        ai_score = np.where(labels == "ai", confidences, 0.0).sum(axis=0)
+        human_score = np.where(labels == "human", confidences, 0.0).sum(axis=0)
+        is_ai = ai_score > human_score
+        
+        predictions = np.where(is_ai, "ai", "human")
+        final_confidences = np.where(is_ai, ai_score, human_score) / labels.shape[0]
+        return predictions, final_confidences
     
     def ensemble_vote(self, results: List[ModelResult]) -> Tuple[str, float]:
         """Calculate ensemble prediction using weighted voting"""
@@ -324,36 +694,166 @@ class CodeAnalyzer:
         else:
             return "human", human_score / len(results)
     
-    def analyze_lines(self, code: str, model_name: str, overall_prediction: str) -> List[LineAnalysis]:
-        """Perform line-by-line analysis with consistency check"""
-        if model_name not in self.models or not self.vectorizer:
-            return []
+    def predict_proba_batch(self, X, model_name: str,
+                            bundle: Optional[ModelBundle] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Score every row of X with a single predict_proba call.
+        
+        Labels are taken from the argmax over the model's classes, so one call
+        replaces the predict + predict_proba pair used per row.
+        """
+        bundle = bundle or self.get_bundle()
+        if bundle is None or model_name not in bundle.models:
+            return None
+        
+        try:
+            model = bundle.models[model_name]
+            proba = model.predict_proba(X)
+            best = proba.argmax(axis=1)
+            class_labels = self._class_labels(model, model_name, bundle)
+            return class_labels[best], proba[np.arange(len(best)), best]
+        
+        except Exception as e:
+            st.warning(f"Error with {model_name}: {str(e)}")
+            return None
+    
+    def _class_labels(self, model, model_name: str, bundle: ModelBundle) -> np.ndarray:
+        """Map a model's classes_ to "ai"/"human" labels"""
+        classes = np.asarray(model.classes_)
+        if model_name == 'xgboost':
+            if bundle.label_encoder:
+                return np.asarray(bundle.label_encoder.inverse_transform(classes))
+            return np.where(classes == 0, "ai", "human")
+        return classes
+    
+    def analyze_lines(self, code: Union[str, ParsedDocument], model_name: str, overall_prediction: str,
+                      batched: bool = True, language: Optional[str] = None,
+                      file_path: Optional[str] = None) -> LineAnalysisTable:
+        """Perform line-by-line analysis with consistency check
+        
+        With batched=True all non-blank lines are vectorized into one sparse
+        matrix and scored with a single predict_proba call; batched=False keeps
+        the original one-transform-per-line path.
+        """
+        doc = ParsedDocument.of(code)
+        bundle = self.resolve_bundle(doc, language, file_path)
+        if bundle is None or model_name not in bundle.models:
+            return LineAnalysisTable.empty(doc, self.PATTERN_LABELS)
+        
+        if batched:
+            line_analyses = self._score_lines_batched(doc, model_name, bundle)
+        else:
+            line_analyses = LineAnalysisTable.from_analyses(
+                doc, self._score_lines(doc, model_name, bundle), self.PATTERN_LABELS)
         
-        lines = code.split('\n')
+        return self._check_line_consistency(line_analyses, overall_prediction)
+    
+    def _score_lines(self, doc: ParsedDocument, model_name: str, bundle: ModelBundle) -> List[LineAnalysis]:
+        """Score lines one at a time"""
         line_analyses = []
         
-        for i, line in enumerate(lines):
-            if line.strip():
-                try:
-                    X_line = self.vectorizer.transform([line])
-                    result = self.predict_with_model(X_line, model_name)
+        for i in doc.nonblank_indices.tolist():
+            line = doc.lines[i]
+            try:
+                X_line = bundle.vectorizer.transform([line])
+                result = self.predict_with_model(X_line, model_name, bundle)
+                
+                if result:
+                    patterns = self.detect_patterns(line)
+                    line_analyses.append(LineAnalysis(
+                        line_number=i + 1,
+                        content=line,
+                        prediction=result.prediction,
+                        confidence=result.confidence,
+                        patterns=patterns
+                    ))
                     
-                    if result:
-                        patterns = self.detect_patterns(line)
-                        line_analyses.append(LineAnalysis(
-                            line_number=i + 1,
-                            content=line,
-                            prediction=result.prediction,
-                            confidence=result.confidence,
-                            patterns=patterns
-                        ))
-                        
-                except Exception as e:
-                    continue
-        
-        # Consistency check: ensure line predictions align with overall prediction
+            except Exception as e:
+                continue
+        
+        return line_analyses
+    
+    def _score_lines_batched(self, doc: ParsedDocument, model_name: str, bundle: ModelBundle) -> LineAnalysisTable:
+        """Score all non-blank lines with one transform and one predict_proba call
+        
+        Lines already in the line memo are not re-scored, and repeated lines
+        within the document are scored once.
+        """
+        lines = doc.lines
+        indices = doc.nonblank_indices
+        if not len(indices):
+            return LineAnalysisTable.empty(doc, self.PATTERN_LABELS)
+        
+        lowercase = getattr(bundle.vectorizer, 'lowercase', False)
+        keys = [LineMemo.normalize_line(lines[i], lowercase) for i in indices.tolist()]
+        scored_lines = {}
+        
+        for key, i in zip(keys, indices.tolist()):
+            if key not in scored_lines:
+                memo = self.line_memo.get(model_name, bundle.fingerprint, key)
+                scored_lines[key] = memo if memo is not None else lines[i]
+        
+        # Unscored keys still map to a representative line of text
+        pending = [key for key, value in scored_lines.items() if isinstance(value, str)]
+        if pending:
+            try:
+                X_lines = bundle.vectorizer.transform([scored_lines[key] for key in pending])
+            except Exception as e:
+                st.warning(f"Error vectorizing lines: {str(e)}")
+                return LineAnalysisTable.empty(doc, self.PATTERN_LABELS)
+            
+            scored = self.predict_proba_batch(X_lines, model_name, bundle)
+            if scored is None:
+                return LineAnalysisTable.empty(doc, self.PATTERN_LABELS)
+            
+            pending_masks = PatternScanner.masks(
+                self.PATTERN_SCANNER.scan('\n'.join(scored_lines[key] for key in pending)))
+            for key, label, confidence, mask in zip(pending, *scored, pending_masks.tolist()):
+                value = (str(label), float(confidence), mask)
+                self.line_memo.put(model_name, bundle.fingerprint, key, value)
+                scored_lines[key] = value
+        
+        values = [scored_lines[key] for key in keys]
+        return LineAnalysisTable(
+            doc,
+            line_numbers=indices + 1,
+            is_ai=np.fromiter((v[0] == "ai" for v in values), dtype=bool, count=len(values)),
+            confidences=np.fromiter((v[1] for v in values), dtype=np.float64, count=len(values)),
+            pattern_masks=np.fromiter((v[2] for v in values), dtype=np.int64, count=len(values)),
+            pattern_labels=self.PATTERN_LABELS
+        )
+    
+    def warm_line_memo(self, model_name: str = 'gradient_boost', data_dir: str = 'data',
+                       languages: Optional[List[str]] = None) -> int:
+        """Pre-score every line of the training corpus under data_dir/*/ into the line memo
+        
+        Each file is scored with the bundle for its language. Returns the number
+        of memo entries afterwards.
+        """
+        lines_by_language = {}
+        for path in sorted(Path(data_dir).glob('*/*/*')):
+            language = LANGUAGE_EXTENSIONS.get(path.suffix.lower())
+            if language and (languages is None or language in languages):
+                lines_by_language.setdefault(language, []).extend(
+                    path.read_text(encoding='utf-8', errors='ignore').split('\n'))
+        
+        for language, lines in lines_by_language.items():
+            bundle = self.get_bundle(language)
+            if bundle is None or model_name not in bundle.models:
+                continue
+            
+            # One batch per chunk keeps the sparse matrix small
+            chunk_size = 5000
+            for start in range(0, len(lines), chunk_size):
+                chunk = ParsedDocument.parse('\n'.join(lines[start:start + chunk_size]))
+                self._score_lines_batched(chunk, model_name, bundle)
+        
+        return len(self.line_memo)
+    
+    def _check_line_consistency(self, line_analyses: LineAnalysisTable,
+                                overall_prediction: str) -> LineAnalysisTable:
+        """Consistency check: ensure line predictions align with overall prediction"""
         if line_analyses:
-            ai_line_count = sum(1 for a in line_analyses if a.prediction == "ai")
+            ai_line_count = line_analyses.ai_count
             total_lines = len(line_analyses)
             ai_ratio = ai_line_count / total_lines if total_lines > 0 else 0
             
@@ -367,86 +867,124 @@ class CodeAnalyzer:
         
         return line_analyses
     
-    def _adjust_line_predictions(self, line_analyses: List[LineAnalysis], 
-                                target_prediction: str, target_ratio: float = 0.5) -> List[LineAnalysis]:
+    def _adjust_line_predictions(self, line_analyses: LineAnalysisTable, 
+                                target_prediction: str, target_ratio: float = 0.5) -> LineAnalysisTable:
         """Adjust line predictions to be more consistent with overall prediction"""
         if not line_analyses:
             return line_analyses
         
         total_lines = len(line_analyses)
-        current_target_count = sum(1 for a in line_analyses if a.prediction == target_prediction)
+        current_target_count = line_analyses.ai_count if target_prediction == "ai" else line_analyses.human_count
         desired_target_count = int(total_lines * target_ratio)
         
         if current_target_count >= desired_target_count:
             return line_analyses
         
-        # Find lines with lowest confidence in opposite prediction
-        opposite_pred = "human" if target_prediction == "ai" else "ai"
-        candidates = [a for a in line_analyses if a.prediction == opposite_pred]
-        candidates.sort(key=lambda x: x.confidence)
-        
-        # Flip predictions for lines with lowest confidence
-        lines_to_flip = desired_target_count - current_target_count
-        for i in range(min(lines_to_flip, len(candidates))):
-            idx = line_analyses.index(candidates[i])
-            line_analyses[idx] = LineAnalysis(
-                line_number=line_analyses[idx].line_number,
-                content=line_analyses[idx].content,
-                prediction=target_prediction,
-                confidence=0.55,  # Moderate confidence for adjusted predictions
-                patterns=line_analyses[idx].patterns
-            )
+        # Flip predictions for lines with lowest confidence in opposite prediction,
+        # with moderate confidence for adjusted predictions
+        line_analyses.flip_least_confident(target_prediction, desired_target_count - current_target_count,
+                                           confidence=0.55)
         
         return line_analyses
     
-    def analyze_file(self, file_path: str, code: str) -> FileAnalysisResult:
-        """Analyze a single file and return results"""
-        results, final_pred, final_conf = self.analyze_code(code)
-        line_analyses = self.analyze_lines(code, 'gradient_boost', final_pred)
-        
-        ai_lines = sum(1 for a in line_analyses if a.prediction == "ai")
-        human_lines = sum(1 for a in line_analyses if a.prediction == "human")
-        
-        return FileAnalysisResult(
+    def analyze_file(self, file_path: str, code: str, blob_sha: Optional[str] = None) -> FileAnalysisResult:
+        """Analyze a single file and return results
+        
+        With a cache attached, results are stored under the file's blob SHA
+        (computed from code unless given) and the model version, so an
+        unchanged file is never analyzed twice.
+        """
+        language = detect_language(code, file_path)
+        key = self._file_key(language, blob_sha or git_blob_sha(code))
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return self._file_result_from_dict(file_path, cached)
+        
+        doc = ParsedDocument.parse(code)
+        results, final_pred, final_conf = self.analyze_code(doc, language)
+        line_analyses = self.analyze_lines(doc, 'gradient_boost', final_pred, language=language)
+        
+        result = FileAnalysisResult(
             file_path=file_path,
             prediction=final_pred,
             confidence=final_conf,
-            line_count=len([l for l in code.split('\n') if l.strip()]),
-            ai_lines=ai_lines,
-            human_lines=human_lines,
+            line_count=doc.nonblank_count,
+            ai_lines=line_analyses.ai_count,
+            human_lines=line_analyses.human_count,
             model_results=results
         )
+        
+        if key:
+            self.cache.put(key, self._file_result_to_dict(result))
+        return result
+    
+    def cached_file_result(self, file_path: str, blob_sha: str) -> Optional[FileAnalysisResult]:
+        """Earlier analysis of this blob under the current models, without fetching its content"""
+        language = LANGUAGE_EXTENSIONS.get(Path(file_path).suffix.lower())
+        key = self._file_key(language, blob_sha) if language and blob_sha else None
+        cached = self.cache.get(key) if key else None
+        return self._file_result_from_dict(file_path, cached) if cached is not None else None
+    
+    def _file_key(self, language: str, blob_sha: str) -> Optional[str]:
+        if self.cache is None:
+            return None
+        bundle = self.get_bundle(language)
+        return file_cache_key(blob_sha, bundle.fingerprint) if bundle else None
+    
+    @staticmethod
+    def _file_result_to_dict(result: FileAnalysisResult) -> Dict:
+        # The path is left out so identical files at different paths share an entry
+        value = asdict(result)
+        del value['file_path']
+        return value
+    
+    @staticmethod
+    def _file_result_from_dict(file_path: str, value: Dict) -> FileAnalysisResult:
+        fields = dict(value)
+        fields['model_results'] = [ModelResult(**r) for r in value['model_results']]
+        return FileAnalysisResult(file_path=file_path, **fields)
+    
+    # Coding patterns reported per line, matched case-insensitively on the stripped line
+    PATTERN_CHECKS = {
+        'function_def': r'^def\s+\w+\s*\(',
+        'class_def': r'^class\s+\w+',
+        'import_statement': r'^(import|from)\s+',
+        'comment': r'^\s*#',
+        'loop': r'^\s*(for|while)\s+',
+        'conditional': r'^\s*if\s+',
+        'print_statement': r'print\s*\(',
+        'input_statement': r'input\s*\(',
+        'list_comprehension': r'\[.*for.*in.*\]',
+        'lambda': r'lambda\s+',
+        'exception_handling': r'^\s*(try|except|finally):',
+        'docstring': r'""".*"""',
+        'f_string': r'f["\'].*\{.*\}.*["\']',
+    }
+    
+    PATTERN_LABELS = [name.replace('_', ' ').title() for name in PATTERN_CHECKS]
+    PATTERN_SCANNER = PatternScanner(PATTERN_CHECKS, re.IGNORECASE, strip_lines=True)
     
     def detect_patterns(self, line: str) -> List[str]:
         """Detect coding patterns in a line"""
-        patterns = []
-        line = line.strip()
-        
-        pattern_checks = {
-            'function_def': r'^def\s+\w+\s*\(',
-            'class_def': r'^class\s+\w+',
-            'import_statement': r'^(import|from)\s+',
-            'comment': r'^\s*#',
-            'loop': r'^\s*(for|while)\s+',
-            'conditional': r'^\s*if\s+',
-            'print_statement': r'print\s*\(',
-            'input_statement': r'input\s*\(',
-            'list_comprehension': r'\[.*for.*in.*\]',
-            'lambda': r'lambda\s+',
-            'exception_handling': r'^\s*(try|except|finally):',
-            'docstring': r'""".*"""',
-            'f_string': r'f["\'].*\{.*\}.*["\']',
-        }
-        
-        for pattern_name, regex in pattern_checks.items():
-            if re.search(regex, line, re.IGNORECASE):
-                patterns.append(pattern_name.replace('_', ' ').title())
-        
-        return patterns
+        return self.detect_patterns_many([line])[0]
+    
+    def detect_patterns_many(self, lines: List[str]) -> List[List[str]]:
+        """Detect coding patterns for many lines with one scan over their joined text"""
+        if not lines:
+            return []
+        matches = self.PATTERN_SCANNER.scan('\n'.join(lines))
+        return self.PATTERN_SCANNER.line_labels(matches, self.PATTERN_LABELS)
 
 class GitHubRepoAnalyzer:
     """Class for analyzing GitHub repositories"""
     
+    API_URL = "https://api.github.com"
+    RAW_URL = "https://raw.githubusercontent.com"
+    
+    # Files larger than this are skipped when listing (generated or data files)
+    MAX_FILE_SIZE = 200_000
+    
     @staticmethod
     def parse_github_url(url: str) -> Tuple[Optional[str], Optional[str]]:
         """Parse GitHub URL to extract owner and repo name"""
@@ -463,21 +1001,35 @@ class GitHubRepoAnalyzer:
         
         return None, None
     
+    # Concurrent downloads per scan; also the client's in-flight request cap
+    DOWNLOAD_WORKERS = 8
+    
+    _client = None
+    _client_lock = threading.Lock()
+    
+    @staticmethod
+    def get_client() -> GitHubClient:
+        """Shared rate-limit-aware client, caching listing responses next to the analysis results"""
+        with GitHubRepoAnalyzer._client_lock:
+            if GitHubRepoAnalyzer._client is None:
+                GitHubRepoAnalyzer._client = GitHubClient(
+                    max_concurrency=GitHubRepoAnalyzer.DOWNLOAD_WORKERS, cache_db=ANALYSIS_CACHE_DB)
+            return GitHubRepoAnalyzer._client
+    
     @staticmethod
     def get_repo_contents(owner: str, repo: str, path: str = "") -> List[Dict]:
         """Get contents of a GitHub repository"""
-        url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
+        url = f"{GitHubRepoAnalyzer.API_URL}/repos/{owner}/{repo}/contents/{path}"
         
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            return GitHubRepoAnalyzer.get_client().get_json(url)
         except Exception as e:
             st.error(f"Error fetching repo contents: {str(e)}")
             return []
     
     @staticmethod
-    def get_all_python_files(owner: str, repo: str, path: str = "") -> List[Dict]:
+    def get_all_python_files(owner: str, repo: str, path: str = "",
+                             extensions: Tuple[str, ...] = ('.py',)) -> List[Dict]:
         """Recursively get all Python files from repository"""
         python_files = []
         contents = GitHubRepoAnalyzer.get_repo_contents(owner, repo, path)
@@ -486,40 +1038,252 @@ class GitHubRepoAnalyzer:
             return python_files
         
         for item in contents:
-            if item['type'] == 'file' and item['name'].endswith('.py'):
+            if item['type'] == 'file' and item['name'].endswith(extensions):
                 python_files.append(item)
             elif item['type'] == 'dir':
-                subdir_files = GitHubRepoAnalyzer.get_all_python_files(owner, repo, item['path'])
+                subdir_files = GitHubRepoAnalyzer.get_all_python_files(owner, repo, item['path'], extensions)
                 python_files.extend(subdir_files)
         
         return python_files
     
     @staticmethod
-    def get_file_content(download_url: str) -> Optional[str]:
-        """Download and decode file content"""
+    def get_repo_tree(owner: str, repo: str, ref: str = "HEAD") -> Optional[Dict]:
+        """Get the whole file tree of a repository with one recursive Git Trees call"""
+        url = f"{GitHubRepoAnalyzer.API_URL}/repos/{owner}/{repo}/git/trees/{ref}"
+        
         try:
-            response = requests.get(download_url, timeout=10)
-            response.raise_for_status()
-            return response.text
+            return GitHubRepoAnalyzer.get_client().get_json(url, params={"recursive": 1})
         except Exception as e:
-            st.warning(f"Error downloading file: {str(e)}")
+            st.warning(f"Error fetching repo tree: {str(e)}")
             return None
+    
+    @staticmethod
+    def list_source_files(owner: str, repo: str, extensions: Tuple[str, ...] = ('.py',),
+                          max_size: int = MAX_FILE_SIZE, ref: str = "HEAD") -> List[Dict]:
+        """List source files to analyze, filtered by extension and blob size
+        
+        Uses a single recursive Git Trees request. Falls back to walking the
+        contents API directory by directory when the tree is unavailable or
+        truncated. Items have the same keys as contents API file entries.
+        """
+        tree = GitHubRepoAnalyzer.get_repo_tree(owner, repo, ref)
+        
+        if tree is None or tree.get('truncated'):
+            files = GitHubRepoAnalyzer.get_all_python_files(owner, repo, extensions=extensions)
+            return [item for item in files if item.get('size', 0) <= max_size]
+        
+        return [
+            {
+                'name': item['path'].rsplit('/', 1)[-1],
+                'path': item['path'],
+                'sha': item['sha'],
+                'size': item.get('size', 0),
+                'type': 'file',
+                'download_url': f"{GitHubRepoAnalyzer.RAW_URL}/{owner}/{repo}/{ref}/{quote(item['path'])}"
+            }
+            for item in tree.get('tree', [])
+            if item['type'] == 'blob' and item['path'].endswith(extensions) and item.get('size', 0) <= max_size
+        ]
+    
+    @staticmethod
+    def iter_archive_files(owner: str, repo: str, extensions: Tuple[str, ...] = ('.py',),
+                           max_size: int = MAX_FILE_SIZE, ref: str = "HEAD",
+                           paths: Optional[Set[str]] = None):
+        """Stream the repository tarball for ref, yielding (file_info, content) for matching files
+        
+        The whole repository arrives in one request. The archive is read
+        sequentially straight off the response and only matching members are
+        decoded, in memory; nothing is written to disk. Pass paths to extract
+        just those files; reading stops once all of them have been found.
+        """
+        remaining = set(paths) if paths is not None else None
+        url = f"{GitHubRepoAnalyzer.API_URL}/repos/{owner}/{repo}/tarball/{ref}"
+        
+        with GitHubRepoAnalyzer.get_client().get(url, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            with tarfile.open(fileobj=response.raw, mode='r|*') as archive:
+                for member in archive:
+                    # Members live under a single "<owner>-<repo>-<commit>/" directory
+                    path = member.name.split('/', 1)[-1]
+                    if not member.isfile() or member.size > max_size or not path.endswith(extensions):
+                        continue
+                    if remaining is not None and path not in remaining:
+                        continue
+                    
+                    content = archive.extractfile(member).read().decode('utf-8', errors='replace')
+                    yield {
+                        'name': path.rsplit('/', 1)[-1],
+                        'path': path,
+                        'size': member.size,
+                        'type': 'file'
+                    }, content
+                    
+                    if remaining is not None:
+                        remaining.discard(path)
+                        if not remaining:
+                            return
+    
+    @staticmethod
+    def download_file(download_url: str) -> Tuple[Optional[str], Optional[str]]:
+        """Download a file with the shared client, returning (content, error)
+        
+        Safe to call from worker threads: errors are returned, not rendered.
+        """
+        try:
+            response = GitHubRepoAnalyzer.get_client().get(download_url)
+            response.raise_for_status()
+            return response.text, None
+        except Exception as e:
+            return None, str(e)
+    
+    @staticmethod
+    def iter_file_contents(files: List[Dict], max_workers: int = DOWNLOAD_WORKERS):
+        """Download files concurrently, yielding (file_info, content, error) as each one arrives
+        
+        At most max_workers downloads are in flight. Results come back in
+        completion order, so the caller can analyze the first file while the
+        rest are still downloading.
+        """
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {pool.submit(GitHubRepoAnalyzer.download_file, f['download_url']): f for f in files}
+            for future in as_completed(futures):
+                content, error = future.result()
+                yield futures[future], content, error
+        finally:
+            # Stop queued downloads if the caller stops early
+            pool.shutdown(wait=False, cancel_futures=True)
+
+# Persistent store for file analyses and GitHub listing responses, shared across sessions
+ANALYSIS_CACHE_DB = os.environ.get(
+    'ANALYSIS_CACHE_DB', str(Path.home() / '.cache' / 'master-the-interview' / 'analysis.db'))
+
+def get_session_analyzer() -> CodeAnalyzer:
+    """The session's analyzer, created on first use with the persistent result cache"""
+    if 'analyzer' not in st.session_state:
+        with st.spinner("Loading models..."):
+            st.session_state.analyzer = CodeAnalyzer(cache=AnalysisCache(db_path=ANALYSIS_CACHE_DB))
+    return st.session_state.analyzer
+
+# Worker processes used for repository scans
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', os.cpu_count() or 1))
+
+@st.cache_resource
+def get_scan_engine() -> ScanEngine:
+    """Process pool shared by all sessions, so workers load their models only once"""
+    return ScanEngine(SCAN_WORKERS, cache_db=ANALYSIS_CACHE_DB, languages=[DEFAULT_LANGUAGE])
+
+# Smallest sample whose confidence interval is trusted for early stopping
+MIN_SAMPLE_FILES = 20
+# Largest share of the repository, in strata not yet sampled, that still allows stopping early
+MAX_UNCOVERED_SHARE = 0.05
+
+def run_sampled_scan(files: List[Dict], fetch: Callable[[List[Dict]], Iterable[Tuple[Dict, str]]],
+                     analyzer: CodeAnalyzer, max_files: int, time_budget: float, target_margin: float,
+                     batch_size: int = 16, skipped: Optional[List[Dict]] = None
+                     ) -> Tuple[List[FileAnalysisResult], ShareEstimate]:
+    """Analyze a stratified sample of files until the AI-share interval is narrow enough or a budget runs out
+    
+    fetch(batch) returns (file_info, code) pairs for the files of a batch that
+    have no cached result. Each batch is analyzed on the scan engine, and the
+    stopping rule is checked between batches. Fetched files whose content
+    marks them as generated or minified are not analyzed; they are appended
+    to skipped with a 'skip_reason'.
+    """
+    planner = SamplingPlanner(files)
+    file_results = []
+    reused = 0
+    deadline = time.monotonic() + time_budget
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    
+    def record(file_info: Dict, result: FileAnalysisResult):
+        planner.record(file_info, result.prediction == "ai")
+        file_results.append(result)
+    
+    def show_progress(completed: int, total: int, file_info: Dict):
+        status_text.text(f"Analyzed: {file_info['path']} ({len(file_results) + 1}/{max_files})")
+    
+    def prefiltered(sources: Iterable[Tuple[Dict, str]]):
+        for file_info, code in sources:
+            reason = content_skip_reason(file_info, code)
+            if reason is None:
+                yield file_info, code
+            elif skipped is not None:
+                skipped.append({**file_info, 'skip_reason': reason})
+    
+    while planner.remaining and planner.population - planner.remaining < max_files:
+        drawn = planner.population - planner.remaining
+        batch = planner.next_batch(min(batch_size, max_files - drawn))
+        
+        # Files whose blob SHA was analyzed in an earlier scan are not fetched again
+        to_fetch = []
+        for file_info in batch:
+            cached = analyzer.cached_file_result(file_info['path'], file_info.get('sha'))
+            if cached:
+                record(file_info, cached)
+                reused += 1
+            else:
+                to_fetch.append(file_info)
+        
+        if to_fetch:
+            for file_info, result, error in get_scan_engine().scan(prefiltered(fetch(to_fetch)), len(to_fetch), show_progress):
+                if error:
+                    st.warning(f"Error analyzing {file_info['path']}: {error}")
+                else:
+                    record(file_info, result)
+        
+        estimate = planner.estimate()
+        progress_bar.progress(min(len(file_results) / max_files, 1.0))
+        status_text.text(f"Sampled {estimate.sampled}/{estimate.population} files: "
+                         f"AI share {estimate.share:.0%} ± {estimate.margin:.0%}")
+        
+        if (estimate.sampled >= MIN_SAMPLE_FILES and estimate.uncovered <= MAX_UNCOVERED_SHARE
+                and estimate.margin <= target_margin):
+            break
+        if time.monotonic() > deadline:
+            st.info(f"⏱️ Time budget reached after {estimate.sampled} files.")
+            break
+    
+    status_text.empty()
+    progress_bar.empty()
+    
+    if reused:
+        st.info(f"♻️ Reused results for {reused} unchanged files.")
+    return file_results, planner.estimate()
+
+def render_sampling_controls(key: str) -> Tuple[float, float]:
+    """Time budget (seconds) and target interval half-width for a sampled repository scan"""
+    time_budget = st.number_input(
+        "Time budget (seconds):",
+        min_value=5,
+        max_value=3600,
+        value=120,
+        help="Stop sampling new files after this long",
+        key=f"{key}_time_budget"
+    )
+    
+    target_margin = st.slider(
+        "Target margin (± AI share):",
+        min_value=0.02,
+        max_value=0.25,
+        value=0.05,
+        help="Stop once the 95% confidence interval on the AI share is this narrow",
+        key=f"{key}_target_margin"
+    )
+    return time_budget, target_margin
 
 def render_single_code_analysis():
     """Render the single code analysis interface"""
     st.markdown("## 📝 Analyze Single Code")
     
-    if 'analyzer' not in st.session_state:
-        with st.spinner("Loading models..."):
-            st.session_state.analyzer = CodeAnalyzer()
-    
-    analyzer = st.session_state.analyzer
+    analyzer = get_session_analyzer()
     
     col1, col2 = st.columns([2, 1])
     
     with col1:
         code_input = st.text_area(
-            "📝 Enter your Python code here:",
+            "📝 Enter your code here:",
             height=400,
             placeholder="# Paste your Python code here...\nprint('Hello, World!')"
         )
@@ -527,6 +1291,12 @@ def render_single_code_analysis():
     with col2:
         st.markdown("### ⚙️ Analysis Options")
         
+        language_choice = st.selectbox(
+            "Language:",
+            ["auto-detect"] + list(LANGUAGE_MODEL_DIRS.keys()),
+            help="Pick the language-specific models, or detect the language from the code"
+        )
+        
         line_model = st.selectbox(
             "Model for line analysis:",
             ["gradient_boost", "random_forest", "logistic", "xgboost"],
@@ -543,19 +1313,24 @@ def render_single_code_analysis():
             return
         
         with st.spinner("Analyzing code..."):
-            results, final_pred, final_conf = analyzer.analyze_code(code_input)
+            doc = ParsedDocument.parse(code_input)
+            language = detect_language(code_input) if language_choice == "auto-detect" else language_choice
+            results, final_pred, final_conf = analyzer.analyze_code(doc, language)
             
             if not results:
                 st.error("❌ Analysis failed. Please check if models are loaded correctly.")
                 return
             
-            line_analyses = analyzer.analyze_lines(code_input, line_model, final_pred)
-            characteristics = AIDetectionReasoningEngine.analyze_code_characteristics(code_input, line_analyses)
+            line_analyses = analyzer.analyze_lines(doc, line_model, final_pred, language=language)
+            characteristics = AIDetectionReasoningEngine.analyze_code_characteristics(doc, line_analyses)
         
         display_single_analysis_results(results, final_pred, final_conf, line_analyses, 
                                        characteristics, code_input, show_confidence, 
                                        show_patterns, show_reasoning)
 
+# Line-by-line details rendered in the UI; the counts above always cover every line
+MAX_DISPLAYED_LINES = 500
+
 def display_single_analysis_results(results, final_pred, final_conf, line_analyses, 
                                    characteristics, code_input, show_confidence, 
                                    show_patterns, show_reasoning):
@@ -612,8 +1387,8 @@ def display_single_analysis_results(results, final_pred, final_conf, line_analys
         st.markdown("---")
         st.markdown("### 📋 Line-by-Line Analysis")
         
-        ai_lines = sum(1 for a in line_analyses if a.prediction == "ai")
-        human_lines = len(line_analyses) - ai_lines
+        ai_lines = line_analyses.ai_count
+        human_lines = line_analyses.human_count
         
         col1, col2 = st.columns(2)
         with col1:
@@ -622,7 +1397,10 @@ def display_single_analysis_results(results, final_pred, final_conf, line_analys
             st.metric("Human Lines", f"{human_lines} ({human_lines/len(line_analyses)*100:.1f}%)")
         
         with st.expander("View Detailed Line Analysis"):
-            for analysis in line_analyses:
+            if len(line_analyses) > MAX_DISPLAYED_LINES:
+                st.caption(f"Showing the first {MAX_DISPLAYED_LINES} of {len(line_analyses)} analyzed lines")
+            
+            for analysis in line_analyses.rows(0, MAX_DISPLAYED_LINES):
                 icon = "🤖" if analysis.prediction == "ai" else "👨‍💻"
                 conf_color = "🔴" if analysis.confidence > 0.8 else "🟡" if analysis.confidence > 0.6 else "🟢"
                 
@@ -638,11 +1416,7 @@ def render_github_repo_analysis():
     """Render the GitHub repository analysis interface"""
     st.markdown("## 🔗 Analyze GitHub Repository")
     
-    if 'analyzer' not in st.session_state:
-        with st.spinner("Loading models..."):
-            st.session_state.analyzer = CodeAnalyzer()
-    
-    analyzer = st.session_state.analyzer
+    analyzer = get_session_analyzer()
     
     col1, col2 = st.columns([2, 1])
     
@@ -659,8 +1433,29 @@ def render_github_repo_analysis():
             min_value=1,
             max_value=100,
             value=20,
-            help="Limit the number of files to analyze"
+            help="Most files to sample; sampling stops earlier once the estimate is precise enough"
+        )
+        
+        languages = st.multiselect(
+            "Languages:",
+            list(LANGUAGE_MODEL_DIRS.keys()),
+            default=["python"],
+            help="Source files of these languages are analyzed with their own models"
         )
+        
+        ingestion = st.radio(
+            "Fetch files by:",
+            ["Per-file downloads", "Repository archive"],
+            help="The archive fetches the whole repository in a single request"
+        )
+        
+        if ingestion == "Repository archive":
+            # The sample is extracted in a single archive pass, so there is no point to stop early
+            st.caption("ℹ️ The archive is read in one pass: all sampled files are analyzed, "
+                       "without a time budget or early stop.")
+            time_budget, target_margin = float('inf'), 0.0
+        else:
+            time_budget, target_margin = render_sampling_controls("github")
     
     if st.button("🔍 Analyze Repository", type="primary", use_container_width=True):
         if not repo_url.strip():
@@ -673,52 +1468,172 @@ def render_github_repo_analysis():
             st.error("❌ Invalid GitHub URL. Please use format: https://github.com/owner/repo")
             return
         
+        extensions = tuple(ext for ext, language in LANGUAGE_EXTENSIONS.items() if language in languages)
+        if not extensions:
+            st.warning("⚠️ Please select at least one language.")
+            return
+        
         with st.spinner(f"Fetching files from {owner}/{repo}..."):
-            python_files = GitHubRepoAnalyzer.get_all_python_files(owner, repo)
+            python_files = GitHubRepoAnalyzer.list_source_files(owner, repo, extensions)
         
         if not python_files:
-            st.warning("⚠️ No Python files found in the repository.")
+            st.warning("⚠️ No source files found in the repository.")
             return
         
-        st.info(f"📂 Found {len(python_files)} Python files. Analyzing up to {max_files} files...")
+        python_files, skipped = partition_files(python_files)
+        if not python_files:
+            st.warning(f"⚠️ All {len(skipped)} source files are vendored, generated or boilerplate.")
+            display_skipped_files(skipped)
+            return
         
-        file_results = []
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        st.info(f"📂 Found {len(python_files)} source files ({len(skipped)} skipped). "
+                f"Sampling up to {max_files} files...")
         
-        files_to_analyze = python_files[:max_files]
+        def downloaded(batch: List[Dict]):
+            # Files are analyzed as they arrive while the remaining downloads continue
+            for file_info, code, error in GitHubRepoAnalyzer.iter_file_contents(batch):
+                if error:
+                    st.warning(f"Error downloading {file_info['path']}: {error}")
+                elif code:
+                    yield file_info, code
         
-        for idx, file_info in enumerate(files_to_analyze):
-            status_text.text(f"Analyzing: {file_info['path']} ({idx + 1}/{len(files_to_analyze)})")
-            
-            code = GitHubRepoAnalyzer.get_file_content(file_info['download_url'])
-            
-            if code:
-                try:
-                    result = analyzer.analyze_file(file_info['path'], code)
-                    file_results.append(result)
-                except Exception as e:
-                    st.warning(f"Error analyzing {file_info['path']}: {str(e)}")
-            
-            progress_bar.progress((idx + 1) / len(files_to_analyze))
+        def from_archive(batch: List[Dict]):
+            return GitHubRepoAnalyzer.iter_archive_files(owner, repo, extensions,
+                                                         paths={f['path'] for f in batch})
         
-        status_text.empty()
-        progress_bar.empty()
+        if ingestion == "Repository archive":
+            # One archive pass extracts the whole sample; the sampling controls are hidden for it
+            fetch, batch_size = from_archive, max_files
+        else:
+            fetch, batch_size = downloaded, 2 * SCAN_WORKERS + GitHubRepoAnalyzer.DOWNLOAD_WORKERS
+        
+        file_results, estimate = [], None
+        try:
+            file_results, estimate = run_sampled_scan(python_files, fetch, analyzer, max_files,
+                                                      time_budget, target_margin, batch_size, skipped)
+        except (requests.RequestException, tarfile.TarError) as e:
+            st.error(f"Error fetching repository archive: {str(e)}")
         
         if file_results:
-            display_repo_analysis_results(file_results, owner, repo)
+            display_repo_analysis_results(file_results, owner, repo, estimate, skipped)
         else:
             st.error("❌ Failed to analyze any files from the repository.")
+            display_skipped_files(skipped)
+
+def render_local_repo_analysis():
+    """Render the local repository analysis interface"""
+    st.markdown("## 💻 Analyze Local Repository")
+    
+    analyzer = get_session_analyzer()
+    
+    col1, col2 = st.columns([2, 1])
+    
+    with col1:
+        repo_path = st.text_input(
+            "📁 Enter a directory or bare git repository path:",
+            placeholder="/path/to/checkout",
+            help="Working directories honor .gitignore; bare repositories are read at HEAD"
+        )
+    
+    with col2:
+        max_files = st.number_input(
+            "Max files to analyze:",
+            min_value=1,
+            max_value=1000,
+            value=100,
+            help="Most files to sample; sampling stops earlier once the estimate is precise enough",
+            key="local_max_files"
+        )
+        
+        languages = st.multiselect(
+            "Languages:",
+            list(LANGUAGE_MODEL_DIRS.keys()),
+            default=["python"],
+            help="Source files of these languages are analyzed with their own models",
+            key="local_languages"
+        )
+        
+        time_budget, target_margin = render_sampling_controls("local")
+    
+    if st.button("🔍 Analyze Directory", type="primary", use_container_width=True):
+        root = os.path.abspath(os.path.expanduser(repo_path.strip())) if repo_path.strip() else ""
+        if not root or not os.path.isdir(root):
+            st.warning("⚠️ Please enter an existing directory.")
+            return
+        
+        extensions = tuple(ext for ext, language in LANGUAGE_EXTENSIONS.items() if language in languages)
+        if not extensions:
+            st.warning("⚠️ Please select at least one language.")
+            return
+        
+        try:
+            with st.spinner(f"Listing files in {root}..."):
+                source_files = LocalRepoAnalyzer.list_source_files(root, extensions)
+        except (OSError, subprocess.CalledProcessError) as e:
+            st.error(f"❌ Error reading repository: {str(e)}")
+            return
+        
+        if not source_files:
+            st.warning("⚠️ No source files found in the directory.")
+            return
+        
+        source_files, skipped = partition_files(source_files)
+        if not source_files:
+            st.warning(f"⚠️ All {len(skipped)} source files are vendored, generated or boilerplate.")
+            display_skipped_files(skipped)
+            return
+        
+        st.info(f"📂 Found {len(source_files)} source files ({len(skipped)} skipped). "
+                f"Sampling up to {max_files} files...")
+        
+        file_results, estimate = [], None
+        try:
+            file_results, estimate = run_sampled_scan(
+                source_files, lambda batch: LocalRepoAnalyzer.iter_sources(root, batch), analyzer,
+                max_files, time_budget, target_margin, 4 * SCAN_WORKERS, skipped)
+        except (OSError, subprocess.CalledProcessError) as e:
+            st.error(f"❌ Error reading repository: {str(e)}")
+        
+        if file_results:
+            # Show results in listing order rather than completion order
+            file_results.sort(key=lambda r: r.file_path)
+            parent, name = os.path.split(root.rstrip(os.sep))
+            display_repo_analysis_results(file_results, os.path.basename(parent) or parent, name, estimate, skipped)
+        else:
+            st.error("❌ Failed to analyze any files from the directory.")
+            display_skipped_files(skipped)
+
+def display_skipped_files(skipped: List[Dict]):
+    """List files left out of the analysis and why"""
+    if not skipped:
+        return
+    
+    with st.expander(f"🚫 {len(skipped)} files skipped as vendored, generated or boilerplate"):
+        st.dataframe(
+            [{'File': f['path'], 'Reason': f['skip_reason']} for f in sorted(skipped, key=lambda f: f['path'])],
+            use_container_width=True
+        )
 
-def display_repo_analysis_results(file_results: List[FileAnalysisResult], owner: str, repo: str):
+def display_repo_analysis_results(file_results: List[FileAnalysisResult], owner: str, repo: str,
+                                  estimate: Optional[ShareEstimate] = None,
+                                  skipped: Optional[List[Dict]] = None):
     """Display results for repository analysis"""
     st.markdown("## 📊 Repository Analysis Results")
     st.markdown(f"### Repository: `{owner}/{repo}`")
     
+    display_skipped_files(skipped or [])
+    
+    if estimate is not None and estimate.sampled < estimate.population:
+        st.info(f"🎯 Sampled {estimate.sampled} of {estimate.population} files. "
+                f"Estimated AI share: **{estimate.share:.1%}** "
+                f"(95% CI {estimate.low:.1%} – {estimate.high:.1%})")
+    
     # Calculate repository summary
     total_files = len(file_results)
     ai_files = sum(1 for f in file_results if f.prediction == "ai")
     human_files = total_files - ai_files
+    # The stratified estimate corrects for unequal sampling across directories
+    ai_share = estimate.share if estimate is not None else ai_files / total_files
     
     avg_confidence = np.mean([f.confidence for f in file_results])
     total_lines = sum(f.line_count for f in file_results)
@@ -765,7 +1680,7 @@ def display_repo_analysis_results(file_results: List[FileAnalysisResult], owner:
     st.markdown("---")
     st.markdown("### 🧠 Repository Analysis Summary")
     
-    if ai_files / total_files > 0.7:
+    if ai_share > 0.7:
         st.error("🤖 **Predominantly AI-Generated Repository**")
         st.markdown(f"""
         This repository appears to be predominantly AI-generated:
@@ -778,7 +1693,7 @@ def display_repo_analysis_results(file_results: List[FileAnalysisResult], owner:
         - Documentation likely comprehensive but generic
         - May lack personal coding style or quirks
         """)
-    elif human_files / total_files > 0.7:
+    elif 1 - ai_share > 0.7:
         st.success("👨‍💻 **Predominantly Human-Written Repository**")
         st.markdown(f"""
         This repository appears to be predominantly human-written:
@@ -842,13 +1757,17 @@ def main():
     st.markdown("---")
     
     # Tabs for different analysis modes
-    tab1, tab2 = st.tabs(["📝 Single Code Analysis", "🔗 GitHub Repository Analysis"])
+    tab1, tab2, tab3 = st.tabs(["📝 Single Code Analysis", "🔗 GitHub Repository Analysis",
+                                "💻 Local Repository Analysis"])
     
     with tab1:
         render_single_code_analysis()
     
     with tab2:
         render_github_repo_analysis()
+    
+    with tab3:
+        render_local_repo_analysis()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+class CorpusStore:
+    """Content-addressed store for training files, indexed by a sqlite manifest
+
+    File bytes live once under objects/<first two hex digits>/<rest of the
+    sha256>, however many repos, forks or paths they were found at. The
+    manifest has one row per (repo, path) with the object's hash, size,
+    language, label and license, so training sets are selected with a query
+    instead of by listing directories.
+
+    Languages use the same keys as train.py's LANGUAGES ('python', 'java', 'js').
+    """
+
+    COLUMNS = ('sha', 'repo', 'path', 'language', 'label', 'license', 'size', 'added')
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.db_path = self.root / 'manifest.db'
+        self.objects.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "sha TEXT NOT NULL, repo TEXT NOT NULL, path TEXT NOT NULL, language TEXT NOT NULL, "
+                "label TEXT NOT NULL, license TEXT, size INTEGER NOT NULL, added REAL NOT NULL, "
+                "PRIMARY KEY (repo, path))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS files_selection ON files (language, label)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def object_path(self, sha: str) -> Path:
+        return self.objects / sha[:2] / sha[2:]
+
+    def put(self, content: Union[str, bytes], repo: str, path: str, language: str, label: str,
+            license: Optional[str] = None) -> str:
+        """Store a file's bytes (once) and record where it came from; returns its sha256"""
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        sha = hashlib.sha256(data).hexdigest()
+
+        target = self.object_path(sha)
+        if not target.exists():
+            target.parent.mkdir(exist_ok=True)
+            # Write then rename, so a crash never leaves a truncated object behind
+            partial = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            partial.write_bytes(data)
+            os.replace(partial, target)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files (sha, repo, path, language, label, license, size, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (sha, repo, path, language, label, license, len(data), time.time())
+            )
+        return sha
+
+    def read(self, sha: str) -> str:
+        return self.object_path(sha).read_text(encoding='utf-8', errors='ignore')
+
+    def query(self, distinct: bool = True, limit: Optional[int] = None, **filters) -> List[Dict]:
+        """Manifest rows matching column filters, e.g. query(language='python', label='human')
+
+        A filter value may be a single value or a list of allowed values. With
+        distinct, each (content, label) pair is returned once however many
+        paths it was found at. Rows are ordered by hash so the same query
+        always returns the same slice.
+        """
+        clauses, params = [], []
+        for column, value in filters.items():
+            if column not in self.COLUMNS:
+                raise ValueError(f"Unknown manifest column: {column}")
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        columns = ', '.join(self.COLUMNS)
+        if distinct:
+            # SQLite takes the bare columns from the row holding MIN(repo)
+            sql = (f"SELECT sha, MIN(repo), path, language, label, license, size, added FROM files{where} "
+                   f"GROUP BY sha, label ORDER BY sha")
+        else:
+            sql = f"SELECT {columns} FROM files{where} ORDER BY sha, repo, path"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+
+        with closing(self._connect()) as conn:
+            return [dict(zip(self.COLUMNS, row)) for row in conn.execute(sql, params)]
+
+    def import_directory(self, directory: Union[str, Path], language: str, label: str, extension: str,
+                         repo: str = 'local', license: Optional[str] = None) -> int:
+        """Add every file with the extension under a directory; returns how many were added"""
+        directory = Path(directory)
+        count = 0
+        for file_path in sorted(directory.rglob(f"*{extension}")):
+            if file_path.is_file():
+                self.put(file_path.read_bytes(), repo, file_path.relative_to(directory).as_posix(),
+                         language, label, license)
+                count += 1
+        return count
+
+    def stats(self) -> Dict:
+        with closing(self._connect()) as conn:
+            rows, objects, size = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT sha), COALESCE(SUM(size), 0) FROM files").fetchone()
+        return {"rows": rows, "objects": objects, "bytes": size}
+
+if __name__ == "__main__":
+    # Import the checked-in corpus: python corpus_store.py <store dir> [data dir]
+    store = CorpusStore(sys.argv[1] if len(sys.argv) > 1 else "data_store")
+    data_dir = Path(sys.argv[2] if len(sys.argv) > 2 else "data")
+    extensions = {'python': '.py', 'java': '.java', 'js': '.js'}
+    for language, extension in extensions.items():
+        for label_dir in sorted((data_dir / language).glob('*')):
+            if label_dir.is_dir():
+                label = label_dir.name.lower()
+                added = store.import_directory(label_dir, language, label, extension,
+                                               repo=f"{data_dir.name}/{language}/{label_dir.name}")
+                print(f"📥 {language}/{label}: {added} files")
+    print(f"✅ Corpus store: {store.stats()}")
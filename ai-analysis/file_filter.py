@@ -0,0 +1,117 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Directories holding third-party code at any depth
+VENDOR_DIRS = {
+    'vendor', 'vendors', 'third_party', 'thirdparty', 'node_modules', 'bower_components',
+    'site-packages', 'dist-packages', '.venv', '__generated__',
+}
+
+# Common names that are also ordinary packages (src/build/, app/env/), so they
+# only count as build output or environments at the top of the repository, or
+# when the next directory is one those tools create
+BUILD_DIRS = {'venv', 'env', 'dist', 'build', 'target', 'out', 'external', 'generated'}
+BUILD_OUTPUT_SUBDIRS = {'lib', 'bin', 'classes', 'generated-sources', 'intermediates'}
+
+# File paths that are generated or boilerplate, with the reason they are skipped
+GENERATED_PATHS = [
+    (re.compile(r'_pb2(_grpc)?\.py$|\.pb\.(go|js)$|_grpc_pb\.js$'), "protobuf generated code"),
+    (re.compile(r'(^|/)migrations/\d{4}_\w+\.py$'), "database migration"),
+    (re.compile(r'\.min\.(js|mjs|cjs)$|[.-]bundle\.js$|\.chunk\.js$'), "minified bundle"),
+    (re.compile(r'(^|/)(setup|conftest|manage)\.py$'), "project boilerplate"),
+    (re.compile(r'(^|/)(webpack|babel|jest|rollup|vite|eslint)\.config\.\w+$|(^|/)\.eslintrc\.js$'),
+     "tool configuration"),
+]
+
+# Header comments that tools write into the files they generate. A bare
+# "auto-generated" is not enough: AI assistants write that into their own
+# docstrings, and those files are exactly what the scan is looking for.
+GENERATED_MARKERS = re.compile(
+    r'@generated\b|do not (edit|modify)\b|generated by django \d'
+    r'|(file|code|module) (was |is )?(automatically |auto-?)?generated (by|from)'
+    r'(?!\s+(an?\s+)?(ai\b|assistant|chatgpt|gpt|claude|copilot|gemini|llm))'
+    r'|(autogenerated|auto-generated) (by|from) (?!(an?\s+)?(ai\b|assistant|chatgpt|gpt|claude|copilot|gemini|llm))',
+    re.IGNORECASE
+)
+
+# Files smaller than this say too little about their author
+MIN_FILE_BYTES = 64
+MIN_INIT_BYTES = 300
+
+# Only the head of a file is searched for generator markers
+HEADER_CHARS = 1000
+
+# Minified code packs a whole program into a few very long lines
+MAX_LINE_LENGTH = 1000
+MAX_AVG_LINE_LENGTH = 200
+
+# Bits per character above which a file is embedded data rather than code
+MAX_CHAR_ENTROPY = 5.5
+
+def vendor_dir(dirs: List[str]) -> Optional[str]:
+    """The directory in a path that marks it as vendored or build output, if any"""
+    lowered = [part.lower() for part in dirs]
+    for depth, part in enumerate(lowered):
+        if part in VENDOR_DIRS:
+            return dirs[depth]
+        if part in BUILD_DIRS and (depth == 0 or (depth + 1 < len(lowered) and
+                                                 lowered[depth + 1] in BUILD_OUTPUT_SUBDIRS)):
+            return dirs[depth]
+    return None
+
+def path_skip_reason(file_info: Dict) -> Optional[str]:
+    """Reason to skip a listed file from its path and size alone, or None to keep it"""
+    path = file_info['path']
+    parts = path.split('/')
+    vendored = vendor_dir(parts[:-1])
+    if vendored:
+        return f"vendored or build directory ({vendored}/)"
+
+    for pattern, reason in GENERATED_PATHS:
+        if pattern.search(path):
+            return reason
+
+    size = file_info.get('size')
+    if size is not None:
+        if parts[-1] == '__init__.py' and size < MIN_INIT_BYTES:
+            return "package __init__ boilerplate"
+        if size < MIN_FILE_BYTES:
+            return "too small to judge"
+    return None
+
+def char_entropy(text: str) -> float:
+    """Shannon entropy of the character distribution, in bits per character"""
+    if not text:
+        return 0.0
+    total = len(text)
+    return -sum(count / total * math.log2(count / total) for count in Counter(text).values())
+
+def content_skip_reason(file_info: Dict, code: str) -> Optional[str]:
+    """Reason to skip a fetched file from its content, or None to analyze it"""
+    if GENERATED_MARKERS.search(code[:HEADER_CHARS]):
+        return "generated file header"
+
+    lines = [line for line in code.split('\n') if line.strip()]
+    if not lines:
+        return "empty file"
+
+    lengths = [len(line) for line in lines]
+    if max(lengths) > MAX_LINE_LENGTH or sum(lengths) / len(lengths) > MAX_AVG_LINE_LENGTH:
+        return "minified code"
+
+    if char_entropy(code) > MAX_CHAR_ENTROPY:
+        return "high-entropy embedded data"
+    return None
+
+def partition_files(files: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Split a listing into files to analyze and skipped files, each tagged with a 'skip_reason'"""
+    kept, skipped = [], []
+    for file_info in files:
+        reason = path_skip_reason(file_info)
+        if reason:
+            skipped.append({**file_info, 'skip_reason': reason})
+        else:
+            kept.append(file_info)
+    return kept, skipped
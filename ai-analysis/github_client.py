@@ -0,0 +1,251 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+import requests
+import requests.adapters
+
+from analysis_cache import AnalysisCache
+
+class TokenBucket:
+    """Thread-safe token bucket: bursts of up to capacity requests, refilled at rate per second"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            self._sleep(wait)
+
+class ConcurrencyLimiter:
+    """Caps in-flight requests; the cap is halved on rate limiting and regrows by one per success"""
+
+    def __init__(self, limit: int):
+        self.max_limit = limit
+        self.limit = limit
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def __exit__(self, *exc):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def increase(self):
+        with self._condition:
+            if self.limit < self.max_limit:
+                self.limit += 1
+                self._condition.notify()
+
+    def decrease(self):
+        with self._condition:
+            self.limit = max(1, self.limit // 2)
+
+class GitHubClient:
+    """HTTP client for the GitHub API and raw file downloads, shared by the app and the scraper
+
+    - Requests to each host are paced by a token bucket. Once a response
+      carries X-RateLimit-Remaining and X-RateLimit-Reset, the host's rate
+      is set to spread the remaining budget over the time left in the window.
+    - The number of in-flight requests shrinks when GitHub rate-limits and
+      grows back as requests succeed.
+    - Rate-limited (429, or 403 with an exhausted or secondary limit),
+      5xx and connection failures are retried. Retries honor Retry-After and
+      X-RateLimit-Reset, and otherwise use exponential backoff with full jitter.
+    - get_json revalidates stored responses with If-None-Match. Unchanged
+      listings come back as 304s, which GitHub does not count against the
+      limit. With a cache_db the stored responses survive restarts.
+    """
+
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    # Token buckets start here and are retuned from the rate-limit headers
+    DEFAULT_RATE = 20.0
+    BURST = 20
+
+    # Hosts that receive the GITHUB_TOKEN; other hosts never see it
+    TOKEN_HOSTS = ('github.com', 'githubusercontent.com')
+
+    def __init__(self, token: Optional[str] = None, max_concurrency: int = 8, max_retries: int = 5,
+                 backoff: float = 1.0, max_wait: float = 60.0, cache_db: Optional[str] = None,
+                 timeout: float = 10.0, sleep: Callable[[float], None] = time.sleep):
+        self.token = token if token is not None else os.getenv("GITHUB_TOKEN")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.sleep = sleep
+        self.limiter = ConcurrencyLimiter(max_concurrency)
+        self.response_cache = AnalysisCache(max_entries=256, db_path=cache_db)
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max_concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.rate_limit_remaining: Optional[int] = None
+
+    def _bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.DEFAULT_RATE, self.BURST, sleep=self.sleep)
+            return self._buckets[host]
+
+    def _headers(self, url: str, headers: Optional[Dict]) -> Dict:
+        merged = {"Accept": "application/vnd.github+json"}
+        host = urlparse(url).hostname or ""
+        if self.token and any(host == h or host.endswith('.' + h) for h in self.TOKEN_HOSTS):
+            merged["Authorization"] = f"token {self.token}"
+        merged.update(headers or {})
+        return merged
+
+    def get(self, url: str, params: Optional[Dict] = None, headers: Optional[Dict] = None,
+            stream: bool = False, timeout: Optional[float] = None) -> requests.Response:
+        """GET with pacing and retries
+
+        Returns the final response, whatever its status, so callers keep using
+        raise_for_status(). Connection errors are raised once retries run out.
+        """
+        host = urlparse(url).netloc
+        request_headers = self._headers(url, headers)
+
+        for attempt in range(self.max_retries + 1):
+            self._bucket(host).acquire()
+            response = None
+            try:
+                with self.limiter:
+                    with self._lock:
+                        self.requests += 1
+                    response = self.session.get(url, params=params, headers=request_headers, stream=stream,
+                                                timeout=timeout or self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt)
+            else:
+                self._observe(host, response)
+                if not self._should_retry(response):
+                    if response.ok:
+                        self.limiter.increase()
+                    return response
+                delay = self._retry_delay(response, attempt)
+                if attempt == self.max_retries or delay > self.max_wait:
+                    return response
+                response.close()
+
+            with self._lock:
+                self.retries += 1
+            self.sleep(delay)
+
+    def get_json(self, url: str, params: Optional[Dict] = None):
+        """GET a JSON listing, revalidating a stored copy with If-None-Match"""
+        key = "etag:" + requests.Request('GET', url, params=params).prepare().url
+        stored = self.response_cache.get(key)
+        headers = {'If-None-Match': stored['etag']} if stored else {}
+
+        response = self.get(url, params=params, headers=headers)
+        if response.status_code == 304 and stored:
+            return stored['body']
+        response.raise_for_status()
+
+        body = response.json()
+        if response.headers.get('ETag'):
+            self.response_cache.put(key, {'etag': response.headers['ETag'], 'body': body})
+        return body
+
+    def _observe(self, host: str, response: requests.Response):
+        """Retune the host's pacing from its rate-limit headers"""
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        remaining = int(remaining)
+        with self._lock:
+            self.rate_limit_remaining = remaining
+        window = max(float(reset) - time.time(), 1.0)
+        # Spread what is left of the budget over the rest of the window, and
+        # never let an exhausted budget stall the bucket completely
+        self._bucket(host).set_rate(min(self.DEFAULT_RATE, max(remaining / window, 1 / window)))
+
+    def _is_rate_limited(self, response: requests.Response) -> bool:
+        if response.status_code == 429:
+            return True
+        return response.status_code == 403 and (
+            response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers
+        )
+
+    def _should_retry(self, response: requests.Response) -> bool:
+        if self._is_rate_limited(response):
+            with self._lock:
+                self.rate_limited += 1
+            self.limiter.decrease()
+            return True
+        return response.status_code in self.RETRY_STATUSES
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+
+        if response.headers.get('X-RateLimit-Remaining') == '0' and response.headers.get('X-RateLimit-Reset'):
+            # Wait for the window to reset, plus a little jitter so workers do not stampede
+            return max(float(response.headers['X-RateLimit-Reset']) - time.time(), 0.0) + random.uniform(0, 1)
+
+        return self._backoff_delay(attempt)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter: uniformly random up to the exponential bound
+        return random.uniform(0, min(self.max_wait, self.backoff * 2 ** attempt))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "rate_limit_remaining": self.rate_limit_remaining,
+                "concurrency": self.limiter.limit
+            }
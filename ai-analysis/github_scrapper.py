@@ -1,6 +1,14 @@
+import json
 import os
-import requests
+import queue
+import threading
+import time
 from pathlib import Path
+from urllib.parse import quote
+
+from corpus_store import CorpusStore
+from file_filter import content_skip_reason, path_skip_reason
+from github_client import GitHubClient
 
 # -----------------------------
 # Configuration
@@ -9,52 +17,301 @@ GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # 🔑 Set this in your environment va
 if not GITHUB_TOKEN:
     print("Warning: GITHUB_TOKEN not found in environment variables.")
 
-HEADERS = {"Authorization": f"token {GITHUB_TOKEN}"} if GITHUB_TOKEN else {}
+API_URL = "https://api.github.com"
+RAW_URL = "https://raw.githubusercontent.com"
+
+# Shared client: paces requests from the rate-limit headers, retries with backoff
+# and waits out an exhausted limit (up to an hour) instead of failing the run
+client = GitHubClient(token=GITHUB_TOKEN, max_wait=3600, cache_db=os.getenv("SCRAPER_CACHE_DB"))
 
 QUERY = "language:python stars:>500"  # Example: Python repos with >500 stars
-SAVE_DIR = Path("data_github/raw/python_human/")
-SAVE_DIR.mkdir(parents=True, exist_ok=True)
+LANGUAGE = "python"  # Manifest language key, as in train.py's LANGUAGES
+LABEL = "human"
+# Content-addressed store shared by every scrape; see corpus_store.py
+CORPUS_DIR = Path("data_github/corpus")
+# Completed repos and files, one JSON object per line, so a restarted run resumes
+CHECKPOINT_FILE = Path("data_github/raw/python_human.checkpoint.jsonl")
+
+MAX_REPOS = 100          # The search API returns at most 1000 results
+EXTENSIONS = (".py",)
+MIN_FILE_SIZE = 200
+MAX_FILE_SIZE = 200_000
+# Only permissively licensed repositories go into the corpus
+ALLOWED_LICENSES = {"mit", "apache-2.0", "bsd-2-clause", "bsd-3-clause", "isc", "unlicense"}
+
+DOWNLOAD_WORKERS = 8
+QUEUE_SIZE = 256
+# Seconds to wait for stage threads after an error or Ctrl-C before exiting anyway
+STOP_TIMEOUT = 5
 
 # -----------------------------
 # Helper: Search Repositories
 # -----------------------------
 def search_repositories(query, per_page=5, page=1):
-    url = "https://api.github.com/search/repositories"
+    url = f"{API_URL}/search/repositories"
     params = {"q": query, "sort": "stars", "order": "desc", "per_page": per_page, "page": page}
-    r = requests.get(url, headers=HEADERS, params=params)
-    r.raise_for_status()
-    return r.json()["items"]
+    return client.get_json(url, params=params)["items"]
+
+def iter_repositories(query, max_repos=MAX_REPOS, per_page=100):
+    """Yield search results page by page until max_repos or the results run out
+
+    GitHub computes each page's offset from per_page, so it stays the same
+    on every request and the last page is trimmed here instead.
+    """
+    per_page = min(per_page, max_repos)
+    page = 1
+    seen = 0
+    while seen < max_repos:
+        items = search_repositories(query, per_page=per_page, page=page)
+        for item in items[:max_repos - seen]:
+            yield item
+        seen += len(items)
+        if len(items) < per_page:
+            return
+        page += 1
 
 # -----------------------------
-# Helper: Download Code Files
+# Helper: Checkpoint
 # -----------------------------
-def fetch_repo_files(owner, repo, path=""):
-    url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
-    r = requests.get(url, headers=HEADERS)
-    if r.status_code == 200:
-        for item in r.json():
-            if item["type"] == "file" and item["name"].endswith(".py"):
-                download_file(item["download_url"], item["name"], repo)
-            elif item["type"] == "dir":
-                fetch_repo_files(owner, repo, item["path"])
+class Checkpoint:
+    """Append-only log of finished repos and files
+
+    Each line is {"repo": ..., "path": ...} for a finished file or
+    {"repo": ..., "done": true} for a finished repo. Lines are flushed as they
+    are written, so a crash loses at most the files still in flight.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done_repos = set()
+        self.done_files = set()
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A torn last line from a crash
+                    if entry.get("done"):
+                        self.done_repos.add(entry["repo"])
+                    else:
+                        self.done_files.add((entry["repo"], entry["path"]))
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
 
-def download_file(url, filename, repo_name):
-    r = requests.get(url)
-    if r.status_code == 200:
-        filepath = SAVE_DIR / f"{repo_name}_{filename}"
-        with open(filepath, "w", encoding="utf-8", errors="ignore") as f:
-            f.write(r.text)
-        print(f"✅ Saved {filepath}")
+    def file_done(self, repo, path):
+        self.done_files.add((repo, path))
+        self._append({"repo": repo, "path": path})
+
+    def repo_done(self, repo):
+        self.done_repos.add(repo)
+        self._append({"repo": repo, "done": True})
+
+    def close(self):
+        self._file.close()
+
+# -----------------------------
+# Pipeline stages
+# -----------------------------
+def walk_repo_contents(owner, repo, ref, path=""):
+    """Every file under path, one contents API request per directory"""
+    items = []
+    for entry in client.get_json(f"{API_URL}/repos/{owner}/{repo}/contents/{quote(path)}", params={"ref": ref}):
+        if entry["type"] == "dir":
+            items.extend(walk_repo_contents(owner, repo, ref, entry["path"]))
+        elif entry["type"] == "file":
+            items.append({"path": entry["path"], "size": entry.get("size", 0), "type": "blob"})
+    return items
+
+def list_repo_files(owner, repo, ref):
+    """Source files of a repository worth downloading, from one recursive tree call
+
+    Large repositories get a truncated tree; those are listed by walking the
+    contents API instead, so no files are silently missed.
+    """
+    tree = client.get_json(f"{API_URL}/repos/{owner}/{repo}/git/trees/{ref}", params={"recursive": 1})
+    items = walk_repo_contents(owner, repo, ref) if tree.get("truncated") else tree.get("tree", [])
+    files = []
+    for item in items:
+        if item["type"] != "blob" or not item["path"].endswith(EXTENSIONS):
+            continue
+        if not MIN_FILE_SIZE <= item.get("size", 0) <= MAX_FILE_SIZE or path_skip_reason(item):
+            continue
+        files.append(item)
+    return files
+
+class ScrapePipeline:
+    """search -> list -> download -> write, joined by bounded queues
+
+    Searching and listing each run in one thread, downloads in
+    DOWNLOAD_WORKERS threads, and a single writer owns the corpus store
+    and the checkpoint. The bounded queues keep a fast stage from
+    running far ahead of a slow one. If the writer fails or the run is
+    interrupted, the stop event releases stages blocked on a queue so the
+    process exits and can be resumed from the checkpoint.
+    """
+
+    def __init__(self, query=QUERY, max_repos=MAX_REPOS, checkpoint_file=CHECKPOINT_FILE,
+                 download_workers=DOWNLOAD_WORKERS, corpus_dir=CORPUS_DIR):
+        self.query = query
+        self.corpus_dir = corpus_dir
+        self.max_repos = max_repos
+        self.download_workers = download_workers
+        self.checkpoint = Checkpoint(checkpoint_file)
+        self.repos = queue.Queue(QUEUE_SIZE)
+        self.files = queue.Queue(QUEUE_SIZE)
+        self.results = queue.Queue(QUEUE_SIZE)
+        self.stats = {"repos": 0, "saved": 0, "skipped": 0, "failed": 0}
+        self.stop_event = threading.Event()
+
+    def _put(self, q, item):
+        """Put item on a queue unless the pipeline is stopping; returns False once it is"""
+        while not self.stop_event.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """Next item from a queue, or None once the pipeline is stopping"""
+        while not self.stop_event.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return None
+
+    def search_stage(self):
+        queued = set()
+        try:
+            for item in iter_repositories(self.query, self.max_repos):
+                full_name = item["full_name"]
+                license_key = (item.get("license") or {}).get("key")
+                # Results can shift between pages as star counts change
+                if full_name in self.checkpoint.done_repos or full_name in queued:
+                    continue
+                if license_key not in ALLOWED_LICENSES:
+                    print(f"⏭️  Skipping {full_name}: license {license_key}")
+                    continue
+                queued.add(full_name)
+                if not self._put(self.repos, item):
+                    return
+        except Exception as e:
+            print(f"❌ Search failed: {e}")
+        finally:
+            self._put(self.repos, None)
+
+    def list_stage(self):
+        try:
+            while (item := self._get(self.repos)) is not None:
+                owner, name = item["owner"]["login"], item["name"]
+                full_name, ref = item["full_name"], item.get("default_branch", "HEAD")
+                license_key = (item.get("license") or {}).get("key")
+                try:
+                    files = list_repo_files(owner, name, ref)
+                except Exception as e:
+                    print(f"❌ Listing {full_name} failed: {e}")
+                    continue
+
+                pending = [f for f in files if (full_name, f["path"]) not in self.checkpoint.done_files]
+                print(f"\n📂 {full_name}: {len(pending)} files to fetch ({len(files) - len(pending)} already saved)")
+                # The writer marks the repo done after this many results come back
+                if not self._put(self.results, ("repo", full_name, len(pending))):
+                    return
+                for f in pending:
+                    url = f"{RAW_URL}/{owner}/{name}/{ref}/{quote(f['path'])}"
+                    if not self._put(self.files, (full_name, license_key, f["path"], url)):
+                        return
+        finally:
+            for _ in range(self.download_workers):
+                self._put(self.files, None)
+
+    def download_stage(self):
+        try:
+            while (task := self._get(self.files)) is not None:
+                full_name, license_key, path, url = task
+                try:
+                    r = client.get(url)
+                    r.raise_for_status()
+                    reason = content_skip_reason({"path": path}, r.text)
+                    result = ("file", full_name, license_key, path, None if reason else r.text, reason)
+                except Exception as e:
+                    result = ("file", full_name, license_key, path, None, f"error: {e}")
+                if not self._put(self.results, result):
+                    return
+        finally:
+            self._put(self.results, None)
+
+    def write_stage(self):
+        store = CorpusStore(self.corpus_dir)
+        expected, finished, failed = {}, {}, set()
+        finished_workers = 0
+
+        def finish_if_complete(full_name):
+            if full_name in expected and finished.get(full_name, 0) >= expected[full_name]:
+                # A repo with failed downloads stays open so a rerun retries them
+                if full_name not in failed:
+                    self.checkpoint.repo_done(full_name)
+                self.stats["repos"] += 1
+                del expected[full_name]
+
+        while finished_workers < self.download_workers:
+            result = self.results.get()
+            if result is None:
+                finished_workers += 1
+                continue
+
+            if result[0] == "repo":
+                _, full_name, count = result
+                expected[full_name] = count
+                finish_if_complete(full_name)
+                continue
+
+            _, full_name, license_key, path, text, reason = result
+            if text is not None:
+                sha = store.put(text, full_name, path, LANGUAGE, LABEL, license_key)
+                self.stats["saved"] += 1
+                print(f"✅ Saved {full_name}/{path} ({sha[:12]})")
+            elif reason.startswith("error"):
+                self.stats["failed"] += 1
+                failed.add(full_name)
+                print(f"⚠️  {full_name}/{path}: {reason}")
+            else:
+                self.stats["skipped"] += 1
+
+            # Failed downloads are left out of the checkpoint so a rerun retries them
+            if text is not None or not reason.startswith("error"):
+                self.checkpoint.file_done(full_name, path)
+            finished[full_name] = finished.get(full_name, 0) + 1
+            finish_if_complete(full_name)
+
+    def run(self):
+        # Daemon threads, so a download stuck in a long retry wait cannot keep the process alive
+        stages = [self.search_stage, self.list_stage] + [self.download_stage] * self.download_workers
+        threads = [threading.Thread(target=stage, daemon=True) for stage in stages]
+        for thread in threads:
+            thread.start()
+        try:
+            self.write_stage()
+        finally:
+            # Release stages blocked on a queue; unfinished files stay out of the checkpoint
+            self.stop_event.set()
+            deadline = time.monotonic() + STOP_TIMEOUT
+            for thread in threads:
+                thread.join(timeout=max(0.0, deadline - time.monotonic()))
+            self.checkpoint.close()
+        return self.stats
 
 # -----------------------------
 # Main
 # -----------------------------
 if __name__ == "__main__":
     print("🔍 Searching for repositories...")
-    repos = search_repositories(QUERY, per_page=3, page=1)  # change per_page for more
-
-    for repo in repos:
-        owner = repo["owner"]["login"]
-        name = repo["name"]
-        print(f"\n📂 Fetching repo: {owner}/{name}")
-        fetch_repo_files(owner, name)
+    stats = ScrapePipeline().run()
+    print(f"\n🏁 Done: {stats}")
@@ -0,0 +1,189 @@
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from analysis_cache import git_blob_sha
+
+class GitIgnore:
+    """Rules from one .gitignore file, matched against paths relative to its directory
+
+    Supports the common syntax: globs with *, ? and **, negation with !,
+    directory-only patterns ending in / and patterns anchored by a /.
+    """
+
+    def __init__(self, lines: List[str]):
+        self.rules = []
+        for line in lines:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.strip('/') if dir_only else line
+            # A slash anywhere but the end anchors the pattern to this directory
+            anchored = '/' in line
+            line = line.lstrip('/')
+
+            regex = self._translate(line)
+            if not anchored:
+                regex = '(?:.*/)?' + regex
+            self.rules.append((re.compile(regex + '$'), negate, dir_only))
+
+    @classmethod
+    def load(cls, path: str) -> Optional['GitIgnore']:
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                return cls(f.readlines())
+        except OSError:
+            return None
+
+    @staticmethod
+    def _translate(pattern: str) -> str:
+        regex = ''
+        i = 0
+        while i < len(pattern):
+            if pattern.startswith('**/', i):
+                regex += '(?:.*/)?'
+                i += 3
+            elif pattern.startswith('**', i):
+                regex += '.*'
+                i += 2
+            elif pattern[i] == '*':
+                regex += '[^/]*'
+                i += 1
+            elif pattern[i] == '?':
+                regex += '[^/]'
+                i += 1
+            elif pattern[i] == '[' and ']' in pattern[i + 1:]:
+                end = pattern.index(']', i + 1)
+                regex += '[' + pattern[i + 1:end].replace('!', '^', 1) + ']'
+                i = end + 1
+            else:
+                regex += re.escape(pattern[i])
+                i += 1
+        return regex
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """True if ignored, False if re-included, None if no rule applies (last rule wins)"""
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+class LocalRepoAnalyzer:
+    """Class for analyzing repositories on the local filesystem"""
+
+    # Same limit as GitHub scans: larger files are generated or data files
+    MAX_FILE_SIZE = 200_000
+
+    @staticmethod
+    def is_bare_repo(path: str) -> bool:
+        """A bare git repository has HEAD, objects and refs at its top level"""
+        root = Path(path)
+        return all((root / name).exists() for name in ('HEAD', 'objects', 'refs')) and not (root / '.git').exists()
+
+    @staticmethod
+    def list_source_files(path: str, extensions: Tuple[str, ...] = ('.py',),
+                          max_size: int = MAX_FILE_SIZE) -> List[Dict]:
+        """List source files under a directory, or in HEAD of a bare git repository
+
+        Items have the same keys as GitHub listings, with 'path' relative to
+        the root. Bare repositories also give each file's blob 'sha'.
+        """
+        if LocalRepoAnalyzer.is_bare_repo(path):
+            return LocalRepoAnalyzer._list_git_tree(path, extensions, max_size)
+        return LocalRepoAnalyzer._walk_directory(path, extensions, max_size)
+
+    @staticmethod
+    def _walk_directory(root: str, extensions: Tuple[str, ...], max_size: int) -> List[Dict]:
+        files = []
+        root_ignores = [('', GitIgnore.load(os.path.join(root, '.git', 'info', 'exclude')))]
+        stack = [('', root_ignores)]
+
+        while stack:
+            rel_dir, ignores = stack.pop()
+            abs_dir = os.path.join(root, rel_dir)
+            gitignore = GitIgnore.load(os.path.join(abs_dir, '.gitignore'))
+            if gitignore:
+                ignores = ignores + [(rel_dir, gitignore)]
+
+            try:
+                entries = sorted(os.scandir(abs_dir), key=lambda e: e.name)
+            except OSError:
+                continue
+
+            for entry in entries:
+                if entry.name == '.git':
+                    continue
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if LocalRepoAnalyzer._is_ignored(ignores, rel_path, is_dir):
+                    continue
+
+                if is_dir:
+                    stack.append((rel_path, ignores))
+                elif entry.is_file(follow_symlinks=False) and entry.name.endswith(extensions):
+                    size = entry.stat().st_size
+                    if size <= max_size:
+                        files.append({'name': entry.name, 'path': rel_path, 'size': size, 'type': 'file'})
+
+        return sorted(files, key=lambda f: f['path'])
+
+    @staticmethod
+    def _is_ignored(ignores: List[Tuple[str, GitIgnore]], rel_path: str, is_dir: bool) -> bool:
+        ignored = False
+        # Deeper .gitignore files come later and override shallower ones
+        for base, gitignore in ignores:
+            if gitignore is None:
+                continue
+            local_path = rel_path[len(base) + 1:] if base else rel_path
+            result = gitignore.match(local_path, is_dir)
+            if result is not None:
+                ignored = result
+        return ignored
+
+    @staticmethod
+    def _git(repo: str, *args: str) -> bytes:
+        return subprocess.run(['git', f'--git-dir={repo}', *args], capture_output=True, check=True).stdout
+
+    @staticmethod
+    def _list_git_tree(repo: str, extensions: Tuple[str, ...], max_size: int, ref: str = 'HEAD') -> List[Dict]:
+        files = []
+        # Each line: "<mode> <type> <sha> <size>\t<path>"
+        for line in LocalRepoAnalyzer._git(repo, 'ls-tree', '-r', '-l', '-z', ref).split(b'\0'):
+            if not line:
+                continue
+            meta, path = line.decode('utf-8', errors='replace').split('\t', 1)
+            _, kind, sha, size = meta.split()
+            if kind == 'blob' and path.endswith(extensions) and size != '-' and int(size) <= max_size:
+                files.append({'name': path.rsplit('/', 1)[-1], 'path': path, 'sha': sha,
+                              'size': int(size), 'type': 'file'})
+        return files
+
+    @staticmethod
+    def read_file(root: str, file_info: Dict) -> bytes:
+        """Raw bytes of a listed file, from disk or from the git object store"""
+        if 'sha' in file_info and LocalRepoAnalyzer.is_bare_repo(root):
+            return LocalRepoAnalyzer._git(root, 'cat-file', 'blob', file_info['sha'])
+        with open(os.path.join(root, file_info['path']), 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def load_source(root: str, file_info: Dict) -> Tuple[Dict, str]:
+        """Read a listed file, returning its info with the blob 'sha' filled in and its text"""
+        data = LocalRepoAnalyzer.read_file(root, file_info)
+        return {**file_info, 'sha': file_info.get('sha') or git_blob_sha(data)}, data.decode('utf-8', errors='replace')
+
+    @staticmethod
+    def iter_sources(root: str, files: List[Dict]) -> Iterator[Tuple[Dict, str]]:
+        """(file_info, code) for each listed file, in listing order, for a ScanEngine"""
+        for file_info in files:
+            yield LocalRepoAnalyzer.load_source(root, file_info)
@@ -0,0 +1,130 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Hashable, List, Sequence
+
+import numpy as np
+
+# Tokens for shingling: identifiers, numbers and single punctuation characters
+TOKEN_PATTERN = re.compile(r'[A-Za-z_]\w*|\d+|[^\w\s]')
+# Comments differ most between rewrites of the same program, so they are not shingled
+COMMENT_PATTERN = re.compile(r'#[^\n]*|//[^\n]*|/\*.*?\*/|"""(?:.|\n)*?"""|\'\'\'(?:.|\n)*?\'\'\'', re.DOTALL)
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+def shingles(code: str, size: int = 5) -> np.ndarray:
+    """32-bit hashes of the distinct size-token windows of code, comments removed"""
+    tokens = TOKEN_PATTERN.findall(COMMENT_PATTERN.sub(' ', code).lower())
+    if len(tokens) < size:
+        tokens = tokens + [''] * (size - len(tokens))
+    windows = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+    return np.fromiter((zlib.crc32(w.encode('utf-8')) for w in windows), dtype=np.uint64, count=len(windows))
+
+class MinHasher:
+    """MinHash signatures: num_perm minimums over random linear hashes of a file's shingles
+
+    The fraction of positions where two signatures agree estimates the
+    Jaccard similarity of the two shingle sets.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 42):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(1, 1 << 61, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 61, size=num_perm, dtype=np.uint64)
+
+    def signature(self, code: str) -> np.ndarray:
+        hashes = shingles(code, self.shingle_size)
+        # uint64 arithmetic wraps around; the low 32 bits are still well mixed
+        with np.errstate(over='ignore'):
+            permuted = (np.outer(self.a, hashes) + self.b[:, None]) % MERSENNE_PRIME & MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+
+def jaccard_estimate(first: np.ndarray, second: np.ndarray) -> float:
+    return float(np.mean(first == second))
+
+class NearDuplicateIndex:
+    """LSH over MinHash signatures: files sharing any band of rows become candidate pairs
+
+    Each signature is cut into bands of rows_per_band values, and every band
+    is a bucket key. Only files that share a bucket are compared, so indexing
+    stays roughly linear in the number of files instead of quadratic.
+    Candidates whose estimated similarity reaches threshold are joined into
+    the same cluster.
+    """
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 128, bands: int = 32):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.keys: List[Hashable] = []
+        self.signatures: List[np.ndarray] = []
+        self._buckets = defaultdict(list)
+        self._parent: List[int] = []
+
+    def _find(self, item: int) -> int:
+        while self._parent[item] != item:
+            self._parent[item] = self._parent[self._parent[item]]
+            item = self._parent[item]
+        return item
+
+    def _union(self, first: int, second: int):
+        root_first, root_second = self._find(first), self._find(second)
+        if root_first != root_second:
+            self._parent[max(root_first, root_second)] = min(root_first, root_second)
+
+    def add(self, key: Hashable, signature: np.ndarray):
+        item = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(signature)
+        self._parent.append(item)
+
+        compared = set()
+        for band in range(self.bands):
+            rows = signature[band * self.rows_per_band:(band + 1) * self.rows_per_band]
+            bucket = self._buckets[(band, rows.tobytes())]
+            for other in bucket:
+                if other not in compared:
+                    compared.add(other)
+                    if jaccard_estimate(signature, self.signatures[other]) >= self.threshold:
+                        self._union(item, other)
+            bucket.append(item)
+
+    def groups(self) -> np.ndarray:
+        """Cluster id per added file, in insertion order; ids are the first member's position"""
+        return np.array([self._find(item) for item in range(len(self.keys))], dtype=int)
+
+    def clusters(self) -> List[List[Hashable]]:
+        """Keys of every cluster with more than one member"""
+        members: Dict[int, List[Hashable]] = defaultdict(list)
+        for key, group in zip(self.keys, self.groups()):
+            members[group].append(key)
+        return [keys for keys in members.values() if len(keys) > 1]
+
+def near_duplicate_groups(codes: Sequence[str], threshold: float = 0.7, num_perm: int = 128,
+                          bands: int = 32, shingle_size: int = 5) -> np.ndarray:
+    """Cluster id per code sample; near-duplicates share an id"""
+    hasher = MinHasher(num_perm, shingle_size)
+    index = NearDuplicateIndex(threshold, num_perm, bands)
+    for position, code in enumerate(codes):
+        index.add(position, hasher.signature(code))
+    return index.groups()
+
+def dedupe_rows(groups: Sequence[int], labels: Sequence[str]) -> np.ndarray:
+    """Positions to keep: the first sample of each (cluster, label) pair
+
+    Near-duplicates with different labels are all kept, since they are
+    different examples of each class; group-aware splitting keeps them on
+    the same side.
+    """
+    seen = set()
+    keep = []
+    for position, key in enumerate(zip(groups, labels)):
+        if key not in seen:
+            seen.add(key)
+            keep.append(position)
+    return np.array(keep, dtype=int)
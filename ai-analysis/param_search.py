@@ -0,0 +1,201 @@
+import itertools
+import json
+import math
+import os
+import random
+import sys
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer
+from sklearn.metrics import classification_report, f1_score
+from sklearn.preprocessing import LabelEncoder
+
+import train
+
+# Vectorizer settings tried for every language
+NGRAM_RANGES = [(2, 4), (2, 6), (3, 5), (3, 7)]
+MAX_FEATURES = [2000, 5000, 10000]
+
+# Model settings tried on top of train.MODEL_PARAMS
+MODEL_GRID = {
+    'logistic': {'C': [0.1, 1.0, 10.0]},
+    'random_forest': {'n_estimators': [100, 300], 'max_depth': [None, 30]},
+    'gradient_boost': {'n_estimators': [100, 200], 'learning_rate': [0.05, 0.1]},
+    'xgboost': {'max_depth': [4, 6], 'learning_rate': [0.05, 0.1]}
+}
+
+# Each rung keeps the best 1/ETA of the candidates and gives them ETA times the data
+ETA = 3
+MIN_SAMPLES = 30
+N_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", "54"))
+SEARCH_DIR = os.getenv("SEARCH_DIR", "search_results")
+
+def candidate_grid() -> List[Dict]:
+    """Every (vectorizer, model, params) combination in the search space"""
+    candidates = []
+    for ngram_range, max_features in itertools.product(NGRAM_RANGES, MAX_FEATURES):
+        vectorizer = {'analyzer': 'char', 'ngram_range': ngram_range, 'max_features': max_features}
+        for model_name, grid in MODEL_GRID.items():
+            for values in itertools.product(*grid.values()):
+                candidates.append({'vectorizer': vectorizer, 'model': model_name,
+                                   'params': dict(zip(grid.keys(), values))})
+    return candidates
+
+def stratified_order(labels, seed: int = 42) -> np.ndarray:
+    """Row order in which every prefix has roughly the overall class balance"""
+    rng = np.random.RandomState(seed)
+    labels = np.asarray(labels)
+    keys = np.empty(len(labels))
+    for label in np.unique(labels):
+        rows = np.flatnonzero(labels == label)
+        rng.shuffle(rows)
+        # Spread each class evenly over [0, 1) so sorting interleaves them
+        keys[rows] = (np.arange(len(rows)) + rng.rand()) / len(rows)
+    return np.argsort(keys, kind='stable')
+
+class NgramCache:
+    """Char n-gram counts per ngram_range, shared by every candidate that uses it
+
+    Extracting the n-grams dominates the cost of a candidate, and it only
+    depends on the n-gram range. Each range is counted once over all search
+    rows. A candidate then picks its max_features columns from the rows it
+    is trained on and applies TF-IDF, which gives the same features as
+    fitting train.make_vectorizer on those rows.
+    """
+
+    def __init__(self, codes: List[str]):
+        self.codes = codes
+        self._counts = {}
+
+    def counts(self, ngram_range: Tuple[int, int]):
+        key = tuple(ngram_range)
+        if key not in self._counts:
+            vectorizer = CountVectorizer(analyzer='char', ngram_range=key, strip_accents='unicode', lowercase=True)
+            self._counts[key] = vectorizer.fit_transform(self.codes).tocsr()
+        return self._counts[key]
+
+    def features(self, config: Dict, fit_rows: np.ndarray, eval_rows: np.ndarray):
+        """TF-IDF matrices for fit_rows and eval_rows, with the vocabulary fitted on fit_rows only"""
+        counts = self.counts(config['ngram_range'])
+        term_counts = np.asarray(counts[fit_rows].sum(axis=0)).ravel()
+        present = np.flatnonzero(term_counts)
+        # The same selection, tie-breaking included, as TfidfVectorizer's max_features
+        keep = (-term_counts[present]).argsort()[:config['max_features']]
+        columns = np.sort(present[keep])
+
+        tfidf = TfidfTransformer().fit(counts[fit_rows][:, columns])
+        return (tfidf.transform(counts[fit_rows][:, columns]),
+                tfidf.transform(counts[eval_rows][:, columns]))
+
+def evaluate(candidate: Dict, cache: NgramCache, labels: np.ndarray, le: LabelEncoder,
+             fit_rows: np.ndarray, eval_rows: np.ndarray, threads: int = 1) -> float:
+    """Macro F1 of a candidate trained on fit_rows and scored on eval_rows"""
+    X_fit, X_eval = cache.features(candidate['vectorizer'], fit_rows, eval_rows)
+    model = train.make_model(candidate['model'], threads, **candidate['params'])
+    model.fit(X_fit, le.transform(labels[fit_rows]))
+    return f1_score(le.transform(labels[eval_rows]), model.predict(X_eval), average='macro')
+
+def successive_halving(candidates: List[Dict], cache: NgramCache, labels: np.ndarray,
+                       train_rows: np.ndarray, val_rows: np.ndarray, eta: int = ETA,
+                       min_samples: int = MIN_SAMPLES, threads: int = 1) -> List[Tuple[float, Dict]]:
+    """Score candidates on growing slices of train_rows, keeping the best 1/eta each rung
+
+    Returns the last rung's (score, candidate) pairs, best first. The last
+    rung always trains on all of train_rows.
+    """
+    le = LabelEncoder().fit(labels)
+    train_rows = train_rows[stratified_order(labels[train_rows])]
+    rungs = max(1, math.ceil(math.log(len(candidates), eta)))
+    survivors = list(candidates)
+
+    for rung in range(rungs + 1):
+        n_samples = len(train_rows) if rung == rungs else max(
+            min_samples, len(train_rows) // eta ** (rungs - rung))
+        n_samples = min(n_samples, len(train_rows))
+        fit_rows = train_rows[:n_samples]
+
+        scored = []
+        for candidate in survivors:
+            try:
+                score = evaluate(candidate, cache, labels, le, fit_rows, val_rows, threads)
+            except ValueError as e:
+                # Too few rows for this candidate (e.g. one class in a tiny slice)
+                print(f"⚠️  Skipping {describe(candidate)}: {e}")
+                continue
+            scored.append((score, candidate))
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+
+        print(f"\n🪜 Rung {rung}: {len(survivors)} candidates on {n_samples} samples")
+        for score, candidate in scored[:5]:
+            print(f"   {score:.3f}  {describe(candidate)}")
+
+        if rung == rungs or len(scored) <= 1:
+            return scored
+        survivors = [candidate for _, candidate in scored[:max(1, len(scored) // eta)]]
+    return scored
+
+def describe(candidate: Dict) -> str:
+    vectorizer = candidate['vectorizer']
+    params = ', '.join(f"{k}={v}" for k, v in candidate['params'].items())
+    return (f"{candidate['model']}({params}) on {vectorizer['ngram_range']} "
+            f"x {vectorizer['max_features']}")
+
+def search_language(lang: str, codes: List[str], labels: List[str], groups: Optional[List[str]] = None,
+                    n_candidates: int = N_CANDIDATES, seed: int = 42,
+                    threads: int = train.TRAIN_CPUS) -> Optional[Dict]:
+    """Successive-halving search for one language; returns the best candidate and its test report"""
+    labels = np.asarray(labels)
+    groups = np.asarray(groups) if groups is not None else None
+    # Same held-out test rows as train.split_features; validation comes from the training part
+    train_rows, test_rows = train.split_rows(labels, groups)
+    fit, val = train.split_rows(labels[train_rows], groups[train_rows] if groups is not None else None,
+                                test_size=0.25, random_state=seed)
+    train_rows, val_rows = train_rows[fit], train_rows[val]
+
+    candidates = candidate_grid()
+    random.Random(seed).shuffle(candidates)
+    candidates = candidates[:n_candidates]
+
+    cache = NgramCache(codes)
+    scored = successive_halving(candidates, cache, labels, train_rows, val_rows, threads=threads)
+    if not scored:
+        return None
+    val_score, best = scored[0]
+
+    # Refit the winner on all training rows and report on the untouched test rows
+    fit_rows = np.concatenate([train_rows, val_rows])
+    le = LabelEncoder().fit(labels)
+    X_fit, X_test = cache.features(best['vectorizer'], fit_rows, test_rows)
+    model = train.make_model(best['model'], threads, **best['params'])
+    model.fit(X_fit, le.transform(labels[fit_rows]))
+    predictions = le.inverse_transform(model.predict(X_test))
+    print(f"\n🏆 Best for {lang}: {describe(best)}")
+    print(classification_report(labels[test_rows], predictions))
+
+    return {
+        'language': lang,
+        'vectorizer': best['vectorizer'],
+        'model': best['model'],
+        'params': best['params'],
+        'validation_f1': val_score,
+        'test_f1': f1_score(labels[test_rows], predictions, average='macro')
+    }
+
+if __name__ == "__main__":
+    # python param_search.py [language ...]
+    languages = sys.argv[1:] or list(train.LANGUAGES)
+    df = train.index_near_duplicates(train.load_corpus())
+    os.makedirs(SEARCH_DIR, exist_ok=True)
+    for lang in languages:
+        lang_df = df[df['language'] == lang] if not df.empty else df
+        if lang_df.empty:
+            print(f"\nSkipping {lang} - no data found")
+            continue
+
+        print(f"\n=== Searching settings for {lang.upper()} ===")
+        result = search_language(lang, list(lang_df['code']), list(lang_df['label']), list(lang_df['group']))
+        if result:
+            with open(os.path.join(SEARCH_DIR, f"{lang}.json"), "w") as f:
+                json.dump(result, f, indent=2)
+            print(f"💾 Saved {SEARCH_DIR}/{lang}.json")
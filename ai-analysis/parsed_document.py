@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import List, Union
+
+import numpy as np
+
+from pattern_scanner import PatternScanner
+
+# Per-line structure flags, matched on each line's own text
+STRUCTURE_SCANNER = PatternScanner({
+    'blank': r'^\s*$',
+    'comment': r'^\s*#',
+})
+
+@dataclass
+class ParsedDocument:
+    """A submission split into lines once, with per-line structure held in NumPy arrays
+
+    Every analysis stage takes a ParsedDocument (or raw code, which is parsed
+    on the spot), so one request splits and measures its text a single time.
+    """
+    text: str
+    lines: List[str]
+    line_offsets: np.ndarray    # offset of each line's first character in text
+    line_lengths: np.ndarray
+    blank: np.ndarray           # True for empty or whitespace-only lines
+    comment: np.ndarray         # True for lines whose first non-blank character is '#'
+
+    @classmethod
+    def parse(cls, text: str) -> 'ParsedDocument':
+        lines = text.split('\n')
+        line_lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+        line_offsets = np.zeros(len(lines), dtype=np.int64)
+        np.cumsum(line_lengths[:-1] + 1, out=line_offsets[1:])
+
+        structure = STRUCTURE_SCANNER.scan(text, newlines=line_offsets[1:] - 1)
+
+        return cls(
+            text=text,
+            lines=lines,
+            line_offsets=line_offsets,
+            line_lengths=line_lengths,
+            blank=structure[:, 0],
+            comment=structure[:, 1]
+        )
+
+    @classmethod
+    def of(cls, code: Union[str, 'ParsedDocument']) -> 'ParsedDocument':
+        """Return code unchanged if it is already parsed, otherwise parse it"""
+        return code if isinstance(code, ParsedDocument) else cls.parse(code)
+
+    @staticmethod
+    def text_of(code: Union[str, 'ParsedDocument']) -> str:
+        """Raw text of code, whether or not it has been parsed"""
+        return code.text if isinstance(code, ParsedDocument) else code
+
+    @property
+    def newline_offsets(self) -> np.ndarray:
+        return self.line_offsets[1:] - 1
+
+    @property
+    def line_count(self) -> int:
+        return len(self.lines)
+
+    @property
+    def nonblank_indices(self) -> np.ndarray:
+        return np.flatnonzero(~self.blank)
+
+    @property
+    def nonblank_count(self) -> int:
+        return int(np.count_nonzero(~self.blank))
+
+    @property
+    def avg_line_length(self) -> float:
+        """Mean length of non-blank lines (NaN when there are none)"""
+        return np.mean(self.line_lengths[~self.blank])
+
+    @property
+    def empty_line_ratio(self) -> float:
+        return np.count_nonzero(self.blank) / max(self.line_count, 1)
+
+    @property
+    def comment_ratio(self) -> float:
+        return np.count_nonzero(self.comment) / max(self.line_count, 1)
+
+    def scan(self, scanner: PatternScanner) -> np.ndarray:
+        """Run a PatternScanner over this document, reusing its newline offsets"""
+        return scanner.scan(self.text, newlines=self.newline_offsets)
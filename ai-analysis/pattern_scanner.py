@@ -0,0 +1,84 @@
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+
+class PatternScanner:
+    """Precompiled multi-pattern scanner for line-level regexes
+
+    Matching per line with re.search costs one regex dispatch per pattern per
+    line. The scanner instead runs each precompiled pattern once over the whole
+    text in MULTILINE mode and maps match offsets back to line numbers, giving
+    the same per-line results.
+
+    Patterns are rewritten so a match can never cross a newline: \\s becomes
+    "whitespace except newline". With strip_lines=True the results match
+    searching line.strip(): ^ also skips leading whitespace, and \\s only
+    matches whitespace followed by more text on the same line.
+    """
+
+    # Whitespace that per-line matching could have seen
+    LINE_WHITESPACE = r'[^\S\n]'
+
+    def __init__(self, patterns: Dict[str, str], flags: int = 0, strip_lines: bool = False):
+        self.names = list(patterns.keys())
+        self.strip_lines = strip_lines
+        self._compiled = [
+            re.compile(self._bind_to_line(pattern, strip_lines), flags | re.MULTILINE)
+            for pattern in patterns.values()
+        ]
+
+    @classmethod
+    def _bind_to_line(cls, pattern: str, strip_lines: bool) -> str:
+        if strip_lines:
+            # A stripped line never starts with whitespace, so ^\s* is just ^,
+            # and anchors skip the leading whitespace strip() would have removed
+            pattern = pattern.replace(r'^\s*', '^')
+            pattern = pattern.replace('^', '^' + cls.LINE_WHITESPACE + '*')
+            # Trailing whitespace is gone too, so whitespace must be followed by text
+            whitespace = '(?:' + cls.LINE_WHITESPACE + '(?=' + cls.LINE_WHITESPACE + r'*\S))'
+        else:
+            whitespace = cls.LINE_WHITESPACE
+        return pattern.replace(r'\s', whitespace)
+
+    def scan(self, text: str, newlines: Optional[np.ndarray] = None) -> np.ndarray:
+        """Return a (n_lines, n_patterns) boolean matrix of which patterns match each line
+
+        Lines are those of text.split('\\n'). Pass the offsets of the newlines
+        when they are already known (see ParsedDocument) to skip splitting.
+        """
+        if newlines is None:
+            line_lengths = np.fromiter(map(len, text.split('\n')), dtype=np.int64)
+            # Offset of each newline: the lengths of the lines before it plus their newlines
+            newlines = np.cumsum(line_lengths[:-1] + 1) - 1
+        matches = np.zeros((len(newlines) + 1, len(self._compiled)), dtype=bool)
+
+        for column, compiled in enumerate(self._compiled):
+            starts = [m.start() for m in compiled.finditer(text)]
+            if starts:
+                rows = np.searchsorted(newlines, np.asarray(starts, dtype=np.int64), side='left')
+                matches[rows, column] = True
+
+        return matches
+
+    def count_lines(self, text: str, newlines: Optional[np.ndarray] = None) -> Dict[str, int]:
+        """Number of lines each pattern matches"""
+        counts = self.scan(text, newlines).sum(axis=0)
+        return {name: int(count) for name, count in zip(self.names, counts)}
+
+    @staticmethod
+    def masks(matches: np.ndarray) -> np.ndarray:
+        """Pack each row of a scan() matrix into an integer bitmask (bit i = pattern i)"""
+        return matches.astype(np.int64) @ (1 << np.arange(matches.shape[1], dtype=np.int64))
+
+    @staticmethod
+    def mask_labels(mask: int, labels: List[str]) -> List[str]:
+        """Labels of the patterns set in one bitmask"""
+        return [label for column, label in enumerate(labels) if mask >> column & 1]
+
+    def line_labels(self, matches: np.ndarray, labels: List[str]) -> List[List[str]]:
+        """Turn a scan() matrix into one list of labels per line"""
+        # Most lines share a handful of match combinations, so label each distinct row once
+        masks = self.masks(matches)
+        by_mask = {mask: self.mask_labels(mask, labels) for mask in np.unique(masks).tolist()}
+        return [list(by_mask[mask]) for mask in masks.tolist()]
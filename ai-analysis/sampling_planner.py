@@ -0,0 +1,125 @@
+import math
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+@dataclass
+class ShareEstimate:
+    """Estimated share of AI-generated files in a repository, with a confidence interval"""
+    share: float
+    low: float
+    high: float
+    sampled: int
+    population: int
+    # Share of the population in strata with no results yet; the interval
+    # allows anything from 0% to 100% AI for those files
+    uncovered: float = 1.0
+
+    @property
+    def margin(self) -> float:
+        return (self.high - self.low) / 2
+
+class SamplingPlanner:
+    """Draws a directory- and size-stratified sample of repository files
+
+    Files are grouped into strata by top-level directory and size band, and
+    each batch is allocated across strata in proportion to their sizes, so no
+    part of the repository is over- or under-represented because of listing
+    order. Ties between equally under-drawn strata are broken in a random
+    order fixed at construction, never by listing order. As results are
+    recorded the planner maintains a stratified estimate of the AI share;
+    scanning can stop once its confidence interval is narrow enough.
+    """
+
+    # Upper bounds, in bytes, of the size bands files are stratified into
+    SIZE_BANDS = (2_000, 10_000, 50_000)
+
+    def __init__(self, files: List[Dict], seed: int = 0):
+        rng = random.Random(seed)
+        self.strata: Dict[Tuple[str, int], List[Dict]] = {}
+        for file_info in files:
+            self.strata.setdefault(self.stratum_of(file_info), []).append(file_info)
+        for members in self.strata.values():
+            rng.shuffle(members)
+
+        self.population = len(files)
+        self.sizes = {key: len(members) for key, members in self.strata.items()}
+        self.drawn = {key: 0 for key in self.strata}
+        self.sampled = {key: 0 for key in self.strata}
+        self.ai = {key: 0 for key in self.strata}
+        # Random tie-break between strata with the same deficit
+        self._priority = {key: rng.random() for key in self.strata}
+        self._keys = {}
+
+    @classmethod
+    def stratum_of(cls, file_info: Dict) -> Tuple[str, int]:
+        path = file_info['path']
+        directory = path.split('/', 1)[0] if '/' in path else '.'
+        size = file_info.get('size', 0)
+        band = sum(size > bound for bound in cls.SIZE_BANDS)
+        return directory, band
+
+    @property
+    def remaining(self) -> int:
+        return self.population - sum(self.drawn.values())
+
+    def next_batch(self, n: int) -> List[Dict]:
+        """Draw up to n more files, each from the stratum furthest below its proportional share"""
+        batch = []
+        total = sum(self.drawn.values())
+        for _ in range(min(n, self.remaining)):
+            total += 1
+            key = max(
+                (key for key in self.strata if self.drawn[key] < self.sizes[key]),
+                key=lambda key: (self.sizes[key] * total / self.population - self.drawn[key],
+                                 self._priority[key])
+            )
+            file_info = self.strata[key][self.drawn[key]]
+            self.drawn[key] += 1
+            self._keys[file_info['path']] = key
+            batch.append(file_info)
+        return batch
+
+    def record(self, file_info: Dict, is_ai: bool):
+        """Count the verdict for a drawn file"""
+        key = self._keys[file_info['path']]
+        self.sampled[key] += 1
+        self.ai[key] += int(is_ai)
+
+    def estimate(self, z: float = 1.96) -> ShareEstimate:
+        """Stratified estimate of the AI share with a normal-approximation interval
+
+        Strata are weighted by their share of the whole population. The point
+        estimate extends the sampled strata's rate to the unsampled ones, but
+        the interval does not: it allows anywhere from none to all of the
+        unsampled files to be AI, so it only narrows as coverage grows. Each
+        sampled stratum's variance uses the add-two (Agresti-Coull)
+        proportion, so a few unanimous files do not give a zero-width
+        interval, and shrinks with the finite population correction as a
+        stratum is used up.
+        """
+        sampled_keys = [key for key in self.strata if self.sampled[key]]
+        sampled = sum(self.sampled.values())
+        if not sampled_keys:
+            return ShareEstimate(share=0.0, low=0.0, high=1.0, sampled=0, population=self.population)
+
+        covered_share = 0.0
+        variance = 0.0
+        for key in sampled_keys:
+            n, size = self.sampled[key], self.sizes[key]
+            weight = size / self.population
+            covered_share += weight * self.ai[key] / n
+            adjusted = (self.ai[key] + 1) / (n + 2)
+            variance += weight ** 2 * (1 - n / size) * adjusted * (1 - adjusted) / n
+
+        covered = sum(self.sizes[key] for key in sampled_keys) / self.population
+        uncovered = 1.0 - covered
+        half_width = z * math.sqrt(variance)
+        return ShareEstimate(
+            share=covered_share / covered,
+            low=max(0.0, covered_share - half_width),
+            high=min(1.0, covered_share + half_width + uncovered),
+            sampled=sampled,
+            population=self.population,
+            uncovered=uncovered
+        )
@@ -0,0 +1,92 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# The analyzer owned by this worker process, built once by _init_worker
+_worker_analyzer = None
+
+def _init_worker(cache_db: Optional[str], languages: List[str]):
+    """Build the worker's CodeAnalyzer and load its model bundles once"""
+    global _worker_analyzer
+    # Every core already runs its own worker, so keep native thread pools to one
+    # thread each. This must happen before NumPy and the models are imported.
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ.setdefault(var, '1')
+
+    from analysis_cache import AnalysisCache
+    from app import CodeAnalyzer
+
+    cache = AnalysisCache(db_path=cache_db) if cache_db else None
+    _worker_analyzer = CodeAnalyzer(cache=cache)
+    for language in languages:
+        _worker_analyzer.get_bundle(language)
+
+def _analyze_in_worker(file_path: str, code: str, blob_sha: Optional[str]):
+    return _worker_analyzer.analyze_file(file_path, code, blob_sha)
+
+class ScanEngine:
+    """Analyzes repository files in parallel across a pool of worker processes
+
+    analyze_file is CPU-bound, so threads would serialize on the GIL. Each
+    worker instead loads its own model bundles once, when it starts, and
+    then analyzes any number of files. Keep one engine for the life of the
+    app so workers and their models are reused from scan to scan.
+
+    Workers are spawned rather than forked, because forking a process that
+    is already running threads (like Streamlit's server) is unsafe.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, cache_db: Optional[str] = None,
+                 languages: Iterable[str] = ('python',)):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(cache_db, list(languages))
+        )
+
+    def scan(self, sources: Iterable[Tuple[Dict, str]], total: Optional[int] = None,
+             progress: Optional[Callable[[int, Optional[int], Dict], None]] = None
+             ) -> Iterator[Tuple[Dict, Optional[object], Optional[str]]]:
+        """Analyze (file_info, code) pairs, yielding (file_info, result, error) in completion order
+
+        Files are submitted as sources produces them, so downloads and analysis
+        overlap. progress, if given, is called with (completed, total, file_info)
+        after each file.
+        """
+        pending = {}
+        completed = 0
+
+        def collect(block: bool):
+            nonlocal completed
+            done = [future for future in pending if future.done()]
+            if block and not done:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_info = pending.pop(future)
+                try:
+                    outcome = (file_info, future.result(), None)
+                except Exception as e:
+                    outcome = (file_info, None, str(e))
+                completed += 1
+                if progress:
+                    progress(completed, total, file_info)
+                yield outcome
+
+        try:
+            for file_info, code in sources:
+                future = self._pool.submit(_analyze_in_worker, file_info['path'], code, file_info.get('sha'))
+                pending[future] = file_info
+                yield from collect(block=False)
+
+            while pending:
+                yield from collect(block=True)
+        finally:
+            # Drop queued work if the caller stops early
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import random
+import sys
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+import joblib
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.metrics import classification_report
+from sklearn.naive_bayes import MultinomialNB
+
+import train
+
+# Width of the hashed feature space; memory per model is fixed by this, not by the corpus
+N_FEATURES = 2 ** int(os.getenv("STREAM_HASH_BITS", "18"))
+BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "256"))
+EPOCHS = int(os.getenv("STREAM_EPOCHS", "3"))
+# Samples are shuffled within a window of this many files
+SHUFFLE_BUFFER = int(os.getenv("STREAM_SHUFFLE_BUFFER", "2048"))
+# One file in TEST_BUCKETS is held out for evaluation, chosen by content hash
+TEST_BUCKETS = 5
+CLASSES = ['ai', 'human']
+
+def iter_code_files(folder: str, label: str, extension: str) -> Iterator[Tuple[str, str]]:
+    """(code, label) for each file in a folder, read one at a time"""
+    if not os.path.exists(folder):
+        return
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith(extension):
+            with open(os.path.join(folder, filename), "r", encoding="utf-8", errors="ignore") as f:
+                yield f.read(), label
+
+def iter_manifest(store, lang: str, label: str, **filters) -> Iterator[Tuple[str, str]]:
+    for row in store.query(language=lang, label=label, **filters):
+        yield store.read(row["sha"]), row["label"]
+
+def interleave(*iterators: Iterator) -> Iterator:
+    """Round-robin over iterators until all are exhausted, so each class appears throughout the stream"""
+    active = list(iterators)
+    while active:
+        for iterator in list(active):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                active.remove(iterator)
+
+def shuffled(samples: Iterable, buffer_size: int = SHUFFLE_BUFFER, seed: int = 42) -> Iterator:
+    """Approximate shuffle holding at most buffer_size samples in memory"""
+    rng = random.Random(seed)
+    buffer = []
+    for sample in samples:
+        if len(buffer) < buffer_size:
+            buffer.append(sample)
+            continue
+        index = rng.randrange(buffer_size)
+        yield buffer[index]
+        buffer[index] = sample
+    rng.shuffle(buffer)
+    yield from buffer
+
+def iter_samples(lang: str) -> Iterator[Tuple[str, str]]:
+    """Stream a language's (code, label) pairs from data/<lang>/ or the corpus manifest"""
+    if train.CORPUS_DIR:
+        from corpus_store import CorpusStore
+        store = CorpusStore(train.CORPUS_DIR)
+        sources = [iter_manifest(store, lang, label, **train.CORPUS_QUERY) for label in CLASSES]
+    else:
+        ext = train.LANGUAGES[lang]
+        sources = []
+        for label in CLASSES:
+            # Handle both lowercase and uppercase directory names
+            folder = next((f"data/{lang}/{name}" for name in (label.upper(), label.capitalize())
+                           if os.path.exists(f"data/{lang}/{name}")), f"data/{lang}/{label}")
+            sources.append(iter_code_files(folder, label, ext))
+    return interleave(*sources)
+
+def is_test_sample(code: str) -> bool:
+    """Stable held-out assignment that needs no pass over the whole corpus"""
+    return int(hashlib.sha256(code.encode("utf-8")).hexdigest(), 16) % TEST_BUCKETS == 0
+
+def batches(samples: Iterable, size: int = BATCH_SIZE) -> Iterator[List]:
+    samples = iter(samples)
+    while batch := list(islice(samples, size)):
+        yield batch
+
+def make_vectorizer(lang: str) -> HashingVectorizer:
+    """Stateless char n-gram hashing with the language's n-gram range"""
+    config = train.LANG_CONFIGS[lang]
+    return HashingVectorizer(
+        analyzer=config['analyzer'],
+        ngram_range=config['ngram_range'],
+        n_features=N_FEATURES,
+        alternate_sign=False,  # Non-negative counts, as MultinomialNB requires
+        strip_accents='unicode',
+        lowercase=True
+    )
+
+def make_models():
+    return {
+        'sgd_logistic': SGDClassifier(loss='log_loss', alpha=1e-5, random_state=42),
+        'naive_bayes': MultinomialNB(alpha=0.01)
+    }
+
+def train_language(lang: str, epochs: int = EPOCHS, batch_size: int = BATCH_SIZE):
+    """Fit the incremental models on a language's stream; returns (vectorizer, models, samples seen)"""
+    vectorizer = make_vectorizer(lang)
+    models = make_models()
+    seen = 0
+    for epoch in range(epochs):
+        seen = 0
+        stream = shuffled(iter_samples(lang), seed=42 + epoch)
+        train_stream = (sample for sample in stream if not is_test_sample(sample[0]))
+        for batch in batches(train_stream, batch_size):
+            X = vectorizer.transform([code for code, _ in batch])
+            y = [label for _, label in batch]
+            for model in models.values():
+                model.partial_fit(X, y, classes=CLASSES)
+            seen += len(batch)
+        print(f"🔁 {lang} epoch {epoch + 1}/{epochs}: {seen} training samples")
+    return vectorizer, models, seen
+
+def evaluate(lang: str, vectorizer, models, batch_size: int = BATCH_SIZE):
+    """Classification report per model on the held-out files, one batch at a time"""
+    y_true = []
+    y_pred = {name: [] for name in models}
+    test_stream = (sample for sample in iter_samples(lang) if is_test_sample(sample[0]))
+    for batch in batches(test_stream, batch_size):
+        X = vectorizer.transform([code for code, _ in batch])
+        y_true.extend(label for _, label in batch)
+        for name, model in models.items():
+            y_pred[name].extend(model.predict(X))
+    if not y_true:
+        return {}
+    return {name: classification_report(y_true, predictions, zero_division=0)
+            for name, predictions in y_pred.items()}
+
+def save_models(lang: str, vectorizer, models):
+    # Kept out of model/<lang>/ so the app never mistakes it for a trained bundle
+    out_dir = f"model/streaming/{lang}"
+    os.makedirs(out_dir, exist_ok=True)
+    joblib.dump(vectorizer, f"{out_dir}/vectorizer.pkl")
+    for name, model in models.items():
+        joblib.dump(model, f"{out_dir}/{name}.pkl")
+    print(f"💾 Saved streaming models to {out_dir}/")
+
+if __name__ == "__main__":
+    # python stream_train.py [language ...]
+    for lang in sys.argv[1:] or list(train.LANGUAGES):
+        print(f"\n=== Streaming training for {lang.upper()} ===")
+        vectorizer, models, seen = train_language(lang)
+        if not seen:
+            print(f"Skipping {lang} - no data found")
+            continue
+        for name, report in evaluate(lang, vectorizer, models).items():
+            print(f"\n📊 {name} for {lang}:")
+            print(report)
+        save_models(lang, vectorizer, models)
+    print("✅ Streaming training complete!")
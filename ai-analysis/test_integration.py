@@ -1,6 +1,10 @@
 import sys
 import os
 import json
+import io
+import tarfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from api import app
 
 def test_api_integration():
@@ -66,9 +70,958 @@ def fib(n):
     else:
         print(f"Error: {resp.status_code} - {resp.data}")
 
+    # Test analysis depths
+    print("\nExpected: depth=verdict skips characteristics and line analysis")
+    resp = client.post('/analyze', json={'code': ai_code, 'depth': 'verdict'})
+    print(f"Actual: {resp.status_code} - keys {sorted(resp.json.keys())}")
+    assert resp.status_code == 200
+    assert 'analysis' not in resp.json and 'lines' not in resp.json
+
+    print("\nExpected: depth=lines returns columnar per-line results")
+    resp = client.post('/analyze', json={'code': ai_code, 'depth': 'lines'})
+    assert resp.status_code == 200
+    lines = resp.json['lines']
+    print(f"Actual: {len(lines['line_number'])} lines analyzed")
+    assert 'analysis' in resp.json
+    assert len(set(len(column) for column in lines.values())) == 1
+
+    print("\nExpected: unknown depth is rejected")
+    resp = client.post('/analyze', json={'code': ai_code, 'depth': 'everything'})
+    print(f"Actual: {resp.status_code}")
+    assert resp.status_code == 400
+
+    # Test batch analysis
+    print("\nExpected: Batch analysis matches single-document results")
+    resp = client.post('/analyze/batch', json={'codes': [ai_code, human_code], 'depth': 'verdict'})
+    assert resp.status_code == 200
+    batch = resp.json['results']
+    print(f"Actual: {[r['prediction'] for r in batch]}")
+    for code, result in zip([ai_code, human_code], batch):
+        single = client.post('/analyze', json={'code': code, 'depth': 'verdict'}).json
+        assert result['prediction'] == single['prediction']
+        assert abs(result['confidence'] - single['confidence']) < 1e-9
+
+    print("\nExpected: Batch with an empty document is rejected")
+    resp = client.post('/analyze/batch', json={'codes': [ai_code, '']})
+    print(f"Actual: {resp.status_code}")
+    assert resp.status_code == 400
+
+    # Test result cache
+    print("\nExpected: Resubmitting identical code is served from the cache")
+    hits_before = client.get('/health').json['cache']['hits']
+    first = client.post('/analyze', json={'code': human_code, 'depth': 'verdict'}).json
+    second = client.post('/analyze', json={'code': human_code + "\n\n", 'depth': 'verdict'}).json
+    cache_stats = client.get('/health').json['cache']
+    print(f"Actual: {cache_stats}")
+    assert cache_stats['hits'] >= hits_before + 2
+    assert first == second
+
+    # Test per-language routing
+    java_code = """
+public class Main {
+    public static void main(String[] args) {
+        System.out.println("Hello");
+    }
+}
+"""
+    print("\nExpected: Java code is routed to the Java bundle")
+    resp = client.post('/analyze', json={'code': java_code, 'depth': 'verdict'})
+    print(f"Actual: {resp.json.get('language')}")
+    assert resp.json['language'] == 'java'
+    resp = client.post('/analyze', json={'code': java_code, 'language': 'cobol'})
+    assert resp.status_code == 400
+
+def test_javascript_bundle_location():
+    """Test that retrained JavaScript models in model/js win over model/javascript, if there are any"""
+    print("\n🧪 Testing JavaScript bundle lookup...")
+    import tempfile
+    import joblib
+    from app import CodeAnalyzer
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        for directory in ('js', 'javascript'):
+            os.makedirs(os.path.join(root, 'model', directory))
+            joblib.dump({'dir': directory}, os.path.join(root, 'model', directory, 'vectorizer.pkl'))
+        os.chdir(root)
+        try:
+            bundle = CodeAnalyzer().get_bundle('javascript')
+        finally:
+            os.chdir(cwd)
+
+    print("\nExpected: {'dir': 'js'}")
+    print(f"Actual: {bundle.vectorizer}")
+    assert bundle.vectorizer == {'dir': 'js'}
+
+    # A model/js holding no bundle of its own (e.g. only streaming output) must not shadow model/javascript
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, 'model', 'js', 'streaming'))
+        os.makedirs(os.path.join(root, 'model', 'javascript'))
+        joblib.dump({'dir': 'javascript'}, os.path.join(root, 'model', 'javascript', 'vectorizer.pkl'))
+        os.chdir(root)
+        try:
+            bundle = CodeAnalyzer().get_bundle('javascript')
+        finally:
+            os.chdir(cwd)
+
+    print("\nExpected: {'dir': 'javascript'}")
+    print(f"Actual: {bundle.vectorizer}")
+    assert bundle.vectorizer == {'dir': 'javascript'}
+
+def test_batched_line_scoring():
+    """Test that scoring all lines in one batch matches scoring them one at a time"""
+    print("\n🧪 Testing batched line scoring...")
+    from app import CodeAnalyzer
+
+    code = '''import os
+
+def load_config(path):
+    """Load the configuration file and return its contents."""
+    # Check that the file exists before reading it
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Config not found: {path}")
+    with open(path) as f:
+        return f.read()
+
+x=1 # TODO fix
+X=1 # TODO FIX
+x=1 # TODO fix
+print(  x )
+'''
+    analyzer = CodeAnalyzer()
+    mismatches = []
+    for overall in ('ai', 'human'):
+        batched = analyzer.analyze_lines(code, 'gradient_boost', overall, batched=True).rows()
+        single = analyzer.analyze_lines(code, 'gradient_boost', overall, batched=False).rows()
+        mismatches += [(b, s) for b, s in zip(batched, single)
+                       if (b.line_number, b.prediction, b.patterns) != (s.line_number, s.prediction, s.patterns)
+                       or abs(b.confidence - s.confidence) > 1e-9]
+        assert len(batched) == len(single) == 12
+
+    print("\nExpected: Batched and one-at-a-time rows agree for both overall predictions")
+    print(f"Actual: {len(mismatches)} rows differ")
+    assert not mismatches
+
+def test_line_memo():
+    """Test the per-line prediction memo: eviction, counters, keys and warm-up"""
+    print("\n🧪 Testing line memo...")
+    import sys
+    import tempfile
+    from analysis_cache import LineMemo
+    from app import CodeAnalyzer
+
+    entry = LineMemo.ENTRY_OVERHEAD + sys.getsizeof("a")
+    memo = LineMemo(max_bytes=2 * entry)
+    memo.put('gb', 'v1', "a", ('ai', 0.9, 0))
+    memo.put('gb', 'v1', "b", ('human', 0.8, 0))
+    assert memo.get('gb', 'v1', "a") == ('ai', 0.9, 0)
+    memo.put('gb', 'v1', "c", ('ai', 0.7, 1))
+    print("\nExpected: The least recently used entry (b) is evicted and the size stays under max_bytes")
+    print(f"Actual: {memo.stats()}")
+    assert len(memo) == 2 and memo.current_bytes == 2 * entry
+    assert memo.get('gb', 'v1', "b") is None and memo.get('gb', 'v2', "a") is None
+    assert memo.get('gb', 'v1', "c") == ('ai', 0.7, 1)
+    assert (memo.hits, memo.misses) == (2, 2)
+    assert LineMemo.normalize_line("  Return X ") == "  return x "
+    assert LineMemo.normalize_line("Return X", lowercase=False) == "Return X"
+
+    code = "def total(items):\n    \"\"\"Sum the items.\"\"\"\n    return sum(items)\nRETURN_VALUE = 1\nreturn_value = 1\n"
+    cold = CodeAnalyzer(line_memo=LineMemo()).analyze_lines(code, 'gradient_boost', 'ai').rows()
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, 'python', 'ai'))
+        with open(os.path.join(root, 'python', 'ai', 'sample.py'), 'w') as f:
+            f.write(code)
+        analyzer = CodeAnalyzer(line_memo=LineMemo())
+        warmed = analyzer.warm_line_memo(data_dir=root)
+    misses = analyzer.line_memo.misses
+    served = analyzer.analyze_lines(code, 'gradient_boost', 'ai').rows()
+    print("\nExpected: Warming stores one entry per case-folded line, and every line is then served from the memo")
+    print(f"Actual: {warmed} entries, {analyzer.line_memo.misses - misses} new misses")
+    assert warmed == 4
+    assert analyzer.line_memo.misses == misses and analyzer.line_memo.hits >= 4
+    assert [(r.line_number, r.prediction, r.patterns) for r in served] == \
+           [(r.line_number, r.prediction, r.patterns) for r in cold]
+    assert all(abs(s.confidence - c.confidence) < 1e-9 for s, c in zip(served, cold))
+
+def test_analysis_cache_pruning():
+    """Test that the sqlite tier keeps only the most recent max_rows results"""
+    print("\n🧪 Testing analysis cache pruning...")
+    import sqlite3
+    import tempfile
+    from contextlib import closing
+    from analysis_cache import AnalysisCache
+
+    with tempfile.TemporaryDirectory() as root:
+        db_path = os.path.join(root, 'cache.db')
+        cache = AnalysisCache(max_entries=1, db_path=db_path, max_rows=30)
+        for i in range(2 * AnalysisCache.PRUNE_INTERVAL + 50):
+            cache.put(f"key{i}", {'value': i})
+        with closing(sqlite3.connect(db_path)) as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        newest, oldest = cache.get(f"key{2 * AnalysisCache.PRUNE_INTERVAL - 1}"), cache.get("key0")
+
+    print("\nExpected: 30 rows after the last prune plus 50 later writes, keeping the newest")
+    print(f"Actual: {rows} rows, newest {newest}, oldest {oldest}")
+    assert rows == 30 + 50
+    assert newest == {'value': 2 * AnalysisCache.PRUNE_INTERVAL - 1} and oldest is None
+
+def test_file_result_cache():
+    """Test reusing a file's analysis by blob SHA before downloading it"""
+    print("\n🧪 Testing file result cache...")
+    import dataclasses
+    from analysis_cache import AnalysisCache, git_blob_sha
+    from app import CodeAnalyzer
+
+    code = "def area(width, height):\n    \"\"\"Return the area of a rectangle.\"\"\"\n    return width * height\n"
+    cache = AnalysisCache()
+    analyzer = CodeAnalyzer(cache=cache)
+    result = analyzer.analyze_file('shapes.py', code)
+    cached = analyzer.cached_file_result('pkg/shapes.py', git_blob_sha(code))
+    print("\nExpected: The blob SHA of the analyzed content finds the stored result")
+    print(f"Actual: {cached}")
+    assert cached == dataclasses.replace(result, file_path='pkg/shapes.py')
+    assert analyzer.cached_file_result('shapes.py', git_blob_sha(code + "\n")) is None
+
+    # Retrained models get a new fingerprint and must not reuse old results
+    retrained = CodeAnalyzer(cache=cache)
+    retrained.get_bundle('python').fingerprint = 'retrained'
+    missed = retrained.cached_file_result('shapes.py', git_blob_sha(code))
+    print("\nExpected: A different model fingerprint misses")
+    print(f"Actual: {missed}")
+    assert missed is None
+
+def test_pattern_scanner_equivalence():
+    """Test that the multi-pattern scanner matches per-line re.search"""
+    print("\n🧪 Testing pattern scanner against per-line matching...")
+    import random
+    import re
+    from app import AIDetectionReasoningEngine, CodeAnalyzer
+
+    rng = random.Random(7)
+    pieces = ['def f(x):', 'class A', 'import os', '# todo fix', '#Note', 'for i in y:', 'if x:',
+              'print("debug")', 'x = 1', 'lambda  v: v', 'try:', '"""doc"""', "f'{x}'", 'y = a if b else c',
+              '[i for i in z]', 'foo = bar', '']
+    edges = ['', ' ', '  ', '\t', '\r', '\x0c', ' \r']
+    lines = [rng.choice(edges) + rng.choice(pieces) + rng.choice(edges) for _ in range(400)]
+    text = '\n'.join(lines)
+
+    mismatches = 0
+    for patterns, scanner, flags, strip in (
+        (AIDetectionReasoningEngine.AI_INDICATORS, AIDetectionReasoningEngine.AI_SCANNER, 0, False),
+        (AIDetectionReasoningEngine.HUMAN_INDICATORS, AIDetectionReasoningEngine.HUMAN_SCANNER, 0, False),
+        (CodeAnalyzer.PATTERN_CHECKS, CodeAnalyzer.PATTERN_SCANNER, re.IGNORECASE, True),
+    ):
+        matches = scanner.scan(text)
+        for row, line in enumerate(lines):
+            target = line.strip() if strip else line
+            expected = [bool(re.search(p, target, flags)) for p in patterns.values()]
+            mismatches += expected != matches[row].tolist()
+
+    print("\nExpected: 0 lines differ from per-line re.search")
+    print(f"Actual: {mismatches} lines differ")
+    assert mismatches == 0
+
+def test_line_adjustment_equivalence():
+    """Test that flipping least-confident lines breaks ties like the old stable sort"""
+    print("\n🧪 Testing line prediction adjustment against the old sort-and-flip...")
+    import random
+    from app import CodeAnalyzer, LineAnalysis, LineAnalysisTable
+    from parsed_document import ParsedDocument
+
+    def old_adjust(analyses, target_prediction, target_ratio=0.5):
+        current = sum(1 for a in analyses if a.prediction == target_prediction)
+        desired = int(len(analyses) * target_ratio)
+        if current >= desired:
+            return analyses
+        candidates = [a for a in analyses if a.prediction != target_prediction]
+        candidates.sort(key=lambda a: a.confidence)
+        for a in candidates[:desired - current]:
+            idx = analyses.index(a)
+            analyses[idx] = LineAnalysis(a.line_number, a.content, target_prediction, 0.55, a.patterns)
+        return analyses
+
+    rng = random.Random(9)
+    analyzer = CodeAnalyzer()
+    mismatches = 0
+    for trial in range(50):
+        n = rng.randint(1, 40)
+        doc = ParsedDocument.parse('\n'.join(f"line {i}" for i in range(n)))
+        target = rng.choice(['ai', 'human'])
+        # Few distinct confidences, so the cutoff usually falls inside a tie
+        analyses = [LineAnalysis(i + 1, f"line {i}", 'ai' if rng.random() < 0.2 else 'human',
+                                 rng.choice([0.6, 0.7, 0.8]), []) for i in range(n)]
+        if target == 'human':
+            analyses = [LineAnalysis(a.line_number, a.content, 'human' if a.prediction == 'ai' else 'ai',
+                                     a.confidence, []) for a in analyses]
+        table = LineAnalysisTable.from_analyses(doc, analyses, [])
+        new = analyzer._adjust_line_predictions(table, target)
+        old = old_adjust(list(analyses), target)
+        mismatches += ([(a.prediction, a.confidence) for a in old] !=
+                       [(r.prediction, r.confidence) for r in new])
+
+    print("\nExpected: 0 of 50 trials differ from the old sort-and-flip")
+    print(f"Actual: {mismatches} differ")
+    assert mismatches == 0
+
+def test_scan_engine():
+    """Test analyzing files in worker processes"""
+    print("\n🧪 Testing parallel scan engine...")
+    from app import CodeAnalyzer
+    from scan_engine import ScanEngine
+
+    sources = [
+        ({'path': 'a.py'}, "def add(a, b):\n    \"\"\"Return the sum of a and b.\"\"\"\n    return a + b\n"),
+        ({'path': 'b.py'}, "x=1 # tmp\nprint(x)\n"),
+        ({'path': 'c.py'}, "for i in range(3):\n    print(i)\n"),
+    ]
+    calls = []
+    engine = ScanEngine(max_workers=2)
+    try:
+        scanned = list(engine.scan(iter(sources), len(sources),
+                                   lambda done, total, info: calls.append((done, total, info['path']))))
+    finally:
+        engine.shutdown()
+
+    expected = {info['path']: CodeAnalyzer().analyze_file(info['path'], code) for info, code in sources}
+    results = {info['path']: result for info, result, error in scanned}
+    print("\nExpected: Every file analyzed once, matching in-process results, with progress 1..3 of 3")
+    print(f"Actual: {[(info['path'], error) for info, _, error in scanned]}, progress {calls}")
+    assert all(error is None for _, _, error in scanned)
+    assert results == expected
+    assert [(done, total) for done, total, _ in calls] == [(1, 3), (2, 3), (3, 3)]
+    assert sorted(path for _, _, path in calls) == ['a.py', 'b.py', 'c.py']
+
+def test_github_listing():
+    """Test listing repository files from the Trees API, and the contents API fallback"""
+    print("\n🧪 Testing GitHub source file listing...")
+    import json
+    from urllib.parse import urlsplit
+    from app import GitHubRepoAnalyzer
+    from github_client import GitHubClient
+
+    huge = 10 ** 8
+    tree = {'truncated': False, 'tree': [
+        {'path': 'main.py', 'type': 'blob', 'sha': 'a1', 'size': 120},
+        {'path': 'pkg', 'type': 'tree', 'sha': 't1'},
+        {'path': 'pkg/my module.py', 'type': 'blob', 'sha': 'b2', 'size': 300},
+        {'path': 'pkg/huge.py', 'type': 'blob', 'sha': 'c3', 'size': huge},
+        {'path': 'README.md', 'type': 'blob', 'sha': 'd4', 'size': 50},
+    ]}
+    contents = {
+        '': [{'name': 'main.py', 'path': 'main.py', 'type': 'file', 'size': 120},
+             {'name': 'README.md', 'path': 'README.md', 'type': 'file', 'size': 50},
+             {'name': 'pkg', 'path': 'pkg', 'type': 'dir'}],
+        'pkg': [{'name': 'my module.py', 'path': 'pkg/my module.py', 'type': 'file', 'size': 300},
+                {'name': 'huge.py', 'path': 'pkg/huge.py', 'type': 'file', 'size': huge}],
+    }
+    requested = []
+    class ListingHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        def do_GET(self):
+            path = urlsplit(self.path).path
+            requested.append(path)
+            prefix = '/repos/owner/repo/contents/'
+            body = tree if path.endswith('/git/trees/HEAD') else contents[path[len(prefix):]]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode())
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ListingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url, client = GitHubRepoAnalyzer.API_URL, GitHubRepoAnalyzer._client
+    GitHubRepoAnalyzer.API_URL = f"http://127.0.0.1:{server.server_port}"
+    GitHubRepoAnalyzer._client = GitHubClient()
+    try:
+        listed = GitHubRepoAnalyzer.list_source_files('owner', 'repo', ('.py',))
+        tree_requests = list(requested)
+        tree['truncated'] = True
+        requested.clear()
+        walked = GitHubRepoAnalyzer.list_source_files('owner', 'repo', ('.py',))
+    finally:
+        GitHubRepoAnalyzer.API_URL, GitHubRepoAnalyzer._client = api_url, client
+        server.shutdown()
+
+    print("\nExpected: One Trees request lists the small .py blobs, with quoted raw URLs")
+    print(f"Actual: {tree_requests} -> {[(f['path'], f['download_url']) for f in listed]}")
+    assert tree_requests == ['/repos/owner/repo/git/trees/HEAD']
+    assert [f['path'] for f in listed] == ['main.py', 'pkg/my module.py']
+    assert listed[1]['download_url'] == f"{GitHubRepoAnalyzer.RAW_URL}/owner/repo/HEAD/pkg/my%20module.py"
+    assert listed[1]['sha'] == 'b2' and listed[1]['name'] == 'my module.py'
+
+    print("\nExpected: A truncated tree falls back to walking the contents API")
+    print(f"Actual: {requested} -> {[f['path'] for f in walked]}")
+    assert requested == ['/repos/owner/repo/git/trees/HEAD', '/repos/owner/repo/contents/',
+                         '/repos/owner/repo/contents/pkg']
+    assert [f['path'] for f in walked] == ['main.py', 'pkg/my module.py']
+
+def test_archive_ingestion():
+    """Test streaming repository files out of a locally served tarball"""
+    print("\n🧪 Testing repository archive ingestion...")
+    from app import CodeAnalyzer, GitHubRepoAnalyzer
+
+    files = {
+        'owner-repo-abc123/main.py': b"def add(a, b):\n    return a + b\n",
+        'owner-repo-abc123/pkg/util.py': b"import os\nprint(os.getcwd())\n",
+        'owner-repo-abc123/README.md': b"# readme\n",
+        'owner-repo-abc123/pkg/huge.py': b"x = 1\n" * 100_000,
+    }
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    payload = buffer.getvalue()
+
+    requested = []
+    class ArchiveHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        def do_GET(self):
+            requested.append(self.path)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/x-gzip')
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ArchiveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = GitHubRepoAnalyzer.API_URL
+    GitHubRepoAnalyzer.API_URL = f"http://127.0.0.1:{server.server_port}"
+    try:
+        extracted = dict(
+            (info['path'], code)
+            for info, code in GitHubRepoAnalyzer.iter_archive_files('owner', 'repo', ('.py',))
+        )
+    finally:
+        GitHubRepoAnalyzer.API_URL = api_url
+        server.shutdown()
+
+    print("\nExpected: One request; only small .py files, with the archive prefix stripped")
+    print(f"Actual: {requested} -> {sorted(extracted)}")
+    assert requested == ['/repos/owner/repo/tarball/HEAD']
+    assert sorted(extracted) == ['main.py', 'pkg/util.py']
+    assert extracted['main.py'] == files['owner-repo-abc123/main.py'].decode()
+
+    result = CodeAnalyzer().analyze_file('main.py', extracted['main.py'])
+    assert result.file_path == 'main.py'
+    assert result.line_count == 2
+
+def test_local_repo_listing():
+    """Test listing a local checkout with .gitignore rules"""
+    print("\n🧪 Testing local repository listing...")
+    import tempfile
+    from local_repo import LocalRepoAnalyzer
+
+    with tempfile.TemporaryDirectory() as root:
+        files = {
+            '.gitignore': "build/\nvendor/*\n!vendor/keep.py\n",
+            'main.py': "print('main')\n",
+            'build/out.py': "print('built')\n",
+            'vendor/drop.py': "print('drop')\n",
+            'vendor/keep.py': "print('keep')\n",
+            'pkg/.gitignore': "local_*.py\n",
+            'pkg/local_settings.py': "DEBUG = True\n",
+            'pkg/util.py': "def util():\n    return 1\n",
+        }
+        for path, content in files.items():
+            os.makedirs(os.path.join(root, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(root, path), 'w') as f:
+                f.write(content)
+
+        listed = [f['path'] for f in LocalRepoAnalyzer.list_source_files(root, ('.py',))]
+
+    print("\nExpected: ['main.py', 'pkg/util.py', 'vendor/keep.py']")
+    print(f"Actual: {listed}")
+    assert listed == ['main.py', 'pkg/util.py', 'vendor/keep.py']
+
+def test_bare_repo_listing():
+    """Test listing and reading files from the object store of a bare git repository"""
+    print("\n🧪 Testing bare repository listing...")
+    import subprocess
+    import tempfile
+    from analysis_cache import git_blob_sha
+    from local_repo import LocalRepoAnalyzer
+
+    files = {
+        'main.py': "print('main')\n",
+        'pkg/my util.py': "def util():\n    return 1\n",
+        'pkg/big.py': "x = 1\n" * 100,
+        'README.md': "# readme\n",
+    }
+    with tempfile.TemporaryDirectory() as root:
+        work, bare = os.path.join(root, 'work'), os.path.join(root, 'repo.git')
+        for path, content in files.items():
+            os.makedirs(os.path.join(work, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(work, path), 'w') as f:
+                f.write(content)
+        git = ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+        subprocess.run(git + ['init', '-q', work], check=True)
+        subprocess.run(git + ['-C', work, 'add', '.'], check=True)
+        subprocess.run(git + ['-C', work, 'commit', '-q', '-m', 'init'], check=True)
+        subprocess.run(git + ['clone', '-q', '--bare', work, bare], check=True)
+
+        listed = LocalRepoAnalyzer.list_source_files(bare, ('.py',), max_size=100)
+        sources = dict((info['path'], (info['sha'], code))
+                       for info, code in LocalRepoAnalyzer.iter_sources(bare, listed))
+        is_bare = LocalRepoAnalyzer.is_bare_repo(bare), LocalRepoAnalyzer.is_bare_repo(work)
+
+    print("\nExpected: Small .py blobs from HEAD, read back from the object store")
+    print(f"Actual: {[(f['path'], f['size']) for f in listed]}")
+    assert is_bare == (True, False)
+    assert [f['path'] for f in listed] == ['main.py', 'pkg/my util.py']
+    assert all(f['size'] == len(files[f['path']]) for f in listed)
+    for path, (sha, code) in sources.items():
+        assert code == files[path] and sha == git_blob_sha(files[path])
+
+def test_sampling_planner():
+    """Test stratified sampling and the AI-share estimate"""
+    print("\n🧪 Testing stratified sampling planner...")
+    from sampling_planner import SamplingPlanner
+
+    # Listing order puts one directory first; it alone is AI-generated
+    files = [{'path': f"{d}/f{i}.py", 'size': 1000} for d in ('gen', 'src', 'lib', 'app') for i in range(25)]
+    planner = SamplingPlanner(files)
+    batch = planner.next_batch(20)
+    directories = sorted({f['path'].split('/')[0] for f in batch})
+    print("\nExpected: A 20-file batch draws 5 files from each of the 4 directories")
+    print(f"Actual: {directories}")
+    assert all(sum(f['path'].startswith(d) for f in batch) == 5 for d in directories)
+    assert len(directories) == 4
+
+    for file_info in batch:
+        planner.record(file_info, file_info['path'].startswith('gen/'))
+    estimate = planner.estimate()
+    print(f"Estimate after one batch: {estimate}")
+    assert abs(estimate.share - 0.25) < 1e-9
+    assert estimate.low < 0.25 < estimate.high
+
+    while planner.remaining:
+        for file_info in planner.next_batch(20):
+            planner.record(file_info, file_info['path'].startswith('gen/'))
+    estimate = planner.estimate()
+    print("\nExpected: Sampling every file gives the exact share with no uncertainty")
+    print(f"Actual: {estimate}")
+    assert estimate.low == estimate.share == estimate.high == 0.25
+
+    # 100 equal directories, the AI ones first in listing order; ties must not follow that order
+    files = [{'path': f"d{i:03d}/f{j}.py", 'size': 1000} for i in range(100) for j in range(5)]
+    is_ai = lambda f: int(f['path'][1:4]) < 30
+    planner = SamplingPlanner(files)
+    batch = planner.next_batch(32)
+    for file_info in batch:
+        planner.record(file_info, is_ai(file_info))
+    estimate = planner.estimate()
+    print("\nExpected: 32 of 500 files leave most strata unsampled, so the interval stays wide around 30%")
+    print(f"Actual: {sum(map(is_ai, batch))} AI files drawn, {estimate}")
+    assert sum(map(is_ai, batch)) < 20
+    assert estimate.low < 0.3 < estimate.high and estimate.uncovered > 0.5 and estimate.margin > 0.25
+
+def test_file_filter():
+    """Test skipping vendored, generated and minified files"""
+    print("\n🧪 Testing pre-analysis file filter...")
+    from file_filter import content_skip_reason, partition_files
+
+    listing = [
+        {'path': 'src/app.py', 'size': 4000},
+        {'path': 'vendor/requests/api.py', 'size': 4000},
+        {'path': 'proto/service_pb2.py', 'size': 4000},
+        {'path': 'src/__init__.py', 'size': 10},
+        {'path': 'static/app.min.js', 'size': 90000},
+    ]
+    kept, skipped = partition_files(listing)
+    print("\nExpected: Only src/app.py is kept")
+    print(f"Actual: {[f['path'] for f in kept]}, skipped {[f['skip_reason'] for f in skipped]}")
+    assert [f['path'] for f in kept] == ['src/app.py']
+    assert len(skipped) == 4
+
+    # Generic build names only count at the top level or with a build-output child
+    listing = [
+        {'path': 'build/lib/pkg/core.py', 'size': 4000},
+        {'path': 'packages/ui/node_modules/react/index.js', 'size': 4000},
+        {'path': 'app/env/lib/python3.11/os.py', 'size': 4000},
+        {'path': 'src/build/_builder.py', 'size': 4000},
+        {'path': 'app/env/settings.py', 'size': 4000},
+        {'path': 'pkg/target/aim.py', 'size': 4000},
+        {'path': 'lib/out/format.py', 'size': 4000},
+    ]
+    kept, skipped = partition_files(listing)
+    print("\nExpected: Nested build/, env/, target/ and out/ packages are kept")
+    print(f"Actual: kept {[f['path'] for f in kept]}")
+    assert [f['path'] for f in kept] == ['src/build/_builder.py', 'app/env/settings.py',
+                                        'pkg/target/aim.py', 'lib/out/format.py']
+
+    info = {'path': 'src/app.py'}
+    assert content_skip_reason(info, "# Code generated by protoc-gen. DO NOT EDIT.\nx = 1\n")
+    assert content_skip_reason(info, "var a=" + "1+" * 2000 + "1;\n") == "minified code"
+    # AI assistants write "Auto-generated" into their own docstrings; those must still be analyzed
+    assert content_skip_reason(info, '"""Author: AI Assistant\nCreated: Auto-generated"""\nx = 1\n') is None
+
+def test_github_client():
+    """Test retries, rate-limit handling and conditional requests against a fake GitHub"""
+    print("\n🧪 Testing rate-limit-aware GitHub client...")
+    import time
+    from github_client import GitHubClient
+
+    hits = {}
+    class FakeGitHub(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        def reply(self, status, headers=None, body=b'{}'):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        def do_GET(self):
+            hits[self.path] = hits.get(self.path, 0) + 1
+            first = hits[self.path] == 1
+            reset = str(int(time.time()) + 3000)
+            if self.path == '/flaky' and first:
+                return self.reply(503)
+            if self.path == '/throttled' and first:
+                return self.reply(429, {'Retry-After': '2'})
+            if self.path == '/exhausted':
+                return self.reply(403, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': reset})
+            if self.path == '/listing':
+                if self.headers.get('If-None-Match') == '"v1"':
+                    return self.reply(304)
+                return self.reply(200, {'ETag': '"v1"', 'X-RateLimit-Remaining': '30',
+                                        'X-RateLimit-Reset': reset}, b'[{"path": "a.py"}]')
+            self.reply(200)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGitHub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    sleeps = []
+    client = GitHubClient(token='', max_wait=60, sleep=sleeps.append)
+    try:
+        flaky = client.get(f"{base}/flaky")
+        throttled = client.get(f"{base}/throttled")
+        exhausted = client.get(f"{base}/exhausted")
+        first = client.get_json(f"{base}/listing")
+        second = client.get_json(f"{base}/listing")
+    finally:
+        server.shutdown()
+
+    print("\nExpected: 5xx and 429 are retried, Retry-After is honored, a long reset wait is not")
+    print(f"Actual: {flaky.status_code} {throttled.status_code} {exhausted.status_code}, "
+          f"sleeps {sleeps}, stats {client.stats()}")
+    assert flaky.status_code == 200 and throttled.status_code == 200
+    assert 2.0 in sleeps
+    assert exhausted.status_code == 403 and hits['/exhausted'] == 1
+    assert client.stats()['rate_limited'] == 2
+
+    print("\nExpected: The unchanged listing is served from the ETag cache")
+    print(f"Actual: {first} / {second}, remaining {client.rate_limit_remaining}")
+    assert first == second == [{'path': 'a.py'}]
+    assert hits['/listing'] == 2
+    assert client.rate_limit_remaining == 30
+
+    secret = GitHubClient(token='SECRET')
+    sent = {url: 'Authorization' in secret._headers(url, None) for url in (
+        'https://api.github.com/repos', 'https://raw.githubusercontent.com/a/b', 'https://github.com/a',
+        'https://evilgithub.com/x', 'https://github.com.evil.io/x', 'https://notgithubusercontent.com/x')}
+    print("\nExpected: The token goes only to GitHub hosts, never to lookalikes")
+    print(f"Actual: {sent}")
+    assert list(sent.values()) == [True, True, True, False, False, False]
+
+def test_scrape_pipeline():
+    """Test search paging, truncated-tree listing, checkpoint resume and clean shutdown of the scraper"""
+    print("\n🧪 Testing resumable scrape pipeline...")
+    import tempfile
+    import time
+    from urllib.parse import parse_qs, urlparse
+    import github_scrapper
+    from github_client import GitHubClient
+
+    # Search pages are offsets computed from per_page, as on GitHub
+    requested = []
+    def fake_search(query, per_page=5, page=1):
+        requested.append((per_page, page))
+        start = (page - 1) * per_page
+        return [{'full_name': f"r/{i}"} for i in range(start, min(start + per_page, 230))]
+    original_search = github_scrapper.search_repositories
+    github_scrapper.search_repositories = fake_search
+    try:
+        names = [item['full_name'] for item in github_scrapper.iter_repositories('q', max_repos=150)]
+    finally:
+        github_scrapper.search_repositories = original_search
+    print("\nExpected: 150 distinct repos from fixed-size pages")
+    print(f"Actual: {len(set(names))} distinct of {len(names)}, requests {requested}")
+    assert len(names) == len(set(names)) == 150 and requested == [(100, 1), (100, 2)]
+
+    code = "def handler(event):\n    total = 0\n    for item in event:\n        total += item\n    return total\n" * 3
+    fail_f2 = [True]
+    hits = {}
+    class FakeGitHub(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+        def reply(self, status, body):
+            data = body if isinstance(body, bytes) else json.dumps(body).encode()
+            self.send_response(status)
+            self.end_headers()
+            self.wfile.write(data)
+        def do_GET(self):
+            url = urlparse(self.path)
+            hits[url.path] = hits.get(url.path, 0) + 1
+            blob = lambda path: {'path': path, 'type': 'blob', 'size': 300}
+            if url.path == '/search/repositories':
+                page = int(parse_qs(url.query)['page'][0])
+                items = [{'full_name': f"a/{n}", 'name': n, 'owner': {'login': 'a'}, 'default_branch': 'main',
+                          'license': {'key': 'mit'}} for n in ('one', 'two')]
+                return self.reply(200, {'items': items if page == 1 else []})
+            if url.path == '/repos/a/one/git/trees/main':
+                return self.reply(200, {'tree': [blob('f1.py'), blob('f2.py')], 'truncated': False})
+            if url.path == '/repos/a/two/git/trees/main':
+                return self.reply(200, {'tree': [blob('x.py')], 'truncated': True})
+            if url.path == '/repos/a/two/contents/':
+                return self.reply(200, [{'path': 'x.py', 'type': 'file', 'size': 300},
+                                        {'path': 'pkg', 'type': 'dir'}])
+            if url.path == '/repos/a/two/contents/pkg':
+                return self.reply(200, [{'path': 'pkg/y.py', 'type': 'file', 'size': 300}])
+            if url.path == '/a/one/main/f2.py' and fail_f2[0]:
+                return self.reply(404, b'')
+            self.reply(200, f"# {url.path}\n{code}".encode())
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGitHub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    saved = (github_scrapper.API_URL, github_scrapper.RAW_URL, github_scrapper.client, github_scrapper.QUEUE_SIZE)
+    github_scrapper.API_URL = github_scrapper.RAW_URL = base
+    github_scrapper.client = GitHubClient(token='', max_retries=0)
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            run = lambda: github_scrapper.ScrapePipeline(
+                max_repos=10, checkpoint_file=os.path.join(root, 'checkpoint.jsonl'), download_workers=2,
+                corpus_dir=os.path.join(root, 'corpus')).run()
+            first = run()
+            done = github_scrapper.Checkpoint(os.path.join(root, 'checkpoint.jsonl'))
+            print("\nExpected: The truncated repo is listed through the contents API and finished; "
+                  "the repo with a failed download stays open")
+            print(f"Actual: {first}, done repos {sorted(done.done_repos)}, files {sorted(done.done_files)}")
+            assert first == {'repos': 2, 'saved': 3, 'skipped': 0, 'failed': 1}
+            assert done.done_repos == {'a/two'}
+            assert done.done_files == {('a/one', 'f1.py'), ('a/two', 'x.py'), ('a/two', 'pkg/y.py')}
+            done.close()
+
+            fail_f2[0] = False
+            second = run()
+            print("\nExpected: A rerun fetches only the failed file and skips the finished repo")
+            print(f"Actual: {second}, hits {hits}")
+            assert second == {'repos': 1, 'saved': 1, 'skipped': 0, 'failed': 0}
+            assert hits['/a/one/main/f1.py'] == 1 and hits['/a/one/main/f2.py'] == 2
+            assert hits['/repos/a/two/git/trees/main'] == 1
+
+            # A writer that fails with full queues must not leave the process hanging
+            class BrokenWriter(github_scrapper.ScrapePipeline):
+                def write_stage(self):
+                    time.sleep(0.5)
+                    raise RuntimeError("disk full")
+            github_scrapper.QUEUE_SIZE = 1
+            started = time.monotonic()
+            try:
+                BrokenWriter(max_repos=10, checkpoint_file=os.path.join(root, 'fresh.jsonl'), download_workers=2,
+                             corpus_dir=os.path.join(root, 'corpus')).run()
+            except RuntimeError:
+                pass
+            elapsed = time.monotonic() - started
+            print("\nExpected: A failing writer stops the pipeline promptly")
+            print(f"Actual: stopped after {elapsed:.1f}s")
+            assert elapsed < github_scrapper.STOP_TIMEOUT
+    finally:
+        github_scrapper.API_URL, github_scrapper.RAW_URL, github_scrapper.client, github_scrapper.QUEUE_SIZE = saved
+        server.shutdown()
+
+def test_corpus_store():
+    """Test content-addressed storage and deterministic manifest queries"""
+    print("\n🧪 Testing corpus store...")
+    import tempfile
+    from corpus_store import CorpusStore
+
+    with tempfile.TemporaryDirectory() as root:
+        store = CorpusStore(root)
+        shared = "def add(a, b):\n    return a + b\n"
+        first = store.put(shared, 'a/one', 'math.py', 'python', 'human', 'mit')
+        again = store.put(shared, 'b/fork', 'lib/math.py', 'python', 'human', 'mit')
+        relabeled = store.put(shared, 'gen/ai', 'math.py', 'python', 'ai')
+        other = store.put("print('hi')\n", 'a/one', 'hi.py', 'python', 'human', 'apache-2.0')
+        objects = sorted(p.name for p in store.objects.rglob('*') if p.is_file())
+        rows = store.query(language='python')
+        rows_again = store.query(language='python')
+        licensed = store.query(license=['mit', 'apache-2.0'])
+        stats = store.stats()
+        content = store.read(first)
+
+    print("\nExpected: Identical bytes are stored once however many repos and paths hold them")
+    print(f"Actual: {len(objects)} objects, stats {stats}")
+    assert first == again == relabeled and len(objects) == 2
+    assert stats == {'rows': 4, 'objects': 2, 'bytes': 3 * len(shared) + len("print('hi')\n")}
+    assert content == shared
+
+    pairs = [(row['sha'], row['label']) for row in rows]
+    print("\nExpected: Each (sha, label) once, ordered by sha, the same on every query")
+    print(f"Actual: {[(sha[:8], label) for sha, label in pairs]}")
+    assert len(pairs) == len(set(pairs)) == 3
+    assert [sha for sha, _ in pairs] == sorted(sha for sha, _ in pairs)
+    assert rows == rows_again
+    assert {row['repo'] for row in rows if row['sha'] == first and row['label'] == 'human'} == {'a/one'}
+    assert sorted(row['sha'] for row in licensed) == sorted([first, other])
+
+def test_feature_cache():
+    """Test that training features are reused until the data changes"""
+    print("\n🧪 Testing training feature cache...")
+    import tempfile
+    import pandas as pd
+    import train
+
+    df = pd.DataFrame({
+        'code': [f"def f{i}(x):\n    return x * {i}\n" for i in range(6)],
+        'label': ['ai', 'human'] * 3,
+        'language': ['python'] * 6
+    })
+    with tempfile.TemporaryDirectory() as cache_dir:
+        _, first, _ = train.build_features('python', df, cache_dir)
+        _, second, _ = train.build_features('python', df, cache_dir)
+        changed = df.assign(label=['human', 'ai'] * 3)
+        train.build_features('python', changed, cache_dir)
+        entries = sorted(os.listdir(cache_dir))
+
+    print("\nExpected: One cache entry per dataset, cached features equal fresh ones")
+    print(f"Actual: {entries}")
+    assert len(entries) == 2 and all(e.startswith('python-') for e in entries)
+    assert abs(first - second).max() < 1e-12
+
+def test_parallel_training():
+    """Test that every model family trains on the process pool within the CPU budget"""
+    print("\n🧪 Testing parallel training...")
+    import numpy as np
+    import scipy.sparse
+    from sklearn.preprocessing import LabelEncoder
+    import train
+
+    rng = np.random.RandomState(0)
+    y = np.array(['ai', 'human'] * 20)
+    X = scipy.sparse.csr_matrix(rng.rand(40, 8) + (y == 'ai')[:, None])
+    split = {'X_train': X[:30], 'X_test': X[30:], 'y_train': y[:30], 'y_test': y[30:]}
+    finished = {}
+
+    def on_done(lang, model_name, model, report):
+        finished[model_name] = list(model.predict(split['X_test'][:2]))
+
+    failures = train.train_parallel({'python': split}, {'python': LabelEncoder().fit(y)}, on_done, cpu_budget=2)
+
+    print(f"\nExpected: All of {train.MODEL_NAMES} finish without failures")
+    print(f"Actual: {sorted(finished)}, failures {failures}")
+    assert not failures and sorted(finished) == sorted(train.MODEL_NAMES)
+    assert train.job_threads('xgboost', 8) == 2 and train.job_threads('gradient_boost', 8) == 1
+
+def test_param_search():
+    """Test successive halving over cached n-gram features"""
+    print("\n🧪 Testing hyperparameter search...")
+    import numpy as np
+    import param_search
+
+    codes = [f"def helper_{i}(value):\n    return value + {i}\n" if i % 2 else
+             f"x{i}=lambda v:v*{i}\n" for i in range(60)]
+    labels = np.array(['ai' if i % 2 else 'human' for i in range(60)])
+    candidates = [c for c in param_search.candidate_grid() if c['model'] == 'logistic'][:9]
+    cache = param_search.NgramCache(codes)
+    scored = param_search.successive_halving(candidates, cache, labels, np.arange(40), np.arange(40, 60))
+
+    print("\nExpected: 9 candidates are cut to 1, which separates the classes")
+    print(f"Actual: {len(scored)} left, best score {scored[0][0]:.3f}, "
+          f"{len(cache._counts)} n-gram ranges counted")
+    assert len(scored) == 1 and scored[0][0] == 1.0
+    assert len(cache._counts) <= len({tuple(c['vectorizer']['ngram_range']) for c in candidates})
+
+def test_streaming_training():
+    """Test incremental training from a file stream"""
+    print("\n🧪 Testing streaming training...")
+    import tempfile
+    import stream_train
+
+    items = list(range(100))
+    mixed = list(stream_train.shuffled(iter(items), buffer_size=10))
+    print("\nExpected: The bounded shuffle reorders but keeps every sample")
+    print(f"Actual: first ten {mixed[:10]}")
+    assert sorted(mixed) == items and mixed != items
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as root:
+        for label, template in (('ai', "def compute_{i}(value):\n    \"\"\"Compute the result.\"\"\"\n    return value\n"),
+                                ('human', "x{i}=lambda v:v+{i} # quick hack\n")):
+            os.makedirs(os.path.join(root, 'data', 'python', label))
+            for i in range(40):
+                with open(os.path.join(root, 'data', 'python', label, f"f{i}.py"), 'w') as f:
+                    f.write(template.format(i=i))
+        os.chdir(root)
+        try:
+            vectorizer, models, seen = stream_train.train_language('python', epochs=2, batch_size=16)
+            reports = stream_train.evaluate('python', vectorizer, models)
+            stream_train.save_models('python', vectorizer, models)
+            saved = sorted(os.listdir('model/streaming/python'))
+        finally:
+            os.chdir(cwd)
+
+    print("\nExpected: Held-out files are excluded from training and every model is saved")
+    print(f"Actual: trained on {seen} of 80, saved {saved}")
+    assert 0 < seen < 80
+    assert saved == ['naive_bayes.pkl', 'sgd_logistic.pkl', 'vectorizer.pkl']
+    assert "1.00" in reports['sgd_logistic']
+
+def test_near_duplicates():
+    """Test MinHash LSH clustering, dedup and group-aware splits"""
+    print("\n🧪 Testing near-duplicate detection...")
+    import numpy as np
+    import train
+    from near_duplicates import dedupe_rows, near_duplicate_groups
+
+    base = "def search(items, target):\n" + "".join(
+        f"    if items[{i}] == target:\n        return {i}\n" for i in range(30))
+    codes = [base, "# copied\n" + base.replace("return 29", "return -1"), base]
+    codes += [f"class Shape{i}:\n    def area_{i}(self, w, h):\n        return w * h * {i} - {i * i}\n"
+              for i in range(17)]
+    labels = np.array(['ai', 'ai', 'human'] + ['ai', 'human'] * 8 + ['ai'])
+    groups = near_duplicate_groups(codes)
+
+    print("\nExpected: The three copies share a cluster and the rest stand alone")
+    print(f"Actual: {list(groups[:5])}, {len(set(groups))} clusters")
+    assert groups[0] == groups[1] == groups[2] and len(set(groups)) == 18
+    assert list(dedupe_rows(groups, labels)[:3]) == [0, 2, 3]
+
+    train_rows, test_rows = train.split_rows(labels, groups)
+    print("\nExpected: A cluster never spans the train and test rows")
+    print(f"Actual: train {sorted(train_rows)}, test {sorted(test_rows)}")
+    assert not set(groups[train_rows]) & set(groups[test_rows])
+
 if __name__ == "__main__":
     try:
         test_api_integration()
+        test_javascript_bundle_location()
+        test_batched_line_scoring()
+        test_line_memo()
+        test_analysis_cache_pruning()
+        test_file_result_cache()
+        test_pattern_scanner_equivalence()
+        test_line_adjustment_equivalence()
+        test_scan_engine()
+        test_github_listing()
+        test_archive_ingestion()
+        test_local_repo_listing()
+        test_bare_repo_listing()
+        test_sampling_planner()
+        test_file_filter()
+        test_github_client()
+        test_scrape_pipeline()
+        test_corpus_store()
+        test_feature_cache()
+        test_parallel_training()
+        test_param_search()
+        test_streaming_training()
+        test_near_duplicates()
         print("\n✅ Integration Test Passed!")
     except Exception as e:
         print(f"\n❌ Integration Test Failed: {str(e)}")
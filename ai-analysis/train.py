@@ -1,10 +1,17 @@
 import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 import joblib
+import numpy as np
 import pandas as pd
+import scipy.sparse
+import sklearn
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedGroupKFold, train_test_split
 from sklearn.metrics import classification_report
 from sklearn.ensemble import GradientBoostingClassifier
 from xgboost import XGBClassifier
@@ -36,16 +43,28 @@ LANG_CONFIGS = {
     }
 }
 
-data = []
+# Optional content-addressed corpus (see corpus_store.py). When set, files are
+# selected from its manifest instead of listed from data/<lang>/
+CORPUS_DIR = os.getenv("CORPUS_DIR")
+# Extra manifest filters, e.g. CORPUS_QUERY='{"license": ["mit", "apache-2.0"]}'
+CORPUS_QUERY = json.loads(os.getenv("CORPUS_QUERY", "{}"))
+
+# Fitted vectorizers and their sparse matrices, reused while the data and config are unchanged
+FEATURE_CACHE_DIR = os.getenv("FEATURE_CACHE_DIR", "cache/features")
+
+# Estimated Jaccard similarity of token shingles above which files are near-duplicates
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.7"))
+# Keep one file per near-duplicate cluster and label (DEDUP=0 keeps them all)
+DEDUP = os.getenv("DEDUP", "1") != "0"
 
 # Function to load code files for a specific language
 def load_code_files(ai_folder, human_folder, extension):
     language_data = []
-    
+
     # Load AI code files
     ai_path = os.path.join(ai_folder)
     if os.path.exists(ai_path):
-        for filename in os.listdir(ai_path):
+        for filename in sorted(os.listdir(ai_path)):
             if filename.endswith(extension):
                 with open(os.path.join(ai_path, filename), "r", encoding="utf-8", errors="ignore") as f:
                     language_data.append({
@@ -53,11 +72,11 @@ def load_code_files(ai_folder, human_folder, extension):
                         "label": "ai",
                         "language": [k for k, v in LANGUAGES.items() if v == extension][0]  # Get language key from extension
                     })
-    
+
     # Load Human code files
     human_path = os.path.join(human_folder)
     if os.path.exists(human_path):
-        for filename in os.listdir(human_path):
+        for filename in sorted(os.listdir(human_path)):
             if filename.endswith(extension):
                 with open(os.path.join(human_path, filename), "r", encoding="utf-8", errors="ignore") as f:
                     language_data.append({
@@ -65,164 +84,321 @@ def load_code_files(ai_folder, human_folder, extension):
                         "label": "human",
                         "language": [k for k, v in LANGUAGES.items() if v == extension][0]  # Get language key from extension
                     })
-    
+
     return language_data
 
+# Function to load a language's files selected from the corpus manifest
+def load_from_manifest(store, lang, **filters):
+    return [
+        {"code": store.read(row["sha"]), "label": row["label"], "language": lang}
+        for row in store.query(language=lang, **filters)
+    ]
+
 # Load all supported languages
-for lang, ext in LANGUAGES.items():
-    # Handle both lowercase and uppercase directory names
-    if os.path.exists(f"data/{lang}/AI"):
-        ai_folder = f"data/{lang}/AI"
-    else:
-        ai_folder = f"data/{lang}/ai"
-        
-    if os.path.exists(f"data/{lang}/Human"):
-        human_folder = f"data/{lang}/Human"
-    else:
-        human_folder = f"data/{lang}/human"
-    data.extend(load_code_files(ai_folder, human_folder, ext))
-
-print(f"Total samples loaded: {len(data)}")
-for lang in LANGUAGES.keys():
-    lang_count = sum(1 for item in data if item['language'] == lang)
-    print(f"{lang.capitalize()} files: {lang_count}")
-
-# Convert to DataFrame
-df = pd.DataFrame(data)
+def load_corpus():
+    data = []
+    if CORPUS_DIR:
+        from corpus_store import CorpusStore
+        store = CorpusStore(CORPUS_DIR)
+
+    for lang, ext in LANGUAGES.items():
+        if CORPUS_DIR:
+            data.extend(load_from_manifest(store, lang, **CORPUS_QUERY))
+            continue
+
+        # Handle both lowercase and uppercase directory names
+        if os.path.exists(f"data/{lang}/AI"):
+            ai_folder = f"data/{lang}/AI"
+        else:
+            ai_folder = f"data/{lang}/ai"
+
+        if os.path.exists(f"data/{lang}/Human"):
+            human_folder = f"data/{lang}/Human"
+        else:
+            human_folder = f"data/{lang}/human"
+        data.extend(load_code_files(ai_folder, human_folder, ext))
+
+    print(f"Total samples loaded: {len(data)}")
+    for lang in LANGUAGES.keys():
+        lang_count = sum(1 for item in data if item['language'] == lang)
+        print(f"{lang.capitalize()} files: {lang_count}")
+
+    # Convert to DataFrame
+    return pd.DataFrame(data)
+
+# Tag each sample with its near-duplicate cluster, and drop same-label near-duplicates
+def index_near_duplicates(df, threshold=NEAR_DUP_THRESHOLD, dedup=DEDUP):
+    from near_duplicates import dedupe_rows, near_duplicate_groups
+
+    if df.empty:
+        return df.assign(group=[])
+    parts = []
+    for lang in LANGUAGES.keys():
+        lang_df = df[df['language'] == lang]
+        if lang_df.empty:
+            continue
+        groups = near_duplicate_groups(list(lang_df['code']), threshold=threshold)
+        lang_df = lang_df.assign(group=[f"{lang}:{group}" for group in groups])
+        clusters = len(set(groups))
+        if dedup:
+            lang_df = lang_df.iloc[dedupe_rows(lang_df['group'], lang_df['label'])]
+        print(f"🧬 {lang.capitalize()}: {clusters} clusters, {len(lang_df)} samples kept")
+        parts.append(lang_df)
+    return pd.concat(parts, ignore_index=True)
+
+# Create a vectorizer with language-specific settings
+def make_vectorizer(config):
+    return TfidfVectorizer(
+        analyzer=config['analyzer'],
+        ngram_range=config['ngram_range'],
+        max_features=config['max_features'],
+        token_pattern=r'(?u)\b\w+\b',  # Standard word tokenization
+        strip_accents='unicode',
+        lowercase=True  # Case-insensitive for all languages
+    )
+
+# Cache key: the exact samples in order, the vectorizer settings and the sklearn version
+def feature_cache_key(lang, lang_df):
+    digest = hashlib.sha256()
+    for code, label in zip(lang_df["code"], lang_df["label"]):
+        digest.update(hashlib.sha256(code.encode("utf-8")).digest())
+        digest.update(label.encode("utf-8"))
+    settings = {
+        "language": lang,
+        "config": LANG_CONFIGS[lang],
+        "vectorizer": make_vectorizer(LANG_CONFIGS[lang]).get_params(),
+        "sklearn": sklearn.__version__,
+        "samples": digest.hexdigest()
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+# Fit the vectorizer and transform a language's code, or load both from the feature cache
+def build_features(lang, lang_df, cache_dir=FEATURE_CACHE_DIR):
+    entry = os.path.join(cache_dir, f"{lang}-{feature_cache_key(lang, lang_df)}")
+    if os.path.exists(os.path.join(entry, "X.npz")):
+        print(f"♻️ Reusing cached {lang} features from {entry}")
+        vectorizer = joblib.load(os.path.join(entry, "vectorizer.pkl"))
+        X_lang = scipy.sparse.load_npz(os.path.join(entry, "X.npz"))
+        return vectorizer, X_lang, lang_df["label"]
+
+    print(f"🔤 Extracting {lang} features...")
+    vectorizer = make_vectorizer(LANG_CONFIGS[lang])
+    X_lang = vectorizer.fit_transform(lang_df["code"])
+
+    # X.npz is written last and marks the entry complete
+    os.makedirs(entry, exist_ok=True)
+    joblib.dump(vectorizer, os.path.join(entry, "vectorizer.pkl"))
+    scipy.sparse.save_npz(os.path.join(entry, "X.partial.npz"), X_lang.tocsr())
+    os.replace(os.path.join(entry, "X.partial.npz"), os.path.join(entry, "X.npz"))
+    return vectorizer, X_lang, lang_df["label"]
 
 # Create separate vectorizers for each language
-vectorizers = {}
-for lang in LANGUAGES.keys():
-    lang_df = df[df['language'] == lang]
-    if not lang_df.empty:
-        # Get language-specific configuration
-        config = LANG_CONFIGS[lang]
-        
-        # Create vectorizer with language-specific settings
-        vectorizer = TfidfVectorizer(
-            analyzer=config['analyzer'],
-            ngram_range=config['ngram_range'],
-            max_features=config['max_features'],
-            token_pattern=r'(?u)\b\w+\b',  # Standard word tokenization
-            strip_accents='unicode',
-            lowercase=True  # Case-insensitive for all languages
-        )
-        
-        # Fit and store vectorizer
-        X_lang = vectorizer.fit_transform(lang_df["code"])
-        vectorizers[lang] = {
-            'vectorizer': vectorizer,
-            'X': X_lang,
-            'y': lang_df["label"]
-        }
+def build_all_features(df):
+    vectorizers = {}
+    for lang in LANGUAGES.keys():
+        lang_df = df[df['language'] == lang] if not df.empty else df
+        if not lang_df.empty:
+            vectorizer, X_lang, y_lang = build_features(lang, lang_df)
+            vectorizers[lang] = {
+                'vectorizer': vectorizer,
+                'X': X_lang,
+                'y': y_lang,
+                'groups': lang_df['group'].values if 'group' in lang_df else None
+            }
+    return vectorizers
+
+# Row positions for a train/test split; with groups, each near-duplicate cluster stays on one side
+def split_rows(labels, groups=None, test_size=0.2, random_state=42):
+    rows = np.arange(len(labels))
+    if groups is None:
+        return train_test_split(rows, test_size=test_size, random_state=random_state)
+    splitter = StratifiedGroupKFold(n_splits=round(1 / test_size), shuffle=True, random_state=random_state)
+    train_rows, test_rows = next(splitter.split(rows, labels, groups))
+    return train_rows, test_rows
 
 # Train/test split for each language
-splits = {}
-for lang, data in vectorizers.items():
-    X_train, X_test, y_train, y_test = train_test_split(
-        data['X'], data['y'], 
-        test_size=0.2, 
-        random_state=42
-    )
-    splits[lang] = {
-        'X_train': X_train,
-        'X_test': X_test,
-        'y_train': y_train,
-        'y_test': y_test
+def split_features(vectorizers):
+    splits = {}
+    for lang, data in vectorizers.items():
+        y = np.asarray(data['y'])
+        train_rows, test_rows = split_rows(y, data['groups'])
+        splits[lang] = {
+            'X_train': data['X'][train_rows],
+            'X_test': data['X'][test_rows],
+            'y_train': y[train_rows],
+            'y_test': y[test_rows]
+        }
+    return splits
+
+# Model families, in the order they are reported and saved
+MODEL_NAMES = ['logistic', 'random_forest', 'gradient_boost', 'xgboost']
+MODEL_TITLES = {
+    'logistic': "📊 Logistic Regression",
+    'random_forest': "🌲 Random Forest",
+    'gradient_boost': "🔥 Gradient Boosting",
+    'xgboost': "⚡ XGBoost"
+}
+# Names of the legacy single-language bundle in model/
+LEGACY_FILES = {
+    'logistic': "logistic.pkl",
+    'random_forest': "randomforest.pkl",
+    'gradient_boost': "gradientboost.pkl",
+    'xgboost': "xgboost.pkl"
+}
+# Rough relative training cost, used to start the slowest jobs first
+MODEL_COSTS = {'logistic': 1, 'random_forest': 4, 'gradient_boost': 8, 'xgboost': 6}
+# Families whose fit can use more than one thread
+MULTITHREADED_MODELS = {'random_forest', 'xgboost'}
+
+# CPUs the training jobs may use between them
+TRAIN_CPUS = int(os.getenv("TRAIN_CPUS", "0")) or os.cpu_count() or 1
+
+# Model settings used by a normal training run
+MODEL_CLASSES = {
+    'logistic': LogisticRegression,
+    'random_forest': RandomForestClassifier,
+    'gradient_boost': GradientBoostingClassifier,
+    'xgboost': XGBClassifier
+}
+MODEL_PARAMS = {
+    'logistic': {'max_iter': 2000},
+    'random_forest': {'n_estimators': 200, 'random_state': 42},
+    'gradient_boost': {'n_estimators': 200, 'learning_rate': 0.1, 'random_state': 42},
+    'xgboost': {
+        'n_estimators': 300,
+        'learning_rate': 0.1,
+        'max_depth': 6,
+        'subsample': 0.8,
+        'colsample_bytree': 0.8,
+        'random_state': 42,
+        'use_label_encoder': False,
+        'eval_metric': "logloss"
     }
+}
+
+def make_model(model_name, threads=1, **params):
+    """A model with the default settings, overridden by params"""
+    if model_name not in MODEL_CLASSES:
+        raise ValueError(f"Unknown model: {model_name}")
+    settings = dict(MODEL_PARAMS[model_name])
+    if model_name in MULTITHREADED_MODELS:
+        settings['n_jobs'] = threads
+    settings.update(params)
+    return MODEL_CLASSES[model_name](**settings)
+
+def job_threads(model_name, cpu_budget):
+    """Threads for one job: single-threaded families get one, the others a share of the budget"""
+    if model_name not in MULTITHREADED_MODELS:
+        return 1
+    return max(1, cpu_budget // 4)
+
+# Fit one model and report on the held-out split; runs in a worker process
+def fit_model(lang, model_name, split, le, threads=1):
+    from threadpoolctl import threadpool_limits
 
-# Train models for each language
-models = {}
-for lang in LANGUAGES.keys():
-    if lang not in splits:
-        print(f"\nSkipping {lang} - no data found")
-        continue
-        
-    print(f"\n=== Training models for {lang.upper()} ===")
-    split = splits[lang]
     X_train, X_test = split['X_train'], split['X_test']
     y_train, y_test = split['y_train'], split['y_test']
-    
-    # Label encoding for XGBoost
-    le = LabelEncoder()
-    y_train_enc = le.fit_transform(y_train)
-    y_test_enc = le.transform(y_test)
-    
-    lang_models = {}
-    
-    # --- Logistic Regression ---
-    print(f"\n📊 Training Logistic Regression for {lang}...")
-    log_model = LogisticRegression(max_iter=2000)
-    log_model.fit(X_train, y_train)
-    y_pred_log = log_model.predict(X_test)
-    print(classification_report(y_test, y_pred_log))
-    lang_models['logistic'] = log_model
-    
-    # --- Random Forest ---
-    print(f"\n🌲 Training Random Forest for {lang}...")
-    rf_model = RandomForestClassifier(n_estimators=200, random_state=42, n_jobs=-1)
-    rf_model.fit(X_train, y_train)
-    y_pred_rf = rf_model.predict(X_test)
-    print(classification_report(y_test, y_pred_rf))
-    lang_models['random_forest'] = rf_model
-    
-    # --- Gradient Boosting ---
-    print(f"\n🔥 Training Gradient Boosting for {lang}...")
-    gb_model = GradientBoostingClassifier(n_estimators=200, learning_rate=0.1, random_state=42)
-    gb_model.fit(X_train, y_train)
-    y_pred_gb = gb_model.predict(X_test)
-    print(classification_report(y_test, y_pred_gb))
-    lang_models['gradient_boost'] = gb_model
-    
-    # --- XGBoost ---
-    print(f"\n⚡ Training XGBoost for {lang}...")
-    xgb_model = XGBClassifier(
-        n_estimators=300,
-        learning_rate=0.1,
-        max_depth=6,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        random_state=42,
-        use_label_encoder=False,
-        eval_metric="logloss"
-    )
-    xgb_model.fit(X_train, y_train_enc)
-    y_pred_xgb = xgb_model.predict(X_test)
-    print(classification_report(y_test_enc, y_pred_xgb, target_names=le.classes_))
-    lang_models['xgboost'] = xgb_model
-    
-    # Store models and vectorizer for this language
-    models[lang] = {
-        'vectorizer': vectorizers[lang]['vectorizer'],
-        'models': lang_models,
-        'label_encoder': le
-    }
-    
-# Save models and vectorizers for each language
-print("\n💾 Saving models and vectorizers...")
-for lang, model_data in models.items():
+    model = make_model(model_name, threads)
+    # Keep BLAS/OpenMP pools inside the job's share of the CPU budget
+    with threadpool_limits(limits=threads):
+        if model_name == 'xgboost':
+            # XGBoost needs label-encoded targets
+            model.fit(X_train, le.transform(y_train))
+            report = classification_report(le.transform(y_test), model.predict(X_test), target_names=le.classes_)
+        else:
+            model.fit(X_train, y_train)
+            report = classification_report(y_test, model.predict(X_test))
+    return model, report
+
+def train_parallel(splits, label_encoders, on_done, cpu_budget=TRAIN_CPUS):
+    """Train every (language, model) job on a process pool without exceeding cpu_budget threads
+
+    Jobs start slowest first, as soon as enough of the budget is free.
+    on_done(lang, model_name, model, report) is called in this process as
+    each job finishes. Returns the jobs that failed, with their errors.
+    """
+    jobs = [(lang, name) for lang in splits for name in MODEL_NAMES]
+    jobs.sort(key=lambda job: MODEL_COSTS[job[1]] * splits[job[0]]['X_train'].shape[0], reverse=True)
+
+    failures = []
+    pending = {}
+    free = cpu_budget
+    pool = ProcessPoolExecutor(max_workers=min(cpu_budget, len(jobs)) or 1,
+                               mp_context=multiprocessing.get_context('spawn'))
+    try:
+        while jobs or pending:
+            # Start every job that fits, or at least one when nothing is running
+            for job in list(jobs):
+                threads = min(job_threads(job[1], cpu_budget), cpu_budget)
+                if threads <= free or not pending:
+                    lang, name = job
+                    future = pool.submit(fit_model, lang, name, splits[lang], label_encoders[lang], threads)
+                    pending[future] = (lang, name, threads)
+                    free -= threads
+                    jobs.remove(job)
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                lang, name, threads = pending.pop(future)
+                free += threads
+                try:
+                    model, report = future.result()
+                except Exception as e:
+                    print(f"\n❌ {MODEL_TITLES[name]} for {lang} failed: {e}")
+                    failures.append((lang, name, str(e)))
+                    continue
+                on_done(lang, name, model, report)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return failures
+
+# Save a language's vectorizer and label encoder; models are saved as they finish
+def save_language(lang, vectorizer, le, legacy=False):
     lang_dir = f"model/{lang}"
     os.makedirs(lang_dir, exist_ok=True)
-    
-    # Save vectorizer
-    joblib.dump(model_data['vectorizer'], f"{lang_dir}/vectorizer.pkl")
-    
-    # Save each model
-    for model_name, model in model_data['models'].items():
-        joblib.dump(model, f"{lang_dir}/{model_name}.pkl")
-    
-    # Save label encoder
-    joblib.dump(model_data['label_encoder'], f"{lang_dir}/label_encoder.pkl")
-    
-print("✅ Training complete! Models saved.")
-
-
-# Save both models + vectorizer
-os.makedirs("model", exist_ok=True)
-joblib.dump(log_model, "model/logistic.pkl")
-joblib.dump(rf_model, "model/randomforest.pkl")
-joblib.dump(gb_model, "model/gradientboost.pkl")
-joblib.dump(vectorizer, "model/vectorizer.pkl")
-joblib.dump(xgb_model, "model/xgboost.pkl")
-
-print("✅ Model and vectorizer saved in 'model/' folder")
+    joblib.dump(vectorizer, f"{lang_dir}/vectorizer.pkl")
+    joblib.dump(le, f"{lang_dir}/label_encoder.pkl")
+    if legacy:
+        joblib.dump(vectorizer, "model/vectorizer.pkl")
+
+def save_model(lang, model_name, model, legacy=False):
+    joblib.dump(model, f"model/{lang}/{model_name}.pkl")
+    # The last language's models + vectorizer also form the legacy bundle in model/
+    if legacy:
+        joblib.dump(model, f"model/{LEGACY_FILES[model_name]}")
+
+def main():
+    df = index_near_duplicates(load_corpus())
+    vectorizers = build_all_features(df)
+    splits = split_features(vectorizers)
+
+    for lang in LANGUAGES.keys():
+        if lang not in splits:
+            print(f"\nSkipping {lang} - no data found")
+    if not splits:
+        return
+    legacy_lang = list(splits)[-1]
+
+    print("\n💾 Saving vectorizers...")
+    label_encoders = {}
+    for lang in splits:
+        # Label encoding for XGBoost
+        label_encoders[lang] = LabelEncoder().fit(splits[lang]['y_train'])
+        save_language(lang, vectorizers[lang]['vectorizer'], label_encoders[lang], legacy=lang == legacy_lang)
+
+    def on_done(lang, model_name, model, report):
+        print(f"\n{MODEL_TITLES[model_name]} for {lang}:")
+        print(report)
+        save_model(lang, model_name, model, legacy=lang == legacy_lang)
+        print(f"💾 Saved model/{lang}/{model_name}.pkl")
+
+    print(f"\n=== Training {len(splits) * len(MODEL_NAMES)} models on {TRAIN_CPUS} CPUs ===")
+    failures = train_parallel(splits, label_encoders, on_done)
+    if failures:
+        raise SystemExit(f"❌ {len(failures)} training jobs failed")
+
+    print("✅ Training complete! Models saved.")
+    print("✅ Model and vectorizer saved in 'model/' folder")
+
+if __name__ == "__main__":
+    main()
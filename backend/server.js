@@ -1017,7 +1017,7 @@ app.post('/api/interview/code-result', async (req, res) => {
                 const analysisResponse = await fetch('http://localhost:5001/analyze', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ code })
+                    body: JSON.stringify({ code, depth: 'characteristics' })
                 });
 
                 if (analysisResponse.ok) {